@@ -1,6 +1,6 @@
 import dash
 import dash_bootstrap_components as dbc
-from dash import dcc, html, callback
+from dash import dcc, html, callback, ctx
 from dash.dependencies import Input, Output, State
 from page_1 import page_1
 from order_page import order_page
@@ -10,11 +10,9 @@ from sidebar import sidebar, SIDEBAR_HIDDEN, SIDEBAR_STYLE
 from dash.dependencies import Input, Output
 from dash.exceptions import PreventUpdate
 from interactive_trader import *
-from datetime import datetime
 from ibapi.contract import Contract
 from ibapi.order import Order
-import time
-import threading
+import os
 import pandas as pd
 
 CONTENT_STYLE = {
@@ -33,11 +31,18 @@ CONTENT_STYLE1 = {
     "background-color": "#f8f9fa",
 }
 
-order_status = ""
-errors = ""
-connected = ""
-
-ibkr_async_conn = ibkr_app()
+# Order events and errors are journaled to ITA_JOURNAL_PATH and the ones of
+# earlier runs are put back on startup, so the blotter survives a restart.
+ibkr_journal = order_journal(
+    os.getenv('ITA_JOURNAL_PATH', 'ita_journal.sqlite')
+)
+# In memory, the session keeps only the newest MAX_SESSION_ROWS of each table
+# and one of each repeated informational error; the journal has the rest.
+MAX_SESSION_ROWS = 100000
+ibkr_async_conn = ibkr_app(journal=ibkr_journal, max_rows=MAX_SESSION_ROWS)
+ibkr_journal.replay(ibkr_async_conn)
+ibkr_connection = connection_supervisor(ibkr_async_conn)
+ibkr_async_tables = ibkr_tables(ibkr_async_conn, max_rows=MAX_SESSION_ROWS)
 
 app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
 server = app.server
@@ -51,43 +56,71 @@ app.layout = html.Div(
         html.Div(id="page-content", style=CONTENT_STYLE),
         dcc.Interval(
             id='ibkr-update-interval',
-            interval=5000,
+            interval=1000,
             n_intervals=0
         )
     ],
 )
 
 
-@callback(
-    [Output('trade-blotter', 'data'), Output('trade-blotter', 'columns')],
-    Input('ibkr-update-interval', 'n_intervals')
-)
-def update_order_status(n_intervals):
-    global ibkr_async_conn
-    global order_status
-
-    order_status = ibkr_async_conn.order_status
-
-    df = order_status
-    dt_data = df.to_dict('records')
-    dt_columns = [{"name": i, "id": i} for i in df.columns]
-    return dt_data, dt_columns
+# The tables only get the page they show, read from ibkr_tables' SQLite copy
+# of the order status and error messages. The interval tick first copies
+# over what changed since the last tick; a page is only sent again when its
+# table changed since it was read (the sequence in its dcc.Store) or when
+# the user pages, sorts or filters.
+def table_page(name, sequence, sync, page_current, page_size, sort_by,
+               filter_query):
+    if ctx.triggered_id == 'ibkr-update-interval' and sync is not None and \
+            sync['sequence'] == sequence:
+        raise PreventUpdate
+    data, page_count = ibkr_async_tables.store.page(
+        name, page_current, page_size, sort_by, filter_query
+    )
+    return data, page_count, {'sequence': sequence}
 
 
 @callback(
-    [Output('errors-dt', 'data'), Output('errors-dt', 'columns')],
-    Input('ibkr-update-interval', 'n_intervals')
+    [
+        Output('trade-blotter', 'data'),
+        Output('trade-blotter', 'page_count'),
+        Output('trade-blotter-sync', 'data')
+    ],
+    [
+        Input('ibkr-update-interval', 'n_intervals'),
+        Input('trade-blotter', 'page_current'),
+        Input('trade-blotter', 'page_size'),
+        Input('trade-blotter', 'sort_by'),
+        Input('trade-blotter', 'filter_query')
+    ],
+    State('trade-blotter-sync', 'data')
 )
-def update_order_status(n_intervals):
-    global ibkr_async_conn
-    global errors
+def update_order_status(n_intervals, page_current, page_size, sort_by,
+                        filter_query, sync):
+    sequence, _ = ibkr_async_tables.refresh()
+    return table_page('order_status', sequence, sync, page_current,
+                      page_size, sort_by, filter_query)
 
-    errors = ibkr_async_conn.error_messages
 
-    df = errors
-    dt_data = df.to_dict('records')
-    dt_columns = [{"name": i, "id": i} for i in df.columns]
-    return dt_data, dt_columns
+@callback(
+    [
+        Output('errors-dt', 'data'),
+        Output('errors-dt', 'page_count'),
+        Output('errors-dt-sync', 'data')
+    ],
+    [
+        Input('ibkr-update-interval', 'n_intervals'),
+        Input('errors-dt', 'page_current'),
+        Input('errors-dt', 'page_size'),
+        Input('errors-dt', 'sort_by'),
+        Input('errors-dt', 'filter_query')
+    ],
+    State('errors-dt-sync', 'data')
+)
+def update_errors(n_intervals, page_current, page_size, sort_by,
+                  filter_query, sync):
+    _, count = ibkr_async_tables.refresh()
+    return table_page('error_messages', count, sync, page_current,
+                      page_size, sort_by, filter_query)
 
 
 @callback(
@@ -151,55 +184,28 @@ def render_page_content(pathname):
     )
 
 
+# Connecting happens on connection_supervisor's thread: the callback only
+# hands over the sidebar's settings and shows the supervisor's status, which
+# the interval picks up once the handshake is done.
 @callback(
     Output('ibkr-async-conn-status', 'children'),
     [
-        Input('ibkr-async-conn-status', 'children'),
+        Input('ibkr-update-interval', 'n_intervals'),
         Input('master-client-id', 'value'),
         Input('port', 'value'),
         Input('hostname', 'value')
-    ]
+    ],
+    State('ibkr-async-conn-status', 'children')
 )
-def async_handler(async_status, master_client_id, port, hostname):
-    if async_status == "CONNECTED":
-        raise PreventUpdate
-        pass
-
-    global ibkr_async_conn
-    ibkr_async_conn.connect(hostname, port, master_client_id)
-
-    timeout_sec = 5
-
-    start_time = datetime.now()
-    while not ibkr_async_conn.isConnected():
-        time.sleep(0.01)
-        if (datetime.now() - start_time).seconds > timeout_sec:
-            ibkr_async_conn.disconnect()
-            raise Exception(
-                "set_up_async_connection",
-                "timeout",
-                "couldn't connect to IBKR"
-            )
+def async_handler(n_intervals, master_client_id, port, hostname,
+                  async_status):
+    if ctx.triggered_id != 'ibkr-update-interval' and \
+            None not in (master_client_id, port) and hostname:
+        ibkr_connection.connect(hostname, port, master_client_id)
 
-    def run_loop():
-        ibkr_async_conn.run()
-
-    api_thread = threading.Thread(target=run_loop, daemon=True)
-    api_thread.start()
-
-    while ibkr_async_conn.next_valid_id is None:
-        time.sleep(0.01)
-
-    global order_status
-    order_status = ibkr_async_conn.order_status
-
-    global errors
-    errors = ibkr_async_conn.error_messages
-
-    global connected
-    connected = ibkr_async_conn.isConnected()
-
-    return str(connected)
+    if ibkr_connection.status == async_status:
+        raise PreventUpdate
+    return ibkr_connection.status
 
 
 @callback(
@@ -243,14 +249,15 @@ def place_order(n_clicks, contract_symbol, contract_sec_type,
     if order_account:
         order.account = order_account
 
-    ibkr_async_conn.reqIds(1)
+    # Without a connection there is no order id to place the order with:
+    # say so in the sidebar, as async_handler shows the connection status.
+    try:
+        order_id = ibkr_async_conn.next_request_id()
+    except Exception:
+        return f"Order not placed: not connected ({ibkr_connection.status})"
 
     # Place orders!
-    ibkr_async_conn.placeOrder(
-        ibkr_async_conn.next_valid_id,
-        contract,
-        order
-    )
+    ibkr_async_conn.placeOrder(order_id, contract, order)
 
     return ''
 
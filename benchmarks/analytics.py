@@ -0,0 +1,65 @@
+# The blotter numbers of get_stats computed with a boolean mask per count and
+# per symbol (calculate_gain_loss) against analytics' single pass, on a
+# blotter DataFrame and on the arrays of a trade_blotter, and the whole tear
+# sheet, on blotters of up to about three million orders (one backtest
+# repeated, like the blotters of a sweep put end to end). Fails if the tear
+# sheet of the largest blotter is not faster than the masks.
+#
+#   python -m benchmarks.analytics
+
+import time
+import numpy as np
+import pandas as pd
+from final_project import backtest_trades, calculate_gain_loss
+from final_project.analytics import TOTAL_COLUMNS, blotter_arrays, \
+    order_counts, symbol_totals, tear_sheet
+from benchmarks.data import make_data
+
+
+def mask_stats(blotter):
+    exits = blotter[blotter['Trip'] == 'EXIT']
+    return (((blotter['Trip'] == 'ENTRY') &
+             (blotter['Status'] == 'FILLED')).sum(),
+            (exits['Status'] == 'FILLED').sum(),
+            (exits['Status'] == 'CANCELED').sum(),
+            (exits['Status'] == 'FORCED').sum(),
+            calculate_gain_loss('AMZN', blotter, []),
+            calculate_gain_loss('WMT', blotter, []))
+
+
+def frame_stats(blotter):
+    arrays, symbols = blotter_arrays(blotter, TOTAL_COLUMNS)
+    return order_counts(arrays), symbol_totals(arrays, symbols)
+
+
+def array_stats(arrays, symbols):
+    return order_counts(arrays), symbol_totals(arrays, symbols)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    hist = make_data(5200)
+    trades = backtest_trades(hist)
+    blotter = trades.to_frame()
+    arrays, symbols = blotter_arrays(trades)
+    print(f"{'orders':>8} {'masks s':>8} {'frame s':>8} {'arrays s':>9} "
+          f"{'tear sheet s':>13}")
+    for copies in (1, 10, 100, 1000):
+        stacked = pd.concat([blotter] * copies, ignore_index=True)
+        stacked_arrays = {column: np.tile(values, copies)
+                          for column, values in arrays.items()}
+        mask_seconds = timed(mask_stats, stacked)
+        tear_sheet_seconds = timed(tear_sheet, stacked, hist)
+        print(f"{len(stacked):>8} {mask_seconds:>8.3f} "
+              f"{timed(frame_stats, stacked):>8.3f} "
+              f"{timed(array_stats, stacked_arrays, symbols):>9.3f} "
+              f"{tear_sheet_seconds:>13.3f}")
+    # On the largest blotter the whole tear sheet has to take less time than
+    # the mask counts alone.
+    assert tear_sheet_seconds < mask_seconds, \
+        f'tear sheet {tear_sheet_seconds:.3f} s, masks {mask_seconds:.3f} s'
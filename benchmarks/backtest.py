@@ -0,0 +1,27 @@
+# run_backtest against the row-by-row run_backtest_iterrows on synthetic
+# daily prices (about 20 years of business days at the largest size). Both
+# must give the same blotter; the speed-up should be well over 100x.
+#
+#   python -m benchmarks.backtest
+
+import time
+import pandas as pd
+from benchmarks.data import make_data
+from final_project import run_backtest, run_backtest_iterrows
+
+
+def time_backtest(backtest, hist):
+    start = time.perf_counter()
+    blotter = backtest(hist)
+    return time.perf_counter() - start, blotter
+
+
+if __name__ == '__main__':
+    print(f"{'days':>6} {'run_backtest s':>15} {'iterrows s':>11} "
+          f"{'speed-up':>9}")
+    for days in (1300, 2600, 5200):
+        hist = make_data(days)
+        fast, blotter = time_backtest(run_backtest, hist)
+        slow, expected = time_backtest(run_backtest_iterrows, hist)
+        pd.testing.assert_frame_equal(blotter, expected)
+        print(f"{days:>6} {fast:>15.3f} {slow:>11.2f} {slow / fast:>8.0f}x")
@@ -0,0 +1,25 @@
+# Synthetic market data for the benchmarks (and the tests).
+
+import numpy as np
+import pandas as pd
+from final_project import prepare_data
+
+
+# Random-walk prices for AMZN and WMT, newest first like data.csv.
+def make_data(days, seed=0, period=3):
+    random = np.random.default_rng(seed)
+    dates = pd.bdate_range('2005-01-03', periods=days, name='Date')
+    hist = pd.DataFrame(index=dates)
+    for prefix, start in (('amzn', 100.0), ('wmt', 50.0)):
+        close = start * np.exp(np.cumsum(random.normal(0, 0.03, days)))
+        open_ = close * np.exp(random.normal(0, 0.01, days))
+        spread = np.abs(random.normal(0, 0.05, days))
+        hist[f'{prefix}_Open'] = open_
+        hist[f'{prefix}_High'] = np.maximum(open_, close) * (1 + spread)
+        hist[f'{prefix}_Low'] = np.minimum(open_, close) * (1 - spread)
+        hist[f'{prefix}_Close'] = close
+        hist[f'{prefix}_Volume'] = random.integers(1000, 100000, days)
+    risk_free_hist = pd.DataFrame(
+        {'interest_rate': random.uniform(0, 5, days)}, index=dates
+    )
+    return prepare_data(hist.iloc[::-1], risk_free_hist, period)
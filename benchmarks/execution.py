@@ -0,0 +1,48 @@
+# backtest_trades with the naive execution (the rules' own prices, no costs)
+# against realistic_execution with daily bars and with minute bars, on
+# synthetic daily prices. Realistic fills should cost no more than 2-3x the
+# naive backtest.
+#
+#   python -m benchmarks.execution
+
+import time
+import numpy as np
+import pandas as pd
+from final_project import backtest_trades
+from final_project.execution import realistic_execution
+from benchmarks.data import make_data
+
+
+# 390 one-minute bars a day around each day's open and close.
+def make_minute_bars(hist, symbol):
+    prefix = symbol.lower()
+    minutes = np.arange(390)
+    dates = (hist.index.to_numpy()[:, None] + np.timedelta64(570, 'm')
+             + minutes * np.timedelta64(1, 'm')).ravel()
+    path = np.linspace(hist[f'{prefix}_Open'], hist[f'{prefix}_Close'],
+                       390, axis=1).ravel()
+    return pd.DataFrame({'date': dates, 'open': path, 'high': path * 1.001,
+                         'low': path * 0.999,
+                         'volume': np.repeat(hist[f'{prefix}_Volume']
+                                             .to_numpy() / 390, 390)})
+
+
+def timed(hist, execution, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        backtest_trades(hist, execution=execution)
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    print(f"{'days':>6} {'naive s':>8} {'daily s':>8} {'minute s':>9} "
+          f"{'daily x':>8} {'minute x':>9}")
+    for days in (1300, 2600, 5200):
+        hist = make_data(days)
+        bars = {symbol: make_minute_bars(hist, symbol)
+                for symbol in ('AMZN', 'WMT')}
+        naive = timed(hist, None)
+        daily = timed(hist, realistic_execution())
+        minute = timed(hist, realistic_execution(intraday_bars=bars))
+        print(f"{days:>6} {naive:>8.3f} {daily:>8.3f} {minute:>9.3f} "
+              f"{daily / naive:>7.1f}x {minute / naive:>8.1f}x")
@@ -0,0 +1,56 @@
+# Per-bar cost of ibkr_app.historicalData as a history request grows.
+# Feeds synthetic bars straight into the callback (no TWS needed) and prints
+# the average time per bar; with row buffers it should stay flat from 1k to
+# 100k bars. The old pd.concat-per-bar version is timed for comparison at
+# the sizes where it still finishes in reasonable time.
+#
+#   python -m benchmarks.historical_data_callbacks
+
+import time
+import pandas as pd
+from ibapi.common import BarData
+from interactive_trader import ibkr_app
+
+
+def make_bars(n):
+    bars = []
+    for i in range(n):
+        bar = BarData()
+        bar.date = str(20200101 + i)
+        bar.open, bar.high, bar.low, bar.close = 1.0, 1.1, 0.9, 1.05
+        bar.volume, bar.barCount, bar.average = 100, 10, 1.02
+        bars.append(bar)
+    return bars
+
+
+def time_row_buffer(bars):
+    app = ibkr_app()
+    start = time.perf_counter()
+    for bar in bars:
+        app.historicalData(1, bar)
+    # Bars are handed over per request once its end message arrives.
+    app.historicalDataEnd(1, '', '')
+    frame = app.historical_data
+    elapsed = time.perf_counter() - start
+    assert len(frame) == len(bars)
+    return elapsed
+
+
+def time_concat(bars):
+    frame = pd.DataFrame(columns=['date', 'open', 'high', 'low', 'close'])
+    start = time.perf_counter()
+    for bar in bars:
+        frame = pd.concat([frame, pd.DataFrame({
+            'date': [bar.date], 'open': [bar.open], 'high': [bar.high],
+            'low': [bar.low], 'close': [bar.close]
+        })], ignore_index=True)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    print(f"{'bars':>8} {'row_buffer us/bar':>18} {'pd.concat us/bar':>17}")
+    for n in (1000, 10000, 100000):
+        bars = make_bars(n)
+        buffered = time_row_buffer(bars) / n * 1e6
+        concat = time_concat(bars) / n * 1e6 if n <= 10000 else float('nan')
+        print(f"{n:>8} {buffered:>18.2f} {concat:>17.2f}")
@@ -1,10 +1,23 @@
-from dash import dash_table
+from dash import dash_table, dcc, html
 import pandas as pd
 
 errors = pd.DataFrame(columns=['reqId', 'errorCode', 'errorString'])
 
-error_page = dash_table.DataTable(
-    columns=[{"name": i, "id": i} for i in errors.columns],
-    data=errors.to_dict('records'),
-    id='errors-dt'
-)
+# Paged, sorted and filtered on the server like the trade blotter;
+# errors-dt-sync holds the error message count the page was read at.
+error_page = html.Div([
+    dash_table.DataTable(
+        columns=[{"name": i, "id": i} for i in errors.columns],
+        data=errors.to_dict('records'),
+        page_current=0,
+        page_size=50,
+        page_action='custom',
+        sort_action='custom',
+        sort_mode='multi',
+        sort_by=[],
+        filter_action='custom',
+        filter_query='',
+        id='errors-dt'
+    ),
+    dcc.Store(id='errors-dt-sync')
+])
@@ -1,7 +1,13 @@
+import hashlib
 import os
+import pickle
+import threading
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
 from pandas.tseries.offsets import BDay
+from final_project.blotter import BLOTTER_COLUMNS, trade_blotter
+from final_project.analytics import tear_sheet
 
 PERIOD = 3
 LOT = 25000
@@ -11,20 +17,127 @@ HOLDING_PERIOD_CAP = 5  # business days
 
 
 # HISTORICAL MARKET DATA
-def load_data(period=PERIOD):
+def load_data(period=PERIOD, use_cache=True):
     file_path = os.getenv("ITA_DATA_PATH")
-    hist = pd.read_csv(f'{file_path}\data.csv', parse_dates=True, index_col='Date')
-    risk_free_hist = pd.read_csv(f"{file_path}\\risk_free.csv", parse_dates=True, index_col='Date')
+    if use_cache:
+        return default_market_data_cache().load(file_path, period)
+    data_path, risk_free_path = market_data_paths(file_path)
+    hist = pd.read_csv(data_path, parse_dates=True, index_col='Date')
+    risk_free_hist = pd.read_csv(risk_free_path, parse_dates=True, index_col='Date')
+    return prepare_data(hist, risk_free_hist, period)
 
-    risk_free_hist['interest_rate'] = risk_free_hist['interest_rate'] / 100
-    hist = hist.iloc[::-1]
+
+def market_data_paths(file_path):
+    return os.path.join(file_path, 'data.csv'), os.path.join(file_path, 'risk_free.csv')
+
+
+# Adds the returns, the rolling correlation and the interest rate to prices read newest first, as in data.csv.
+def prepare_data(hist, risk_free_hist, period=PERIOD):
+    return add_correlation(prepare_returns(hist), prepare_risk_free(risk_free_hist), period)
+
+
+# The part of prepare_data that doesn't depend on period.
+def prepare_returns(hist):
+    hist = hist.iloc[::-1].copy()
     hist['log_ret_AMZN'] = np.log(hist['amzn_Close']) - np.log(hist['amzn_Close'].shift(1))
     hist['log_ret_WMT'] = np.log(hist['wmt_Close']) - np.log(hist['wmt_Close'].shift(1))
+    return hist
+
+
+def prepare_risk_free(risk_free_hist):
+    risk_free_hist = risk_free_hist.copy()
+    risk_free_hist['interest_rate'] = risk_free_hist['interest_rate'] / 100
+    return risk_free_hist
+
+
+def add_correlation(returns_hist, risk_free_hist, period):
+    hist = returns_hist.copy()
     hist['corr_coef'] = hist['amzn_Close'].rolling(period).corr(hist['wmt_Close'])
     hist = hist.merge(risk_free_hist, how='left', on='Date')
     return hist
 
 
+# Keeps what load_data reads from data.csv and risk_free.csv, so a backtest doesn't parse them again. The parsed
+# frames are kept for as long as the files' modification times don't change; the frame for each period (rolling
+# correlation and merge) is computed the first time it's asked for and the last max_periods of them are kept.
+#
+# With snapshot_directory the parsed frames are also pickled there, so a fresh process skips the CSV parsing too.
+class market_data_cache:
+    def __init__(self, max_periods=16, snapshot_directory=None):
+        self.max_periods = max_periods
+        self.snapshot_directory = snapshot_directory
+        self._key = None
+        self._returns_hist = None
+        self._risk_free_hist = None
+        self._by_period = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, file_path, period=PERIOD):
+        paths = market_data_paths(file_path)
+        key = tuple((os.path.abspath(path), os.stat(path).st_mtime_ns) for path in paths)
+        with self._lock:
+            if key != self._key:
+                self._load_files(key)
+            hist = self._by_period.get(period)
+            if hist is None:
+                hist = add_correlation(self._returns_hist, self._risk_free_hist, period)
+                self._by_period[period] = hist
+                while len(self._by_period) > self.max_periods:
+                    self._by_period.popitem(last=False)
+            else:
+                self._by_period.move_to_end(period)
+        # Callers get their own copy, so changing it can't change what the next backtest sees.
+        return hist.copy()
+
+    def clear(self):
+        with self._lock:
+            self._key = None
+            self._returns_hist = None
+            self._risk_free_hist = None
+            self._by_period.clear()
+
+    def _snapshot_path(self, key):
+        name = hashlib.sha1(repr([path for path, _ in key]).encode()).hexdigest()
+        return os.path.join(self.snapshot_directory, f'{name}.pkl')
+
+    def _load_files(self, key):
+        self._by_period.clear()
+        snapshot_path = None
+        if self.snapshot_directory is not None:
+            snapshot_path = self._snapshot_path(key)
+            if os.path.exists(snapshot_path):
+                with open(snapshot_path, 'rb') as f:
+                    snapshot = pickle.load(f)
+                if snapshot['key'] == key:
+                    self._key = key
+                    self._returns_hist = snapshot['returns_hist']
+                    self._risk_free_hist = snapshot['risk_free_hist']
+                    return
+
+        (data_path, _), (risk_free_path, _) = key
+        self._returns_hist = prepare_returns(pd.read_csv(data_path, parse_dates=True, index_col='Date'))
+        self._risk_free_hist = prepare_risk_free(pd.read_csv(risk_free_path, parse_dates=True, index_col='Date'))
+        self._key = key
+        if snapshot_path is not None:
+            os.makedirs(self.snapshot_directory, exist_ok=True)
+            temporary = snapshot_path + '.tmp'
+            with open(temporary, 'wb') as f:
+                pickle.dump({'key': key, 'returns_hist': self._returns_hist,
+                             'risk_free_hist': self._risk_free_hist}, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, snapshot_path)
+
+
+_default_market_data_cache = None
+
+
+# Used by load_data. Set ITA_DATA_CACHE_PATH to keep snapshots of the parsed files between runs.
+def default_market_data_cache():
+    global _default_market_data_cache
+    if _default_market_data_cache is None:
+        _default_market_data_cache = market_data_cache(snapshot_directory=os.getenv('ITA_DATA_CACHE_PATH'))
+    return _default_market_data_cache
+
+
 # GET POSITION DIRECTION
 
 # This is another logic to decide if we should go long or short
@@ -161,10 +274,15 @@ def should_close_position(hist, position, biz_date):
 
 
 # RUN BACK TEST
-def run_backtest(hist, period=PERIOD, lot=LOT, gain_cap=GAIN_CAP, include_risk_free=INCLUDE_RISK_FREE,
-                 holding_period_cap=HOLDING_PERIOD_CAP):
+SYMBOLS = ['AMZN', 'WMT']
+
+
+# Row-by-row reference implementation. run_backtest gives the same blotter in a fraction of the time;
+# this one is kept because it follows the rules one day at a time and the tests compare the two.
+def run_backtest_iterrows(hist, period=PERIOD, lot=LOT, gain_cap=GAIN_CAP, include_risk_free=INCLUDE_RISK_FREE,
+                          holding_period_cap=HOLDING_PERIOD_CAP):
     blotter = pd.DataFrame(
-        columns=['Date', 'Symbol', 'Trip', 'Action', 'Price', 'Size', 'Status'])
+        columns=BLOTTER_COLUMNS)
     for index, today_market_data in hist.iterrows():
         business_date = index
         pending_exit_trades = blotter[(blotter['Trip'] == 'EXIT') & (blotter['Status'] == 'PENDING')]
@@ -191,6 +309,144 @@ def run_backtest(hist, period=PERIOD, lot=LOT, gain_cap=GAIN_CAP, include_risk_f
     return blotter
 
 
+# pandas' Series.sum: NaN counts as 0.
+def _nansum(values):
+    if values.dtype.kind == 'f':
+        values = np.where(np.isnan(values), 0, values)
+    return values.sum()
+
+
+# Direction of the entry signalled on row `row`, as get_position_direction2 computes it on the rows from `first`
+# (the first date on or after date - BDay(period - 1)) to `row`. Only rows that signal an entry get here, so the
+# window sums are done per entry instead of as rolling sums; that keeps them bit-for-bit equal to the row-by-row
+# version.
+def _entry_direction(volumes, log_returns, first, row):
+    negative_pcts = []
+    for volume, log_return in zip(volumes, log_returns):
+        window_volume = volume[first:row + 1]
+        total_volume = _nansum(window_volume)
+        negative_volume = np.where(log_return[first:row + 1] < 0, window_volume, 0).sum()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            negative_pcts.append(negative_volume / total_volume)
+    amzn_direction = 'BUY' if (negative_pcts[0] >= negative_pcts[1]) else 'SELL'
+    wmt_direction = 'SELL' if (amzn_direction == 'BUY') else 'BUY'
+    return [amzn_direction, wmt_direction]
+
+
+# Same rules and same blotter as run_backtest_iterrows. Only one position (a pair of entries with their exit
+# orders) is ever open, so instead of visiting every day the engine jumps from one entry signal to the next:
+# the signals (corr_coef < 0), the direction windows and the exit dates are computed once as NumPy arrays, and
+# for each exit order the day it fills or gets forced is looked up in the price arrays between its entry date and
+# its expiry date.
+#
+# execution (an execution model from final_project.execution) fills the orders afterwards; without one they fill
+# at the prices the rules give them, with no costs.
+def run_backtest(hist, period=PERIOD, lot=LOT, gain_cap=GAIN_CAP, include_risk_free=INCLUDE_RISK_FREE,
+                 holding_period_cap=HOLDING_PERIOD_CAP, execution=None):
+    return backtest_trades(hist, period, lot, gain_cap, include_risk_free, holding_period_cap, execution).to_frame()
+
+
+# run_backtest's trades as a trade_blotter, for callers that compute on them (sweeps, stats) rather than show them.
+def backtest_trades(hist, period=PERIOD, lot=LOT, gain_cap=GAIN_CAP, include_risk_free=INCLUDE_RISK_FREE,
+                    holding_period_cap=HOLDING_PERIOD_CAP, execution=None):
+    calendar = backtest_calendar(hist.index, period, holding_period_cap)
+    legs = [leg_arrays(hist[f'{symbol.lower()}_Open'], hist[f'{symbol.lower()}_High'],
+                       hist[f'{symbol.lower()}_Low'], hist[f'{symbol.lower()}_Close'],
+                       hist[f'{symbol.lower()}_Volume'], hist[f'log_ret_{symbol}'])
+            for symbol in SYMBOLS]
+    interest_rates = hist['interest_rate'].to_numpy() if include_risk_free else None
+    signal_rows = np.flatnonzero(hist['corr_coef'].to_numpy() < 0)
+
+    trades = trade_blotter(calendar[0].dtype)
+    backtest_pair(calendar, SYMBOLS, legs, signal_rows, interest_rates, lot, gain_cap, include_risk_free,
+                  trades.add)
+    return trades if execution is None else execution.apply(trades, hist)
+
+
+# Per-date arrays every pair backtested on the same dates shares: the dates, the first row of each date's direction
+# window, each date's exit expiry date and the first row after that expiry.
+def backtest_calendar(index, period, holding_period_cap):
+    dates = index.to_numpy()
+    window_starts = dates.searchsorted((index - BDay(period - 1)).to_numpy(), 'left')
+    exit_dates = (index + BDay(holding_period_cap)).to_numpy()
+    forced_rows = dates.searchsorted(exit_dates, 'right')
+    return dates, window_starts, exit_dates, forced_rows
+
+
+def leg_arrays(open_, high, low, close, volume, log_return):
+    return tuple(np.asarray(values) for values in (open_, high, low, close, volume, log_return))
+
+
+# The trading rules of run_backtest for one pair of symbols; every trade is passed to add_trade(date, symbol, trip,
+# action, price, size, status, fill_date) in blotter order, fill_date being the day the order filled (None if it
+# didn't).
+def backtest_pair(calendar, symbols, legs, signal_rows, interest_rates, lot, gain_cap, include_risk_free, add_trade):
+    dates, window_starts, exit_dates, forced_rows = calendar
+    row_count = len(dates)
+    volumes = [leg[4] for leg in legs]
+    log_returns = [leg[5] for leg in legs]
+    row = 0
+    while True:
+        # The position is closed from `row` on; the next entry comes from the first signal at or after it.
+        next_signal = signal_rows.searchsorted(row)
+        if next_signal == len(signal_rows):
+            break
+        signal_row = signal_rows[next_signal]
+        trade_row = signal_row + 1
+        if trade_row == row_count:
+            raise IndexError(f'no trading day after the entry signal on {pd.Timestamp(dates[signal_row])}')
+        directions = _entry_direction(volumes, log_returns, window_starts[signal_row], signal_row)
+        # Pending exits are first checked on the trade date itself. Once the expiry date has passed the exit is
+        # forced before any fill is looked at.
+        forced_row = forced_rows[trade_row]
+
+        exits = []
+        for leg, symbol in enumerate(symbols):
+            opens, highs, lows = legs[leg][:3]
+            open_price = opens[trade_row]
+            size = round(lot / open_price, 4)
+            add_trade(dates[trade_row], symbol, 'ENTRY', directions[leg], open_price, size, 'FILLED',
+                      dates[trade_row])
+
+            exit_action = 'SELL' if directions[leg] == 'BUY' else 'BUY'
+            risk_free = interest_rates[trade_row] if include_risk_free else None
+            if exit_action == 'SELL':
+                exit_price = open_price * (1 + gain_cap + risk_free) if include_risk_free else open_price * (
+                        1 + gain_cap)
+                filled_rows = np.flatnonzero(highs[trade_row:forced_row] >= round(exit_price, 2))
+            else:
+                exit_price = open_price * (1 - gain_cap - risk_free) if include_risk_free else open_price * (
+                        1 - gain_cap)
+                filled_rows = np.flatnonzero(lows[trade_row:forced_row] <= round(exit_price, 2))
+            if len(filled_rows):
+                exits.append((symbol, exit_action, round(exit_price, 2), size, 'FILLED',
+                              trade_row + filled_rows[0]))
+            elif forced_row < row_count:
+                exits.append((symbol, exit_action, round(exit_price, 2), size, 'CANCELED', forced_row))
+            else:
+                exits.append((symbol, exit_action, round(exit_price, 2), size, 'PENDING', None))
+
+        for symbol, exit_action, exit_price, size, status, closed_row in exits:
+            add_trade(exit_dates[trade_row], symbol, 'EXIT', exit_action, exit_price, size, status,
+                      dates[closed_row] if status == 'FILLED' else None)
+        for leg, (symbol, exit_action, exit_price, size, status, closed_row) in enumerate(exits):
+            if status == 'CANCELED':
+                add_trade(dates[closed_row], symbol, 'EXIT', exit_action, legs[leg][3][closed_row], size, 'FORCED',
+                          dates[closed_row])
+        if any(exit_trade[-1] is None for exit_trade in exits):
+            break
+        # No new entry on the day the position closes.
+        row = max(exit_trade[-1] for exit_trade in exits) + 1
+
+
+def trades_to_blotter(trades, date_dtype):
+    blotter = pd.DataFrame(columns=BLOTTER_COLUMNS)
+    if trades['Date']:
+        trades = dict(trades, Date=np.array(trades['Date'], dtype=date_dtype))
+        blotter = pd.concat([blotter, pd.DataFrame(trades)], ignore_index=True)
+    return blotter
+
+
 # RESULT & STATS
 def calculate_gain_loss(symbol, blotter, messages):
     results = blotter[(blotter['Status'] != 'CANCELED') & (blotter['Symbol'] == symbol)].copy()
@@ -209,30 +465,38 @@ def calculate_gain_loss(symbol, blotter, messages):
     return gain_loss
 
 
+# The stats page_1 shows, worded as before; the numbers come from analytics in one pass over the blotter, and the
+# gain/loss part ends with the tear sheet's risk numbers.
 def get_stats(hist, blotter):
+    sheet = tear_sheet(blotter, hist)
+    summary = sheet['summary']
+    totals = sheet['by_symbol'][['sales', 'purchases', 'gain_loss']]
+
     order_messages = []
     order_messages.append(f"******  Orders  ******")
-    order_messages.append(f"Entry Orders: {blotter[(blotter['Trip'] == 'ENTRY') & (blotter['Status'] == 'FILLED')].shape[0]}")
-    order_messages.append(
-        f"Filled Exit Orders: {blotter[(blotter['Trip'] == 'EXIT') & (blotter['Status'] == 'FILLED')].shape[0]}")
-    order_messages.append(
-        f"Canceled Exit Orders: {blotter[(blotter['Trip'] == 'EXIT') & (blotter['Status'] == 'CANCELED')].shape[0]}")
-    order_messages.append(
-        f"Forced Exit Orders: {blotter[(blotter['Trip'] == 'EXIT') & (blotter['Status'] == 'FORCED')].shape[0]}")
-
-    amzn_messages = []
-    amz_gain_loss = calculate_gain_loss('AMZN', blotter, amzn_messages)
-    wmt_messages = []
-    wmt_gain_loss = calculate_gain_loss('WMT', blotter, wmt_messages)
-    total_gain_loss = amz_gain_loss + wmt_gain_loss
-    time_period = hist.last_valid_index() - hist.first_valid_index()
-    years = round(time_period.days / 365.2425, 2)
-    total_gain_loss_per_year = total_gain_loss / years
+    order_messages.append(f"Entry Orders: {summary['entry_orders']}")
+    order_messages.append(f"Filled Exit Orders: {summary['filled_exit_orders']}")
+    order_messages.append(f"Canceled Exit Orders: {summary['canceled_exit_orders']}")
+    order_messages.append(f"Forced Exit Orders: {summary['forced_exit_orders']}")
+
+    symbol_messages = []
+    for symbol in SYMBOLS:
+        sales, purchases, gain_loss = totals.loc[symbol] if symbol in totals.index else (0.0, 0.0, 0.0)
+        symbol_messages.append([f"\n******  {symbol}  ******",
+                                f'Total Sales: ${round(sales, 2):,}',
+                                f'Total Purchases: ${round(purchases, 2):,}',
+                                f'Gain or Loss: ${round(gain_loss, 2):,}'])
+    total_gain_loss = summary['total_gain_loss']
+    years = summary['years']
 
     gain_loss_messages = []
     gain_loss_messages.append(f"******  Total Gain/Loss  ******")
     gain_loss_messages.append(f"\nYears: {years}")
     gain_loss_messages.append(f'Total Gain or Loss: ${round(total_gain_loss, 2):,}')
-    gain_loss_messages.append(f"Total Gain or Loss Per Year: ${round(total_gain_loss_per_year, 2):,}")
+    gain_loss_messages.append(f"Total Gain or Loss Per Year: ${round(summary['gain_loss_per_year'], 2):,}")
+    gain_loss_messages.append(f"Hit Rate: {summary['hit_rate']:.1%}")
+    gain_loss_messages.append(f"Max Drawdown: ${round(summary['max_drawdown'], 2):,}")
+    gain_loss_messages.append(f"Sharpe Ratio: {summary['sharpe']:.2f}")
+    gain_loss_messages.append(f"Sortino Ratio: {summary['sortino']:.2f}")
     print()
-    return [order_messages, amzn_messages, wmt_messages, gain_loss_messages]
+    return [order_messages] + symbol_messages + [gain_loss_messages]
@@ -0,0 +1,312 @@
+import numpy as np
+import pandas as pd
+from final_project.blotter import BLOTTER_COLUMNS, COMMISSION, FILL_DATE, TRIPS, ACTIONS, STATUSES, TRIP_CODES, ACTION_CODES, \
+    STATUS_CODES, EXIT, PENDING, trade_blotter
+
+TRADING_DAYS_PER_YEAR = 252
+
+ENTRY = TRIP_CODES['ENTRY']
+BUY = ACTION_CODES['BUY']
+SELL = ACTION_CODES['SELL']
+FILLED = STATUS_CODES['FILLED']
+CANCELED = STATUS_CODES['CANCELED']
+FORCED = STATUS_CODES['FORCED']
+COLUMN_CODES = {'Trip': TRIP_CODES, 'Action': ACTION_CODES, 'Status': STATUS_CODES}
+# The columns order_counts and symbol_totals use.
+TOTAL_COLUMNS = ['Symbol', 'Trip', 'Action', 'Price', 'Size', 'Status', COMMISSION]
+
+
+# BLOTTER ARRAYS
+
+# The columns of a blotter as arrays, with Symbol / Trip / Action / Status as codes like trade_blotter keeps them,
+# and the symbols the Symbol codes stand for. Takes a trade_blotter or a blotter DataFrame; from a DataFrame only the
+# columns asked for are converted, as a Date column of Timestamp objects is slow to convert (DatetimeIndex reads the
+# objects directly, without the infer_objects pass to_datetime of an object column needs).
+def blotter_arrays(blotter, columns=BLOTTER_COLUMNS + [COMMISSION, FILL_DATE]):
+    if isinstance(blotter, trade_blotter):
+        arrays = blotter.arrays()
+        return {column: arrays[column] for column in columns if column in arrays}, list(blotter.symbols)
+    symbol_codes, symbols = pd.factorize(blotter['Symbol'])
+    arrays = {}
+    for column in columns:
+        if column not in blotter:
+            continue
+        elif column in ('Date', FILL_DATE):
+            dates = blotter[column]
+            arrays[column] = (dates if dates.dtype.kind == 'M' else pd.DatetimeIndex(dates.to_numpy())).to_numpy()
+        elif column == 'Symbol':
+            arrays['Symbol'] = symbol_codes
+        elif column in ('Price', 'Size', COMMISSION):
+            arrays[column] = blotter[column].to_numpy(dtype=np.float64)
+        else:
+            arrays[column] = _codes(blotter[column], COLUMN_CODES[column])
+    return arrays, list(symbols)
+
+
+def _codes(values, codes):
+    value_codes, values = pd.factorize(values)
+    return np.array([codes[value] for value in values], dtype=np.int8)[value_codes]
+
+
+# ORDERS & GAIN/LOSS
+
+# Number of orders by trip and status, from one bincount.
+def order_counts(arrays):
+    counts = np.bincount(arrays['Trip'].astype(np.intp) * len(STATUSES) + arrays['Status'],
+                         minlength=len(TRIPS) * len(STATUSES)).reshape(len(TRIPS), len(STATUSES))
+    entries, exits = counts[ENTRY], counts[EXIT]
+    return {'entry_orders': int(entries[FILLED]), 'filled_exit_orders': int(exits[FILLED]),
+            'canceled_exit_orders': int(exits[CANCELED]), 'forced_exit_orders': int(exits[FORCED]),
+            'pending_exit_orders': int(exits[PENDING])}
+
+
+# Sales, purchases, commissions and gain/loss (sales - purchases - commissions) of every symbol over the orders that
+# weren't canceled, as calculate_gain_loss counts them, in one pass over the blotter. Blotters without a Commission
+# column (every blotter but those of an execution model) have no commissions.
+def symbol_totals(arrays, symbols):
+    live = arrays['Status'] != CANCELED
+    notional = np.where(live, arrays['Price'] * arrays['Size'], 0)
+    sells = arrays['Action'] == SELL
+    symbol_codes = arrays['Symbol']
+    sales = np.bincount(symbol_codes, np.where(sells, notional, 0), minlength=len(symbols))
+    purchases = np.bincount(symbol_codes, np.where(sells, 0, notional), minlength=len(symbols))
+    commissions = np.bincount(symbol_codes, np.where(live, _commissions(arrays), 0), minlength=len(symbols))
+    return pd.DataFrame({'sales': sales, 'purchases': purchases, 'commission': commissions,
+                         'gain_loss': sales - purchases - commissions},
+                        index=pd.Index(symbols, name='Symbol'))
+
+
+def _commissions(arrays):
+    commissions = arrays.get(COMMISSION)
+    return np.zeros(len(arrays['Price'])) if commissions is None else commissions
+
+
+def years_of(hist):
+    return round((hist.last_valid_index() - hist.first_valid_index()).days / 365.2425, 2)
+
+
+# ROUND TRIPS
+
+# The entry row of the same position and symbol as each of rows, or -1 where there is none. A position's entries come
+# one after the other, followed by their exits and forced exits, so a position starts at every entry that doesn't
+# follow another entry.
+def matching_entries(arrays, rows):
+    entries = arrays['Trip'] == ENTRY
+    position = np.cumsum(entries & ~np.concatenate(([False], entries[:-1]))) - 1
+    symbol_count = int(arrays['Symbol'].max()) + 1 if len(entries) else 1
+    keys = position.astype(np.int64) * symbol_count + arrays['Symbol']
+    entry_rows = np.flatnonzero(entries)
+    order = np.argsort(keys[entry_rows], kind='stable')
+    entry_rows, entry_keys = entry_rows[order], keys[entry_rows][order]
+    if not len(entry_rows):
+        return np.full(len(rows), -1), position
+    matches = np.minimum(np.searchsorted(entry_keys, keys[rows]), len(entry_rows) - 1)
+    return np.where(entry_keys[matches] == keys[rows], entry_rows[matches], -1), position
+
+
+# Index of the first bar in [start, end) where a sell limit is reached (high >= limit) or a buy limit is (low <=
+# limit), or -1 if it isn't. Every order's bars are looked at side by side, as a (orders x widest window) matrix.
+def first_limit_fill(highs, lows, start, end, limits, sells):
+    width = int((end - start).max()) if len(start) else 0
+    if width <= 0 or not len(highs):
+        return np.full(len(start), -1)
+    bars = start[:, None] + np.arange(width)
+    inside = bars < end[:, None]
+    bars = np.minimum(bars, len(highs) - 1)
+    reached = np.where(sells[:, None], highs[bars] >= limits[:, None], lows[bars] <= limits[:, None]) & inside
+    return np.where(reached.any(axis=1), start + reached.argmax(axis=1), -1)
+
+
+# The Fill_Date column for a blotter that doesn't have it (a blotter DataFrame, which has no Fill_Date column), or
+# the missing dates of one that does: entries and forced exits fill on their Date, and a filled exit on the first
+# day of hist from its entry on that reaches its limit, as backtest_pair finds it. Without the symbols' prices in
+# hist a filled exit is left on its Date (the day it expires).
+def fill_dates_from_hist(arrays, symbols, hist):
+    dates, status = arrays['Date'], arrays['Status']
+    fill_dates = arrays.get(FILL_DATE)
+    fill_dates = np.full(len(dates), np.datetime64('NaT'), dtype=dates.dtype) if fill_dates is None \
+        else fill_dates.astype(dates.dtype)
+    missing = np.isnat(fill_dates)
+    fill_dates[missing & np.isin(status, (FILLED, FORCED))] = dates[missing & np.isin(status, (FILLED, FORCED))]
+    columns = [f'{symbol.lower()}_{field}' for symbol in symbols for field in ('High', 'Low')]
+    rows = np.flatnonzero(missing & (arrays['Trip'] != ENTRY) & (status == FILLED))
+    if not len(rows) or hist is None or not all(column in hist for column in columns):
+        return fill_dates
+    entry_rows, _ = matching_entries(arrays, rows)
+    rows, entry_rows = rows[entry_rows >= 0], entry_rows[entry_rows >= 0]
+    calendar = hist.index.to_numpy()
+    highs = np.concatenate([hist[f'{symbol.lower()}_High'].to_numpy(dtype=np.float64) for symbol in symbols])
+    lows = np.concatenate([hist[f'{symbol.lower()}_Low'].to_numpy(dtype=np.float64) for symbol in symbols])
+    offsets = arrays['Symbol'][rows].astype(np.intp) * len(calendar)
+    first = first_limit_fill(highs, lows, offsets + np.searchsorted(calendar, dates[entry_rows]),
+                             offsets + np.searchsorted(calendar, dates[rows], 'right'), arrays['Price'][rows],
+                             arrays['Action'][rows] == SELL)
+    reached = first >= 0
+    fill_dates[rows[reached]] = calendar[first[reached] - offsets[reached]]
+    return fill_dates
+
+
+# Every entry with the exit that closed it (the exit of its position and symbol that wasn't canceled: filled,
+# forced or still pending), as arrays, in the order of the entries. A trade exits on the day its exit filled
+# (Fill_Date) and a pending one on its exit's Date, the day the order expires. Commissions of both orders come off
+# the gain/loss.
+def round_trips(arrays):
+    exit_rows = np.flatnonzero((arrays['Trip'] != ENTRY) & (arrays['Status'] != CANCELED))
+    entry_rows, position = matching_entries(arrays, exit_rows)
+    order = np.argsort(entry_rows, kind='stable')
+    entry_rows, exit_rows = entry_rows[order], exit_rows[order]
+    exit_rows = exit_rows[entry_rows >= 0]
+    entry_rows = entry_rows[entry_rows >= 0]
+
+    dates, prices, sizes = arrays['Date'], arrays['Price'], arrays['Size']
+    fill_dates = arrays.get(FILL_DATE)
+    exit_dates = dates[exit_rows] if fill_dates is None else \
+        np.where(np.isnat(fill_dates[exit_rows]), dates[exit_rows], fill_dates[exit_rows].astype(dates.dtype))
+    commissions = _commissions(arrays)
+    sign = np.where(arrays['Action'][entry_rows] == BUY, 1.0, -1.0)
+    entry_prices, exit_prices, size = prices[entry_rows], prices[exit_rows], sizes[entry_rows]
+    commission = commissions[entry_rows] + commissions[exit_rows]
+    pnl = (exit_prices - entry_prices) * size * sign - commission
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = pnl / (entry_prices * size)
+    return {
+        'position': position[entry_rows],
+        'symbol': arrays['Symbol'][entry_rows].astype(np.intp),
+        'direction': arrays['Action'][entry_rows],
+        'entry_date': dates[entry_rows],
+        'exit_date': exit_dates,
+        'entry_price': entry_prices,
+        'exit_price': exit_prices,
+        'size': size,
+        'status': arrays['Status'][exit_rows],
+        'commission': commission,
+        'pnl': pnl,
+        'return': returns,
+        'holding_days': np.busday_count(dates[entry_rows].astype('datetime64[D]'),
+                                        exit_dates.astype('datetime64[D]'))
+    }
+
+
+def trades_frame(trips, symbols):
+    frame = pd.DataFrame(trips)
+    frame['symbol'] = pd.Categorical.from_codes(trips['symbol'], categories=symbols)
+    frame['direction'] = pd.Categorical.from_codes(trips['direction'], categories=ACTIONS)
+    frame['status'] = pd.Categorical.from_codes(trips['status'], categories=STATUSES)
+    return frame
+
+
+# EQUITY & RISK
+
+# Realized gain/loss per day of calendar (sorted dates), equity (its running sum) and drawdown (equity below its
+# running peak, starting from 0). Trades still pending are left out; a trade closing between two days of the
+# calendar counts on the next one.
+def equity_curve(trips, calendar):
+    closed = trips['status'] != PENDING
+    days = np.minimum(np.searchsorted(calendar, trips['exit_date'][closed]), max(len(calendar) - 1, 0))
+    pnl = np.bincount(days, trips['pnl'][closed], minlength=len(calendar))[:len(calendar)]
+    equity = np.cumsum(pnl)
+    peak = np.maximum.accumulate(np.maximum(equity, 0)) if len(equity) else equity
+    return pd.DataFrame({'pnl': pnl, 'equity': equity, 'drawdown': equity - peak},
+                        index=pd.DatetimeIndex(calendar, name='Date'))
+
+
+# Annualized Sharpe and Sortino ratios of daily gain/loss, i.e. of daily returns on a constant amount of capital,
+# with no risk-free rate. NaN when there is no variation to divide by.
+def risk_ratios(daily_pnl, periods_per_year=TRADING_DAYS_PER_YEAR):
+    if len(daily_pnl) < 2:
+        return float('nan'), float('nan')
+    mean = daily_pnl.mean()
+    std = daily_pnl.std(ddof=1)
+    downside = np.sqrt(np.mean(np.minimum(daily_pnl, 0) ** 2))
+    scale = np.sqrt(periods_per_year)
+    sharpe = mean / std * scale if std > 0 else float('nan')
+    sortino = mean / downside * scale if downside > 0 else float('nan')
+    return float(sharpe), float(sortino)
+
+
+# Per symbol: trades, long trades, gross entry notional, hit rate, average holding days and the share of
+# the calendar's days a position in the symbol was open (from the entry day through the exit day).
+def exposure_by_symbol(trips, symbols, calendar):
+    symbol_codes = trips['symbol']
+    symbol_count = len(symbols)
+    trades = np.bincount(symbol_codes, minlength=symbol_count)
+    closed = trips['status'] != PENDING
+    closed_trades = np.bincount(symbol_codes[closed], minlength=symbol_count)
+    wins = np.bincount(symbol_codes[closed & (trips['pnl'] > 0)], minlength=symbol_count)
+
+    day_count = len(calendar)
+    starts = np.searchsorted(calendar, trips['entry_date'])
+    ends = np.searchsorted(calendar, trips['exit_date'], 'right')
+    changes = np.bincount(symbol_codes * (day_count + 1) + starts, minlength=symbol_count * (day_count + 1)) - \
+        np.bincount(symbol_codes * (day_count + 1) + ends, minlength=symbol_count * (day_count + 1))
+    open_days = (np.cumsum(changes.reshape(symbol_count, day_count + 1), axis=1)[:, :day_count] > 0).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return pd.DataFrame({
+            'trades': trades,
+            'long_trades': np.bincount(symbol_codes[trips['direction'] == BUY], minlength=symbol_count),
+            'gross_notional': np.bincount(symbol_codes, trips['entry_price'] * trips['size'],
+                                          minlength=symbol_count),
+            'hit_rate': wins / closed_trades,
+            'average_holding_days': np.bincount(symbol_codes, trips['holding_days'],
+                                                minlength=symbol_count) / trades,
+            'time_in_market': open_days / day_count if day_count else np.full(symbol_count, np.nan)
+        }, index=pd.Index(symbols, name='Symbol'))
+
+
+# TEAR SHEET
+
+# Everything about one backtest from its blotter (a trade_blotter or a blotter DataFrame), computed with array
+# operations on the whole blotter rather than a filter per number:
+#   trades        one row per round trip (entry and the exit that closed it) with its gain/loss, return and
+#                 holding time in business days, up to the day the exit filled
+#   equity        realized gain/loss, equity and drawdown per day of hist (or per exit date without hist)
+#   by_symbol     sales, purchases and gain/loss (symbol_totals) with the exposure per symbol
+#   holding_days  number of closed trades per holding time
+#   summary       order counts, totals and risk numbers as a dict
+# Gain/loss totals count pending exits at their limit price, like get_stats; the equity curve and the ratios only
+# count trades that closed.
+#
+# Blotters without fill dates (blotter DataFrames) get them from hist with fill_dates_from_hist.
+def tear_sheet(blotter, hist=None, periods_per_year=TRADING_DAYS_PER_YEAR):
+    arrays, symbols = blotter_arrays(blotter)
+    if FILL_DATE not in arrays or np.isnat(arrays[FILL_DATE][arrays['Status'] == FILLED]).any():
+        arrays = dict(arrays, **{FILL_DATE: fill_dates_from_hist(arrays, symbols, hist)})
+    trips = round_trips(arrays)
+    closed = trips['status'] != PENDING
+    if hist is not None:
+        calendar = np.sort(hist.index.to_numpy())
+    else:
+        calendar = np.unique(trips['exit_date'][closed])
+    equity = equity_curve(trips, calendar)
+    sharpe, sortino = risk_ratios(equity['pnl'].to_numpy(), periods_per_year)
+
+    closed_pnl = trips['pnl'][closed]
+    wins, losses = closed_pnl[closed_pnl > 0], closed_pnl[closed_pnl < 0]
+    _, closed_positions = np.unique(trips['position'][closed], return_inverse=True)
+    position_pnl = np.bincount(closed_positions, closed_pnl)
+    totals = symbol_totals(arrays, symbols)
+    total_gain_loss = float(totals['gain_loss'].sum())
+    years = years_of(hist) if hist is not None else float('nan')
+
+    summary = dict(order_counts(arrays),
+                   trades=len(trips['pnl']),
+                   closed_trades=len(closed_pnl),
+                   total_gain_loss=total_gain_loss,
+                   years=years,
+                   gain_loss_per_year=total_gain_loss / years if years else float('nan'),
+                   hit_rate=len(wins) / len(closed_pnl) if len(closed_pnl) else float('nan'),
+                   position_hit_rate=float((position_pnl > 0).mean()) if len(position_pnl) else float('nan'),
+                   average_win=float(wins.mean()) if len(wins) else float('nan'),
+                   average_loss=float(losses.mean()) if len(losses) else float('nan'),
+                   profit_factor=float(wins.sum() / -losses.sum()) if len(losses) else float('nan'),
+                   max_drawdown=float(equity['drawdown'].min()) if len(equity) else 0.0,
+                   sharpe=sharpe,
+                   sortino=sortino,
+                   average_holding_days=float(trips['holding_days'][closed].mean()) if closed.any()
+                   else float('nan'))
+
+    holding_days = pd.Series(np.bincount(trips['holding_days'][closed]), name='trades').rename_axis('holding_days')
+    return {'trades': trades_frame(trips, symbols), 'equity': equity,
+            'by_symbol': totals.join(exposure_by_symbol(trips, symbols, calendar)), 'holding_days': holding_days,
+            'summary': summary}
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+BLOTTER_COLUMNS = ['Date', 'Symbol', 'Trip', 'Action', 'Price', 'Size', 'Status']
+# Added after the blotter columns by an execution model (see final_project.execution).
+COMMISSION = 'Commission'
+# The day an order filled: the entry date for entries, the day the limit was reached for filled exits (whose Date
+# is the day the order expires) and the Date of forced exits; NaT for orders that didn't fill.
+FILL_DATE = 'Fill_Date'
+
+# Codes of the blotter's text columns; a trade_blotter stores the position of the value in these lists.
+TRIPS = ['ENTRY', 'EXIT']
+ACTIONS = ['BUY', 'SELL']
+STATUSES = ['FILLED', 'PENDING', 'CANCELED', 'FORCED', 'SUBMITTED']
+TRIP_CODES = {trip: code for code, trip in enumerate(TRIPS)}
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+EXIT = TRIP_CODES['EXIT']
+PENDING = STATUS_CODES['PENDING']
+
+
+# A blotter kept as typed NumPy arrays: dates, prices and sizes as numbers and symbol / trip / action / status as
+# small integer codes (symbols get theirs in the order they first come in). The arrays are preallocated and double
+# when full, so adding a trade is O(1) and a trade takes 37 bytes instead of a row of Python objects.
+#
+# add() takes the arguments of backtest_pair's add_trade; to_frame() gives the DataFrame run_backtest returns, for
+# display (with to_frame(fill_dates=True) it also has the Fill_Date column). arrays() gives the columns themselves
+# (trimmed to the trades added) for computing on them. with_fills() gives a copy with the prices, sizes, commissions
+# and fill dates an execution model filled the orders at.
+class trade_blotter:
+    def __init__(self, date_dtype='datetime64[ns]', capacity=64):
+        self.date_dtype = np.dtype(date_dtype)
+        self.symbols = []
+        self._symbol_codes = {}
+        self._size = 0
+        self.commissions = None
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        old = getattr(self, '_columns', None)
+        self._columns = {
+            'Date': np.empty(capacity, dtype=self.date_dtype),
+            'Symbol': np.empty(capacity, dtype=np.int16),
+            'Trip': np.empty(capacity, dtype=np.int8),
+            'Action': np.empty(capacity, dtype=np.int8),
+            'Price': np.empty(capacity, dtype=np.float64),
+            'Size': np.empty(capacity, dtype=np.float64),
+            'Status': np.empty(capacity, dtype=np.int8),
+            FILL_DATE: np.empty(capacity, dtype=self.date_dtype)
+        }
+        if old is not None:
+            for column, values in old.items():
+                self._columns[column][:self._size] = values[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    def symbol_code(self, symbol):
+        code = self._symbol_codes.get(symbol)
+        if code is None:
+            code = self._symbol_codes[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return code
+
+    def add(self, date, symbol, trip, action, price, size, status, fill_date=None):
+        row = self._size
+        if row == len(self._columns['Date']):
+            self._allocate(2 * row)
+        columns = self._columns
+        columns['Date'][row] = date
+        columns['Symbol'][row] = self.symbol_code(symbol)
+        columns['Trip'][row] = TRIP_CODES[trip]
+        columns['Action'][row] = ACTION_CODES[action]
+        columns['Price'][row] = np.nan if price is None else price
+        columns['Size'][row] = size
+        columns['Status'][row] = STATUS_CODES[status]
+        columns[FILL_DATE][row] = np.datetime64('NaT') if fill_date is None else fill_date
+        self._size = row + 1
+        return row
+
+    def arrays(self):
+        arrays = {column: values[:self._size] for column, values in self._columns.items()}
+        if self.commissions is not None:
+            arrays[COMMISSION] = self.commissions
+        return arrays
+
+    def with_fills(self, prices, sizes, commissions, fill_dates=None):
+        trades = trade_blotter(self.date_dtype, max(self._size, 1))
+        trades.symbols = list(self.symbols)
+        trades._symbol_codes = dict(self._symbol_codes)
+        trades._size = self._size
+        for column, values in self.arrays().items():
+            if column in trades._columns:
+                trades._columns[column][:self._size] = values
+        trades._columns['Price'][:self._size] = prices
+        trades._columns['Size'][:self._size] = sizes
+        if fill_dates is not None:
+            trades._columns[FILL_DATE][:self._size] = fill_dates
+        trades.commissions = np.asarray(commissions, dtype=np.float64)
+        return trades
+
+    # The decoded value of every column for the trades added, as lists.
+    def to_lists(self, fill_dates=False):
+        arrays = self.arrays()
+        symbols = np.array(self.symbols, dtype=object)
+        lists = {
+            'Date': arrays['Date'],
+            'Symbol': symbols[arrays['Symbol']].tolist(),
+            'Trip': np.array(TRIPS, dtype=object)[arrays['Trip']].tolist(),
+            'Action': np.array(ACTIONS, dtype=object)[arrays['Action']].tolist(),
+            'Price': arrays['Price'].tolist(),
+            'Size': arrays['Size'].tolist(),
+            'Status': np.array(STATUSES, dtype=object)[arrays['Status']].tolist()
+        }
+        if self.commissions is not None:
+            lists[COMMISSION] = self.commissions.tolist()
+        if fill_dates:
+            lists[FILL_DATE] = arrays[FILL_DATE]
+        return lists
+
+    def to_frame(self, fill_dates=False):
+        columns = BLOTTER_COLUMNS + ([] if self.commissions is None else [COMMISSION]) + \
+            ([FILL_DATE] if fill_dates else [])
+        blotter = pd.DataFrame(columns=columns)
+        if self._size:
+            blotter = pd.concat([blotter, pd.DataFrame(self.to_lists(fill_dates))], ignore_index=True)
+        return blotter
+
+    @classmethod
+    def from_frame(cls, blotter):
+        dates = blotter['Date'].to_numpy()
+        trades = cls(dates.dtype if dates.dtype.kind == 'M' else 'datetime64[ns]', max(len(blotter), 1))
+        columns = BLOTTER_COLUMNS + ([FILL_DATE] if FILL_DATE in blotter else [])
+        for row in zip(*(blotter[column].tolist() for column in columns)):
+            trades.add(*row)
+        if COMMISSION in blotter:
+            trades.commissions = blotter[COMMISSION].to_numpy(dtype=np.float64)
+        return trades
@@ -0,0 +1,242 @@
+import hashlib
+import inspect
+import numpy as np
+from final_project.blotter import ACTION_CODES, STATUS_CODES, TRIP_CODES
+from final_project.analytics import first_limit_fill, matching_entries
+
+ENTRY = TRIP_CODES['ENTRY']
+BUY = ACTION_CODES['BUY']
+FILLED = STATUS_CODES['FILLED']
+FORCED = STATUS_CODES['FORCED']
+
+NAIVE = 'naive'
+
+# IB's tiered commission for US stocks: USD per share by the shares already traded in the month.
+IB_TIERED_RATES = [(0, 0.0035), (300000, 0.002), (3000000, 0.0015), (20000000, 0.001), (100000000, 0.0005)]
+
+
+# A stable description of an execution model (or of one of its commission / slippage models), to tell results
+# computed with different models apart: NAIVE for no model, the repr of the models below, and the qualified name
+# of other functions and classes.
+def execution_key(model):
+    if model is None or isinstance(model, naive_execution):
+        return NAIVE
+    if inspect.isfunction(model) or inspect.isclass(model):
+        return f'{model.__module__}.{model.__qualname__}'
+    description = repr(model)
+    if ' at 0x' in description:
+        return f'{type(model).__module__}.{type(model).__qualname__}'
+    return description
+
+
+# COMMISSIONS
+#
+# A commission model is called with the fill dates, shares and value of the orders that filled and returns the
+# commission of each one.
+
+def _bounded(commissions, values, minimum, maximum_rate):
+    return np.minimum(np.maximum(commissions, minimum), maximum_rate * values)
+
+
+# IB fixed pricing: per_share for every share, at least minimum per order and at most maximum_rate of its value.
+class ib_fixed_commission:
+    def __init__(self, per_share=0.005, minimum=1.0, maximum_rate=0.01):
+        self.per_share = per_share
+        self.minimum = minimum
+        self.maximum_rate = maximum_rate
+
+    def __repr__(self):
+        return f'ib_fixed_commission(per_share={self.per_share!r}, minimum={self.minimum!r}, ' \
+               f'maximum_rate={self.maximum_rate!r})'
+
+    def __call__(self, dates, shares, values):
+        return _bounded(self.per_share * shares, values, self.minimum, self.maximum_rate)
+
+
+# IB tiered pricing: the rate per share goes down with the shares traded so far in the calendar month, counted in
+# fill date order; at least minimum per order and at most maximum_rate of its value.
+class ib_tiered_commission:
+    def __init__(self, rates=IB_TIERED_RATES, minimum=0.35, maximum_rate=0.01):
+        self.thresholds = np.array([threshold for threshold, _ in rates], dtype=np.float64)
+        self.rates = np.array([rate for _, rate in rates])
+        self.minimum = minimum
+        self.maximum_rate = maximum_rate
+
+    def __repr__(self):
+        rates = list(zip(self.thresholds.tolist(), self.rates.tolist()))
+        return f'ib_tiered_commission(rates={rates!r}, minimum={self.minimum!r}, maximum_rate={self.maximum_rate!r})'
+
+    def __call__(self, dates, shares, values):
+        order = np.argsort(dates, kind='stable')
+        months = dates[order].astype('datetime64[M]')
+        traded_before = np.cumsum(shares[order]) - shares[order]
+        month_to_date = traded_before - traded_before[np.searchsorted(months, months, 'left')]
+        rates = self.rates[np.searchsorted(self.thresholds, month_to_date, 'right') - 1]
+        commissions = np.empty(len(shares))
+        commissions[order] = _bounded(rates * shares[order], values[order], self.minimum, self.maximum_rate)
+        return commissions
+
+
+# SLIPPAGE
+
+# What a market order gives up per share: half the quoted spread, plus market impact growing with the square root of
+# the share of the bar's volume it takes. Both are in basis points of the price.
+class spread_slippage:
+    def __init__(self, spread_bps=5.0, impact_bps=20.0):
+        self.spread_bps = spread_bps
+        self.impact_bps = impact_bps
+
+    def __repr__(self):
+        return f'spread_slippage(spread_bps={self.spread_bps!r}, impact_bps={self.impact_bps!r})'
+
+    def __call__(self, prices, participation):
+        return prices * (self.spread_bps / 2 + self.impact_bps * np.sqrt(participation)) / 10000
+
+
+# INTRADAY BARS
+
+# Intraday bars of every symbol from a bar_store: keys maps symbols to their bar_store_key.
+def intraday_bars_from_store(store, keys, start=None, end=None):
+    return {symbol: store.read_records(key, start, end) for symbol, key in keys.items()}
+
+
+class _intraday_bars:
+    def __init__(self, records):
+        dates = np.asarray(records['date'])
+        self.days = (dates.astype('datetime64[ns]') if dates.dtype.kind != 'M' else dates).astype('datetime64[D]')
+        self.open = np.asarray(records['open'], dtype=np.float64)
+        self.high = np.asarray(records['high'], dtype=np.float64)
+        self.low = np.asarray(records['low'], dtype=np.float64)
+        self.volume = np.asarray(records['volume'], dtype=np.float64)
+
+    # [start, end) of the bars of every date.
+    def day_bars(self, dates):
+        days = dates.astype('datetime64[D]')
+        return np.searchsorted(self.days, days, 'left'), np.searchsorted(self.days, days, 'right')
+
+
+# EXECUTION MODELS
+#
+# An execution model takes the trades of a backtest (a trade_blotter) and the hist they were made on and returns
+# them as they would have filled. The trading rules (backtest_pair) still decide which orders are placed and when a
+# position closes; the model decides the prices, sizes and costs of the fills, so the orders stay the same and only
+# their results change. apply() works on every order at once with array operations.
+
+# Fills as run_backtest has them: entries at the open, limit exits at their limit, forced exits at the close, no
+# costs.
+class naive_execution:
+    def apply(self, trades, hist):
+        return trades
+
+
+# Fills with costs:
+#   entries       market orders at the open, for at most participation_cap of the opening bar's volume (the rest
+#                 of the order isn't filled), paying slippage on what they take
+#   limit exits   at the limit, or at the open of the bar they filled in when it opened past the limit (a gap);
+#                 no slippage, as they wait in the book
+#   forced exits  market orders at the close, paying slippage
+# Exits close what their entry filled. Every filled order pays commission (IB tiered by default). The blotter's
+# Fill_Date is the day each order filled on, as found here.
+#
+# With intraday_bars ({symbol: bars}, e.g. intraday_bars_from_store, as bar_store records or a DataFrame with date,
+# open, high, low and volume) an entry fills on the first bar of its day and a limit exit on the first bar of its
+# fill day that reaches the limit, so the price and volume of that bar are used instead of the day's. Days without
+# bars fall back to the daily prices.
+class realistic_execution:
+    def __init__(self, commission=None, slippage=None, participation_cap=0.1, intraday_bars=None):
+        self.commission = commission or ib_tiered_commission()
+        self.slippage = slippage or spread_slippage()
+        self.participation_cap = participation_cap
+        self.intraday_bars = {symbol: _intraday_bars(records) for symbol, records in (intraday_bars or {}).items()}
+        # The bars go into the model's description as a hash of their contents.
+        digest = hashlib.sha256()
+        for symbol in sorted(self.intraday_bars):
+            bars = self.intraday_bars[symbol]
+            digest.update(symbol.encode())
+            for values in (bars.days, bars.open, bars.high, bars.low, bars.volume):
+                digest.update(np.ascontiguousarray(values).tobytes())
+        self._bars_digest = digest.hexdigest()[:16] if self.intraday_bars else None
+
+    def __repr__(self):
+        return f'realistic_execution(commission={execution_key(self.commission)}, ' \
+               f'slippage={execution_key(self.slippage)}, participation_cap={self.participation_cap!r}, ' \
+               f'intraday_bars={self._bars_digest})'
+
+    def apply(self, trades, hist):
+        arrays = trades.arrays()
+        symbols = trades.symbols
+        prices = arrays['Price'].copy()
+        sizes = arrays['Size'].copy()
+        commissions = np.zeros(len(trades))
+        if not len(trades):
+            return trades.with_fills(prices, sizes, commissions)
+
+        dates = hist.index.to_numpy()
+        market = {field: np.stack([hist[f'{symbol.lower()}_{field}'].to_numpy(dtype=np.float64)
+                                   for symbol in symbols])
+                  for field in ('Open', 'High', 'Low', 'Volume')}
+        symbol_codes = arrays['Symbol'].astype(np.intp)
+        days = np.minimum(np.searchsorted(dates, arrays['Date']), len(dates) - 1)
+        fill_days = days.copy()
+        sides = np.where(arrays['Action'] == BUY, 1.0, -1.0)
+
+        # ENTRIES
+        entries = np.flatnonzero(arrays['Trip'] == ENTRY)
+        opens = market['Open'][symbol_codes[entries], days[entries]]
+        volumes = market['Volume'][symbol_codes[entries], days[entries]]
+        for code, symbol in enumerate(symbols):
+            bars = self.intraday_bars.get(symbol)
+            if bars is not None:
+                rows = np.flatnonzero(symbol_codes[entries] == code)
+                start, end = bars.day_bars(dates[days[entries[rows]]])
+                found = rows[end > start]
+                first = start[end > start]
+                opens[found] = bars.open[first]
+                volumes[found] = bars.volume[first]
+        volumes = np.nan_to_num(volumes)
+        filled = np.minimum(sizes[entries], np.floor(self.participation_cap * volumes * 10000) / 10000)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            participation = np.where(volumes > 0, filled / volumes, 0)
+        prices[entries] = opens + sides[entries] * self.slippage(opens, participation)
+        sizes[entries] = filled
+
+        # EXITS
+        exits = np.flatnonzero(arrays['Trip'] != ENTRY)
+        exit_entries, _ = matching_entries(arrays, exits)
+        exits, exit_entries = exits[exit_entries >= 0], exit_entries[exit_entries >= 0]
+        sizes[exits] = sizes[exit_entries]
+
+        limit_exits = arrays['Status'][exits] == FILLED
+        rows, entry_rows = exits[limit_exits], exit_entries[limit_exits]
+        sells = sides[rows] < 0
+        limits = arrays['Price'][rows]
+        row_symbols = symbol_codes[rows]
+        # The engine looks for the fill from the entry day up to the order's expiry date.
+        start = row_symbols * len(dates) + days[entry_rows]
+        end = row_symbols * len(dates) + np.searchsorted(dates, arrays['Date'][rows], 'right')
+        first = first_limit_fill(market['High'].ravel(), market['Low'].ravel(), start, end, limits, sells)
+        reached = first >= 0
+        fill_days[rows[reached]] = first[reached] - row_symbols[reached] * len(dates)
+        fill_opens = np.where(reached, market['Open'].ravel()[np.maximum(first, 0)], limits)
+        for code, symbol in enumerate(symbols):
+            bars = self.intraday_bars.get(symbol)
+            if bars is not None:
+                in_symbol = np.flatnonzero((row_symbols == code) & reached)
+                bar_start, bar_end = bars.day_bars(dates[fill_days[rows[in_symbol]]])
+                bar = first_limit_fill(bars.high, bars.low, bar_start, bar_end, limits[in_symbol], sells[in_symbol])
+                fill_opens[in_symbol[bar >= 0]] = bars.open[bar[bar >= 0]]
+        prices[rows] = np.where(sells, np.maximum(limits, fill_opens), np.minimum(limits, fill_opens))
+
+        forced = exits[arrays['Status'][exits] == FORCED]
+        volumes = np.nan_to_num(market['Volume'][symbol_codes[forced], days[forced]])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            participation = np.where(volumes > 0, sizes[forced] / volumes, 0)
+        prices[forced] = prices[forced] + sides[forced] * self.slippage(prices[forced], participation)
+
+        # COMMISSIONS
+        filled_orders = np.isin(arrays['Status'], (FILLED, FORCED))
+        charged = filled_orders & (sizes > 0)
+        commissions[charged] = self.commission(dates[fill_days[charged]], sizes[charged],
+                                               prices[charged] * sizes[charged])
+        fill_dates = np.where(filled_orders, dates[fill_days], np.datetime64('NaT'))
+        return trades.with_fills(prices, sizes, commissions, fill_dates)
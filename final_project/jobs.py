@@ -0,0 +1,214 @@
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from final_project.algo_trading import load_data, run_backtest, get_stats
+from final_project.analytics import tear_sheet
+from final_project.sweep import PARAMETER_COLUMNS, parameter_key
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+# WORKERS
+
+# Queue the workers report progress on, as (job_id, fraction, message); set once per worker process.
+_worker_progress = None
+
+
+def _init_worker(progress):
+    global _worker_progress
+    _worker_progress = progress
+
+
+def _report(job_id, fraction, message):
+    if _worker_progress is not None:
+        _worker_progress.put((job_id, fraction, message))
+
+
+# The page_1 backtest: load_data, run_backtest, get_stats and the tear sheet for one set of parameters.
+def run_backtest_job(job_id, parameters):
+    _report(job_id, 0.1, 'Loading data')
+    hist = load_data(parameters['period'])
+    _report(job_id, 0.4, 'Running backtest')
+    blotter = run_backtest(hist, parameters['period'], parameters['lot'], parameters['gain_cap'],
+                           parameters['include_risk_free'], parameters['holding_period_cap'])
+    _report(job_id, 0.8, 'Computing statistics')
+    return {'blotter': blotter, 'stats': get_stats(hist, blotter), 'tear_sheet': tear_sheet(blotter, hist)}
+
+
+# JOB MANAGER
+
+class _job:
+    def __init__(self, job_id, key, parameters, cache_key=None):
+        self.job_id = job_id
+        self.key = key
+        self.parameters = parameters
+        self.cache_key = cache_key
+        self.state = QUEUED
+        self.progress = 0.0
+        self.message = 'Queued'
+        self.result = None
+        self.error = None
+        self.future = None
+        self.submitted = time.time()
+        self.finished = None
+
+    def status(self):
+        return {'job_id': self.job_id, 'parameters': self.parameters, 'state': self.state,
+                'progress': self.progress, 'message': self.message, 'error': self.error}
+
+
+# Runs backtests in a process pool, so the web server's threads only submit them and poll their progress. Every job
+# gets a job id; submitting parameters that are already queued, running or done gives back the job that has them
+# instead of running them again. Results are kept by parameters for the last max_results jobs.
+#
+# Workers report progress (a fraction and a message per stage) on a queue that a thread in this process reads.
+# cancel() takes a queued job out of the queue; a running one is marked cancelled and its result is dropped when
+# it comes in, as a worker can't be stopped halfway through.
+#
+# With a result_cache (a backtest_result_cache), parameters already computed on the same market data come back as a
+# finished job without going to the pool, and every result is added to the cache. Jobs are then also told apart by
+# the data's fingerprint, so a job run before the data changed isn't handed out again.
+class backtest_job_manager:
+    def __init__(self, max_workers=None, max_results=50, job_function=run_backtest_job, result_cache=None):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_results = max_results
+        self.job_function = job_function
+        self.result_cache = result_cache
+        self.jobs = OrderedDict()
+        self._by_key = {}
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._progress = None
+        self._progress_thread = None
+
+    def _start(self):
+        if self._executor is not None:
+            return
+        # This process runs the IB reader, journal writer and web server threads, and a forked child can deadlock on
+        # a lock one of them held at fork time. Workers load their own data, so fork would save nothing: they are
+        # started fresh, from a fork server where there is one.
+        start_methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in start_methods else 'spawn')
+        self._progress = context.Queue()
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                             initializer=_init_worker, initargs=(self._progress,))
+        self._progress_thread = threading.Thread(target=self._read_progress, daemon=True)
+        self._progress_thread.start()
+
+    def _keys(self, parameters):
+        cache_key = None if self.result_cache is None else self.result_cache.key(parameters)
+        return (parameter_key(parameters), cache_key), cache_key
+
+    def submit(self, parameters):
+        parameters = {column: parameters[column] for column in PARAMETER_COLUMNS}
+        key, cache_key = self._keys(parameters)
+        with self._lock:
+            job_id = self._by_key.get(key)
+            if job_id is not None and self.jobs[job_id].state not in (FAILED, CANCELLED):
+                return job_id
+        cached = None if self.result_cache is None else self.result_cache.get(cache_key)
+        with self._lock:
+            job = _job(f'{next(self._job_ids)}', key, parameters, cache_key)
+            self.jobs[job.job_id] = job
+            self._by_key[key] = job.job_id
+            if cached is not None:
+                job.state = DONE
+                job.progress = 1.0
+                job.message = 'Done (cached)'
+                job.result = cached
+                job.finished = time.time()
+            else:
+                self._start()
+                job.future = self._executor.submit(self.job_function, job.job_id, parameters)
+            self._forget_old_jobs()
+        if job.future is not None:
+            job.future.add_done_callback(lambda future: self._finish(job, future))
+        return job.job_id
+
+    def _forget_old_jobs(self):
+        finished = [job for job in self.jobs.values() if job.state in FINISHED_STATES]
+        for job in finished[:max(0, len(finished) - self.max_results)]:
+            del self.jobs[job.job_id]
+            if self._by_key.get(job.key) == job.job_id:
+                del self._by_key[job.key]
+
+    def _finish(self, job, future):
+        with self._lock:
+            job.finished = time.time()
+            if job.state == CANCELLED or future.cancelled():
+                job.state = CANCELLED
+                job.message = 'Cancelled'
+                return
+            error = future.exception()
+            if error is not None:
+                job.state = FAILED
+                job.error = repr(error)
+                job.message = f'Failed: {error}'
+                return
+            job.result = future.result()
+            job.state = DONE
+            job.progress = 1.0
+            job.message = 'Done'
+        if self.result_cache is not None:
+            self.result_cache.put(job.cache_key, job.result)
+
+    def _read_progress(self):
+        while True:
+            try:
+                update = self._progress.get()
+            except (EOFError, OSError):
+                return
+            if update is None:
+                return
+            job_id, fraction, message = update
+            with self._lock:
+                job = self.jobs.get(job_id)
+                if job is not None and job.state in (QUEUED, RUNNING):
+                    job.state = RUNNING
+                    job.progress = fraction
+                    job.message = message
+
+    def status(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else job.status()
+
+    def result(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else job.result
+
+    def result_for(self, parameters):
+        key, _ = self._keys(parameters)
+        with self._lock:
+            job_id = self._by_key.get(key)
+            return None if job_id is None else self.jobs[job_id].result
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.state in FINISHED_STATES:
+                return False
+            job.state = CANCELLED
+            job.message = 'Cancelled'
+        job.future.cancel()
+        return True
+
+    def shutdown(self, wait=True):
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        self._progress.put(None)
+        if wait:
+            self._progress_thread.join()
+        self._executor = None
@@ -0,0 +1,279 @@
+from collections import deque
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import logging
+import threading
+import time
+import numpy as np
+import pandas as pd
+from pandas.tseries.offsets import BDay
+from ibapi.order import Order
+from interactive_trader.streaming import market_data_stream
+from final_project.algo_trading import BLOTTER_COLUMNS
+from final_project.signal_engine import pairs_signal_engine
+
+LIVE_BLOTTER_COLUMNS = BLOTTER_COLUMNS + ['OrderId']
+
+logger = logging.getLogger(__name__)
+
+
+# Builds bars of bar_seconds from IB's 5 second real-time bars, per symbol. A bar is complete when a 5 second bar
+# of the next interval comes in; once every symbol has completed it, on_bar(date, bars) gets the bars of all of
+# them as {symbol: (open, high, low, close, volume)}. Call flush() at a known close (e.g. end of the trading day) to
+# hand over the current bars without waiting for the next interval.
+#
+# Intervals are counted in time_zone's local time (UTC when None), so daily bars are the exchange's trading dates,
+# as in the backtest's data, and the dates on_bar gets are local too.
+class bar_aggregator:
+    def __init__(self, symbols, bar_seconds, on_bar, time_zone=None):
+        self.symbols = list(symbols)
+        self.bar_seconds = bar_seconds
+        self.on_bar = on_bar
+        self.time_zone = ZoneInfo(time_zone) if time_zone else None
+        self._current = {}
+        self._completed = {}
+        self._lock = threading.Lock()
+
+    # record is a REALTIME_BAR_DTYPE row: (time, open, high, low, close, volume, wap, count).
+    def add(self, symbol, record):
+        seconds = int(record[0])
+        if self.time_zone is not None:
+            seconds += int(datetime.fromtimestamp(seconds, self.time_zone).utcoffset().total_seconds())
+        interval = seconds // self.bar_seconds
+        ready = None
+        with self._lock:
+            current = self._current.get(symbol)
+            if current is not None and current[0] != interval:
+                self._completed.setdefault(current[0], {})[symbol] = current[1]
+                current = None
+                ready = self._pop_ready()
+            if current is None:
+                self._current[symbol] = (interval, [record[1], record[2], record[3], record[4], record[5]])
+            else:
+                bar = current[1]
+                bar[1] = max(bar[1], record[2])
+                bar[2] = min(bar[2], record[3])
+                bar[3] = record[4]
+                bar[4] += record[5]
+        if ready is not None:
+            self._emit(*ready)
+
+    def _pop_ready(self):
+        for interval in sorted(self._completed):
+            if len(self._completed[interval]) == len(self.symbols):
+                return interval, self._completed.pop(interval)
+        return None
+
+    def flush(self):
+        with self._lock:
+            for symbol, (interval, bar) in self._current.items():
+                self._completed.setdefault(interval, {})[symbol] = bar
+            self._current = {}
+            ready = self._pop_ready()
+        if ready is not None:
+            self._emit(*ready)
+
+    def _emit(self, interval, bars):
+        date = pd.Timestamp(interval * self.bar_seconds, unit='s')
+        self.on_bar(date, {symbol: tuple(bars[symbol]) for symbol in self.symbols})
+
+
+# Runs the pairs strategy live over one connection (an ibkr_app that is already connected, e.g. an ibkr_session's).
+# Bars update a pairs_signal_engine; the engine's indicators decide entries, and the rules of run_backtest are
+# applied to the live orders:
+#
+#   - corr_coef < 0 on a bar's close while no position is open (and none closed on that bar): MKT entries for both
+#     legs, sized from the close in whole shares (see entry_size);
+#   - as each entry fills: a GTC LMT exit gain_cap away from the fill price, expiring holding_period_cap business
+#     days after the fill date;
+#   - a bar dated after an exit's expiry cancels the LMT and, once IB confirms the cancel, sends a MKT exit
+#     (the forced exit).
+#
+# Bars are built from regular trading hours only, by trading date in time_zone (the exchange's, e.g. the
+# time_zone_id of fetch_contract_details), so they match the daily bars the rules were backtested on.
+#
+# Every order and fill goes into the live blotter, in the backtest's format plus the order id. The time from a bar
+# closing to the first order it triggers going out is kept in latencies; latency_target_sec is the budget, and
+# orders over it are counted in late_orders.
+class live_strategy_runner:
+    def __init__(self, app, contracts, engine=None, latency_target_sec=0.05, bar_seconds=86400, account='',
+                 today=None, time_zone='America/New_York'):
+        self.app = app
+        self.contracts = dict(contracts)
+        self.symbols = list(self.contracts)
+        self.engine = engine or pairs_signal_engine(self.symbols)
+        self.latency_target_sec = latency_target_sec
+        self.bar_seconds = bar_seconds
+        self.account = account
+        self.today = today or (lambda: pd.Timestamp.now(time_zone).tz_localize(None).normalize())
+        self.blotter = []
+        self.orders = {}
+        self.legs = {}
+        self.latencies = deque(maxlen=10000)
+        self.late_orders = 0
+        self.errors = []
+        self.stream = None
+        self.aggregator = bar_aggregator(self.symbols, bar_seconds, self.on_bar, time_zone)
+        self._open_at_last_bar = False
+        self._bar_closed_at = None
+        self._interest_rate = None
+        self._lock = threading.RLock()
+
+    # BARS FROM IB
+    def start(self):
+        self.stream = market_data_stream(self.app)
+        keys = {}
+        for symbol, contract in self.contracts.items():
+            keys[self.stream.key(contract)] = symbol
+            self.stream.subscribe(contract, realtime_bars=True, useRTH=True)
+
+        def on_stream(key, kind, record):
+            if kind == 'bar' and key in keys:
+                self.aggregator.add(keys[key], record)
+
+        self.stream.add_callback(on_stream)
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    @property
+    def position_open(self):
+        return bool(self.legs)
+
+    # STRATEGY
+    def on_bar(self, date, bars, interest_rate=None, closed_at=None):
+        closed_at = time.perf_counter() if closed_at is None else closed_at
+        with self._lock:
+            self.engine.on_bar(date, bars, interest_rate)
+            self._bar_closed_at = closed_at
+            self._interest_rate = interest_rate
+            date = pd.Timestamp(date)
+            for symbol, leg in list(self.legs.items()):
+                if leg['exit_order_id'] is not None and not leg['forcing'] and leg['expiry_date'] < date:
+                    leg['forcing'] = True
+                    self._record_latency()
+                    self.app.cancelOrder(leg['exit_order_id'], '')
+            if not self.position_open and not self._open_at_last_bar and self.engine.corr_coef < 0:
+                closes = {symbol: np.float64(bars[symbol][3]) for symbol in self.symbols}
+                sizes = {symbol: self.entry_size(close) for symbol, close in closes.items()}
+                if not all(sizes.values()):
+                    logger.warning('entry on %s skipped, a lot of %s buys less than one share of %s', date.date(),
+                                   self.lot, [symbol for symbol, size in sizes.items() if not size])
+                    sizes = {}
+                for symbol, action in zip(self.symbols, self.engine.directions() if sizes else ()):
+                    size = sizes[symbol]
+                    backtest_size = round(self.lot / closes[symbol], 4)
+                    logger.debug('%s entry of %s shares, %s in the backtest (%+.2f of value)', symbol, size,
+                                 backtest_size, (size - backtest_size) * closes[symbol])
+                    order_id = self._submit(self.today(), symbol, 'ENTRY', action, 'MKT', size, status='SUBMITTED')
+                    self.legs[symbol] = {'entry_order_id': order_id, 'exit_order_id': None, 'action': action,
+                                         'size': size, 'backtest_size': backtest_size, 'expiry_date': None,
+                                         'forcing': False}
+            self._open_at_last_bar = self.position_open
+            self._bar_closed_at = None
+
+    @property
+    def lot(self):
+        return self.engine.lot
+
+    # IB takes stock orders in whole shares, so the backtest's lot / close (kept to 4 decimals) is rounded to the
+    # nearest share; 0 when the lot doesn't buy one, and the entry is skipped. The backtest's size is kept on the leg
+    # (and logged at debug level), as the live legs are worth a little more or less than the backtest's.
+    def entry_size(self, close):
+        return int(round(round(self.lot / np.float64(close), 4)))
+
+    # ORDERS
+    def _submit(self, date, symbol, trip, action, order_type, size, price=None, status='SUBMITTED'):
+        order = Order()
+        order.action = action
+        order.orderType = order_type
+        order.totalQuantity = size
+        order.tif = 'GTC' if order_type == 'LMT' else 'DAY'
+        if price is not None:
+            order.lmtPrice = price
+        if self.account:
+            order.account = self.account
+        order_id = self.app.next_request_id()
+        trade = dict(zip(LIVE_BLOTTER_COLUMNS, (date, symbol, trip, action, price, size, status, order_id)))
+        self.blotter.append(trade)
+        self.orders[order_id] = trade
+        self.app.add_stream_handler(order_id, self)
+        self.app.placeOrder(order_id, self.contracts[symbol], order)
+        if self._bar_closed_at is not None:
+            self._record_latency()
+        return order_id
+
+    def _record_latency(self):
+        if self._bar_closed_at is None:
+            return
+        latency = time.perf_counter() - self._bar_closed_at
+        # Only the first order of a bar counts; the rest go out right behind it.
+        self._bar_closed_at = None
+        self.latencies.append(latency)
+        if latency > self.latency_target_sec:
+            self.late_orders += 1
+            logger.warning('order sent %.1f ms after the bar closed (target %.1f ms)', latency * 1000,
+                           self.latency_target_sec * 1000)
+
+    def latency_stats(self):
+        if not self.latencies:
+            return {'orders': 0, 'late_orders': self.late_orders}
+        latencies = np.array(self.latencies)
+        return {'orders': len(latencies), 'late_orders': self.late_orders,
+                'p50_ms': float(np.percentile(latencies, 50) * 1000),
+                'p99_ms': float(np.percentile(latencies, 99) * 1000),
+                'max_ms': float(latencies.max() * 1000)}
+
+    # Called by ibkr_app on the API thread for every status change of the runner's orders.
+    def on_order_status(self, order_id, status, filled, avg_fill_price):
+        with self._lock:
+            trade = self.orders.get(order_id)
+            if trade is None:
+                return
+            symbol = trade['Symbol']
+            leg = self.legs.get(symbol)
+            if status == 'Filled':
+                self.app.remove_stream_handler(order_id)
+                trade['Price'] = avg_fill_price
+                trade['Size'] = filled
+                if trade['Trip'] == 'ENTRY':
+                    trade['Date'] = self.today()
+                if trade['Status'] != 'FORCED':
+                    trade['Status'] = 'FILLED'
+                if leg is None:
+                    return
+                if order_id == leg['entry_order_id']:
+                    self._place_exit(symbol, leg, avg_fill_price, filled)
+                elif trade['Trip'] == 'EXIT':
+                    del self.legs[symbol]
+            elif status in ('Cancelled', 'ApiCancelled', 'Inactive'):
+                self.app.remove_stream_handler(order_id)
+                if trade['Status'] in ('PENDING', 'SUBMITTED'):
+                    trade['Status'] = 'CANCELED'
+                if leg is not None and order_id == leg['entry_order_id']:
+                    # An entry IB didn't take leaves nothing to exit on that leg.
+                    del self.legs[symbol]
+                elif leg is not None and order_id == leg['exit_order_id'] and leg['forcing']:
+                    exit_order = self.orders[order_id]
+                    leg['exit_order_id'] = self._submit(self.today(), symbol, 'EXIT', exit_order['Action'], 'MKT',
+                                                        exit_order['Size'], status='FORCED')
+
+    def _place_exit(self, symbol, leg, fill_price, size):
+        gain_cap = self.engine.gain_cap
+        if self.engine.include_risk_free and self._interest_rate is not None:
+            gain_cap += self._interest_rate
+        exit_action = 'SELL' if leg['action'] == 'BUY' else 'BUY'
+        exit_price = fill_price * (1 + gain_cap) if exit_action == 'SELL' else fill_price * (1 - gain_cap)
+        entry_date = self.today()
+        leg['expiry_date'] = entry_date + BDay(self.engine.holding_period_cap)
+        leg['exit_order_id'] = self._submit(leg['expiry_date'], symbol, 'EXIT', exit_action, 'LMT', size,
+                                            round(exit_price, 2), status='PENDING')
+
+    def on_error(self, order_id, error_code, error_string):
+        with self._lock:
+            self.errors.append((order_id, error_code, error_string))
+
+    def blotter_frame(self):
+        return pd.DataFrame(self.blotter, columns=LIVE_BLOTTER_COLUMNS)
@@ -0,0 +1,109 @@
+import gzip
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from final_project.algo_trading import market_data_paths
+from final_project.sweep import parameter_key
+
+
+# Hash of the contents of data.csv and risk_free.csv under file_path. The files are only read again when their size
+# or modification time changes.
+class data_fingerprint:
+    def __init__(self):
+        self._stats = None
+        self._fingerprint = None
+        self._lock = threading.Lock()
+
+    def __call__(self, file_path):
+        paths = market_data_paths(file_path)
+        stats = tuple((os.path.abspath(path), os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in paths)
+        with self._lock:
+            if stats != self._stats:
+                digest = hashlib.sha256()
+                for path in paths:
+                    with open(path, 'rb') as f:
+                        for block in iter(lambda: f.read(1 << 20), b''):
+                            digest.update(block)
+                    digest.update(b'\0')
+                self._fingerprint = digest.hexdigest()
+                self._stats = stats
+            return self._fingerprint
+
+
+# Results of backtests (whatever the caller computes for a set of parameters, e.g. run_backtest_job's blotter and
+# stats) keyed by the fingerprint of the market data files and the parameters. The last max_entries results are kept
+# in memory; with directory they are also written there as gzipped pickles, which every thread and process sharing
+# the directory reads, and which survive a restart. A result computed from other file contents has another key, so
+# changing the files under ITA_DATA_PATH is enough to stop old results from being used.
+class backtest_result_cache:
+    def __init__(self, max_entries=64, directory=None, fingerprint=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.fingerprint = fingerprint or data_fingerprint()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # The cache key for parameters on the data under file_path (ITA_DATA_PATH by default), or None when the data
+    # can't be read, in which case nothing is cached.
+    def key(self, parameters, file_path=None):
+        file_path = file_path or os.getenv('ITA_DATA_PATH')
+        if file_path is None:
+            return None
+        try:
+            fingerprint = self.fingerprint(file_path)
+        except OSError:
+            return None
+        return hashlib.sha256(repr((fingerprint, parameter_key(parameters))).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.pkl.gz')
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                return result
+        if self.directory is None:
+            return None
+        try:
+            with gzip.open(self._path(key), 'rb') as f:
+                result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        self._remember(key, result)
+        return result
+
+    def put(self, key, result):
+        if key is None:
+            return
+        self._remember(key, result)
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            temporary = f'{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with gzip.open(temporary, 'wb', compresslevel=6) as f:
+                pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self._path(key))
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, parameters, compute, file_path=None):
+        key = self.key(parameters, file_path)
+        result = self.get(key)
+        if result is None:
+            result = compute(parameters)
+            self.put(key, result)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
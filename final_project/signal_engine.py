@@ -0,0 +1,217 @@
+from collections import deque
+import numpy as np
+import pandas as pd
+from pandas.tseries.offsets import BDay
+from final_project.algo_trading import PERIOD, LOT, GAIN_CAP, INCLUDE_RISK_FREE, HOLDING_PERIOD_CAP, \
+    BLOTTER_COLUMNS, SYMBOLS, trades_to_blotter
+
+
+# Correlation of the last `period` pairs of values from running sums over a ring buffer: every update adds the new
+# pair and takes out the one falling out of the window. The sums are kept relative to a shift taken from the window
+# and are recomputed from the buffer every time it wraps around, so rounding can't build up over a long session.
+class rolling_correlation:
+    def __init__(self, period):
+        self.period = period
+        self._x = np.full(period, np.nan)
+        self._y = np.full(period, np.nan)
+        self._count = 0
+        self._position = 0
+        self._recompute()
+
+    def _recompute(self):
+        valid = ~(np.isnan(self._x) | np.isnan(self._y))
+        self._valid = int(valid.sum())
+        self._shift_x = self._x[valid][0] if self._valid else 0.0
+        self._shift_y = self._y[valid][0] if self._valid else 0.0
+        dx = self._x[valid] - self._shift_x
+        dy = self._y[valid] - self._shift_y
+        self._sx, self._sy = dx.sum(), dy.sum()
+        self._sxx, self._syy, self._sxy = (dx * dx).sum(), (dy * dy).sum(), (dx * dy).sum()
+
+    def _add(self, x, y, sign):
+        if np.isnan(x) or np.isnan(y):
+            return
+        dx = x - self._shift_x
+        dy = y - self._shift_y
+        self._valid += sign
+        self._sx += sign * dx
+        self._sy += sign * dy
+        self._sxx += sign * dx * dx
+        self._syy += sign * dy * dy
+        self._sxy += sign * dx * dy
+
+    def update(self, x, y):
+        position = self._position
+        self._add(self._x[position], self._y[position], -1)
+        self._x[position] = x
+        self._y[position] = y
+        self._add(x, y, 1)
+        self._count += 1
+        self._position = (position + 1) % self.period
+        if self._position == 0:
+            self._recompute()
+        return self.value
+
+    # NaN until the window holds `period` valid pairs, like rolling(period).corr.
+    @property
+    def value(self):
+        n = self._valid
+        if n < self.period:
+            return np.nan
+        covariance = self._sxy - self._sx * self._sy / n
+        variance_x = self._sxx - self._sx * self._sx / n
+        variance_y = self._syy - self._sy * self._sy / n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return covariance / np.sqrt(variance_x * variance_y)
+
+
+# Negative-return counts and negative-volume shares of one symbol over the bars dated within period - 1 business
+# days of the latest one, the window get_position_direction(2) looks at. Bars leaving the window are subtracted from
+# running sums. Volumes are whole numbers, so the sums stay exact.
+class direction_window:
+    def __init__(self, period):
+        self.period = period
+        self.bars = deque()
+        self.negative_count = 0
+        self.negative_volume = 0
+        self.total_volume = 0
+
+    def update(self, date, log_return, volume):
+        negative = bool(log_return < 0)
+        volume = 0 if np.isnan(volume) else volume
+        self.bars.append((date, negative, volume))
+        self.negative_count += negative
+        self.negative_volume += volume if negative else 0
+        self.total_volume += volume
+        first_date = date - BDay(self.period - 1)
+        while self.bars[0][0] < first_date:
+            _, old_negative, old_volume = self.bars.popleft()
+            self.negative_count -= old_negative
+            self.negative_volume -= old_volume if old_negative else 0
+            self.total_volume -= old_volume
+
+    @property
+    def negative_share(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.float64(self.negative_volume) / np.float64(self.total_volume)
+
+
+# The pairs strategy of run_backtest fed one bar at a time, for live trading. Every bar updates the rolling
+# correlation and the direction windows in O(1) and applies the same rules in the same order as run_backtest:
+#
+#   - a bar with corr_coef < 0 while no position is open signals an entry (entry_signal holds the directions);
+#   - the next bar enters both legs at its open and places their LMT exits, which expire holding_period_cap
+#     business days later;
+#   - each bar fills pending exits its high/low reaches, and turns exits whose expiry date has passed into forced
+#     MKT exits at its close (before looking at fills);
+#   - no entry is signalled on the bar a position closes.
+#
+# on_bar returns the trades the bar produced (entries, exits, forced exits, exits that filled); blotter() gives all
+# of them in run_backtest's format. Fed the same bars, it gives the same blotter; only a corr_coef within rounding
+# error of zero could come out with a different sign.
+class pairs_signal_engine:
+    def __init__(self, symbols=SYMBOLS, period=PERIOD, lot=LOT, gain_cap=GAIN_CAP,
+                 include_risk_free=INCLUDE_RISK_FREE, holding_period_cap=HOLDING_PERIOD_CAP):
+        self.symbols = list(symbols)
+        self.period = period
+        self.lot = lot
+        self.gain_cap = gain_cap
+        self.include_risk_free = include_risk_free
+        self.holding_period_cap = holding_period_cap
+        self.correlation = rolling_correlation(period)
+        self.windows = [direction_window(period) for _ in self.symbols]
+        self.last_closes = [np.nan for _ in self.symbols]
+        self.corr_coef = np.nan
+        self.entry_signal = None
+        self.pending_exits = []
+        self.trades = []
+        self.date = None
+
+    @property
+    def position_open(self):
+        return bool(self.pending_exits)
+
+    # The directions get_position_direction2 gives on the current window.
+    def directions(self):
+        shares = [window.negative_share for window in self.windows]
+        first_direction = 'BUY' if (shares[0] >= shares[1]) else 'SELL'
+        second_direction = 'SELL' if (first_direction == 'BUY') else 'BUY'
+        return [first_direction, second_direction]
+
+    # bars maps each symbol to its (open, high, low, close, volume); interest_rate is the day's rate as a fraction,
+    # only needed with include_risk_free.
+    def on_bar(self, date, bars, interest_rate=None):
+        date = pd.Timestamp(date)
+        self.date = date
+        bars = [tuple(np.float64(value) for value in bars[symbol]) for symbol in self.symbols]
+        new_trades = []
+
+        for leg, (open_, high, low, close, volume) in enumerate(bars):
+            log_return = np.log(close) - np.log(self.last_closes[leg])
+            self.windows[leg].update(date, log_return, volume)
+            self.last_closes[leg] = close
+        self.corr_coef = self.correlation.update(bars[0][3], bars[1][3])
+
+        was_open = self.position_open
+        if self.entry_signal is not None:
+            new_trades.extend(self._enter(date, bars, interest_rate))
+            was_open = True
+        if was_open:
+            new_trades.extend(self._check_exits(date, bars))
+        elif self.corr_coef < 0:
+            self.entry_signal = self.directions()
+        return new_trades
+
+    def _enter(self, date, bars, interest_rate):
+        directions = self.entry_signal
+        self.entry_signal = None
+        exit_date = date + BDay(self.holding_period_cap)
+        entries = []
+        exits = []
+        for leg, symbol in enumerate(self.symbols):
+            open_price = bars[leg][0]
+            size = round(self.lot / open_price, 4)
+            entries.append(self._trade(date, symbol, 'ENTRY', directions[leg], open_price, size, 'FILLED'))
+            exit_action = 'SELL' if directions[leg] == 'BUY' else 'BUY'
+            risk_free = interest_rate if self.include_risk_free else None
+            if exit_action == 'SELL':
+                exit_price = open_price * (1 + self.gain_cap + risk_free) if self.include_risk_free \
+                    else open_price * (1 + self.gain_cap)
+            else:
+                exit_price = open_price * (1 - self.gain_cap - risk_free) if self.include_risk_free \
+                    else open_price * (1 - self.gain_cap)
+            exits.append(self._trade(exit_date, symbol, 'EXIT', exit_action, round(exit_price, 2), size,
+                                     'PENDING'))
+        # Both entries go in the blotter before the exits, as in run_backtest.
+        self.trades.extend(entries + exits)
+        self.pending_exits = list(exits)
+        return entries + exits
+
+    def _check_exits(self, date, bars):
+        changed = []
+        for exit_trade in list(self.pending_exits):
+            leg = self.symbols.index(exit_trade['Symbol'])
+            _, high, low, close, _ = bars[leg]
+            if exit_trade['Date'] < date:
+                exit_trade['Status'] = 'CANCELED'
+                forced_trade = self._trade(date, exit_trade['Symbol'], 'EXIT', exit_trade['Action'], close,
+                                           exit_trade['Size'], 'FORCED')
+                self.trades.append(forced_trade)
+                changed.extend([exit_trade, forced_trade])
+            elif (exit_trade['Action'] == 'SELL' and high >= exit_trade['Price']) or \
+                    (exit_trade['Action'] == 'BUY' and low <= exit_trade['Price']):
+                exit_trade['Status'] = 'FILLED'
+                changed.append(exit_trade)
+            else:
+                continue
+            self.pending_exits.remove(exit_trade)
+        return changed
+
+    @staticmethod
+    def _trade(date, symbol, trip, action, price, size, status):
+        return dict(zip(BLOTTER_COLUMNS, (date, symbol, trip, action, price, size, status)))
+
+    def blotter(self):
+        trades = {column: [trade[column] for trade in self.trades] for column in BLOTTER_COLUMNS}
+        dates = np.array([date.to_datetime64() for date in trades['Date']])
+        return trades_to_blotter(trades, dates.dtype)
@@ -0,0 +1,203 @@
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from final_project.algo_trading import PERIOD, LOT, GAIN_CAP, INCLUDE_RISK_FREE, HOLDING_PERIOD_CAP, \
+    load_data, backtest_trades
+from final_project.analytics import TOTAL_COLUMNS, blotter_arrays, order_counts, symbol_totals, years_of
+from final_project.execution import NAIVE, execution_key
+
+PARAMETER_COLUMNS = ['period', 'lot', 'gain_cap', 'include_risk_free', 'holding_period_cap']
+# execution is the execution_key of the model the backtest was filled with.
+RESULT_COLUMNS = PARAMETER_COLUMNS + ['execution', 'entry_orders', 'filled_exit_orders', 'forced_exit_orders',
+                                      'amzn_gain_loss', 'wmt_gain_loss', 'total_gain_loss', 'gain_loss_per_year']
+
+
+# PARAMETER GRID
+def parameter_grid(periods=(PERIOD,), lots=(LOT,), gain_caps=(GAIN_CAP,), include_risk_free=(INCLUDE_RISK_FREE,),
+                   holding_period_caps=(HOLDING_PERIOD_CAP,)):
+    return [dict(zip(PARAMETER_COLUMNS, values))
+            for values in itertools.product(periods, lots, gain_caps, include_risk_free, holding_period_caps)]
+
+
+# Parameters without an execution were run with the naive one.
+def parameter_key(parameters):
+    execution = parameters.get('execution')
+    return (int(parameters['period']), float(parameters['lot']), float(parameters['gain_cap']),
+            str(parameters['include_risk_free']) == 'True', int(parameters['holding_period_cap']),
+            NAIVE if execution is None or pd.isna(execution) else str(execution))
+
+
+# The numbers get_stats prints, for one backtest. blotter can be a trade_blotter, which the workers pass so that no
+# DataFrame is built per backtest.
+def backtest_summary(hist, blotter, parameters):
+    arrays, symbols = blotter_arrays(blotter, TOTAL_COLUMNS)
+    counts = order_counts(arrays)
+    gain_loss = symbol_totals(arrays, symbols)['gain_loss']
+    amzn_gain_loss = gain_loss.get('AMZN', 0.0)
+    wmt_gain_loss = gain_loss.get('WMT', 0.0)
+    total_gain_loss = amzn_gain_loss + wmt_gain_loss
+    years = years_of(hist)
+    return dict(parameters,
+                entry_orders=counts['entry_orders'],
+                filled_exit_orders=counts['filled_exit_orders'],
+                forced_exit_orders=counts['forced_exit_orders'],
+                amzn_gain_loss=float(amzn_gain_loss),
+                wmt_gain_loss=float(wmt_gain_loss),
+                total_gain_loss=float(total_gain_loss),
+                gain_loss_per_year=float(total_gain_loss / years) if years else float('nan'))
+
+
+# WORKERS
+
+# hist for every period in the sweep and the execution model, set once per worker process. With the fork start
+# method the workers inherit the parent's frames without copying or pickling them; with spawn (Windows) they are
+# pickled once per worker rather than once per task.
+_worker_hists = None
+_worker_execution = None
+
+
+def _init_worker(hists, execution=None):
+    global _worker_hists, _worker_execution
+    _worker_hists = hists
+    _worker_execution = execution
+
+
+def _run_chunk(chunk):
+    results = []
+    for parameters in chunk:
+        hist = _worker_hists[parameters['period']]
+        trades = backtest_trades(hist, parameters['period'], parameters['lot'], parameters['gain_cap'],
+                                 parameters['include_risk_free'], parameters['holding_period_cap'],
+                                 _worker_execution)
+        results.append(backtest_summary(hist, trades, parameters))
+    return results
+
+
+# RESULTS FILE
+
+# Files written before the execution column existed hold naive results.
+def read_results(results_path):
+    if results_path is None or not os.path.exists(results_path) or os.path.getsize(results_path) == 0:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    results = pd.read_csv(results_path)
+    if 'execution' not in results:
+        results.insert(len(PARAMETER_COLUMNS), 'execution', NAIVE)
+    return results
+
+
+def rank_results(results):
+    return results.sort_values('total_gain_loss', ascending=False, kind='stable').reset_index(drop=True)
+
+
+# RUN SWEEP
+
+# Runs run_backtest for every parameter combination across a process pool and returns the results ranked by total
+# gain/loss. hist is loaded once per period (with loader, load_data by default) and handed to the workers.
+#
+# With results_path every result is appended to that CSV as soon as its chunk finishes, and combinations already in
+# the file are skipped, so an interrupted sweep picks up where it stopped when run again with the same path.
+# on_result(result) is called in the parent for every finished combination. execution is the execution model every
+# backtest is filled with (see final_project.execution); gain/loss is then net of commissions. Results are told
+# apart by the model's execution_key, so resuming with another model computes everything again and the results
+# returned are only those of this model.
+def run_sweep(parameters_list, results_path=None, max_workers=None, chunk_size=None, loader=load_data,
+              hists=None, on_result=None, execution=None):
+    key = execution_key(execution)
+    done = read_results(results_path)
+    done = done[done['execution'] == key]
+    done_keys = {parameter_key(row) for row in done.to_dict(orient='records')}
+    parameters_list = [dict({column: parameters[column] for column in PARAMETER_COLUMNS}, execution=key)
+                       for parameters in parameters_list]
+    todo = [parameters for parameters in parameters_list if parameter_key(parameters) not in done_keys]
+
+    if hists is None:
+        hists = {}
+    hists = {period: hists[period] if period in hists else loader(period)
+             for period in sorted({parameters['period'] for parameters in todo})}
+
+    max_workers = max_workers or os.cpu_count() or 1
+    if chunk_size is None:
+        # A few chunks per worker keeps them all busy to the end without a round trip per backtest.
+        chunk_size = max(1, len(todo) // (max_workers * 4))
+    chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+
+    new_results = []
+    results_file = None
+    writer = None
+    if results_path is not None and todo:
+        write_header = not os.path.exists(results_path) or os.path.getsize(results_path) == 0
+        if not write_header:
+            with open(results_path, newline='') as f:
+                header = next(csv.reader(f), [])
+            if header != RESULT_COLUMNS:
+                # A file from before the execution column: rewritten with it, so new rows line up.
+                read_results(results_path)[RESULT_COLUMNS].to_csv(results_path, index=False)
+        results_file = open(results_path, 'a', newline='')
+        writer = csv.DictWriter(results_file, fieldnames=RESULT_COLUMNS)
+        if write_header:
+            writer.writeheader()
+
+    def collect(chunk_results):
+        for result in chunk_results:
+            new_results.append(result)
+            if writer is not None:
+                writer.writerow(result)
+            if on_result is not None:
+                on_result(result)
+        if results_file is not None:
+            results_file.flush()
+
+    try:
+        if max_workers == 1:
+            _init_worker(hists, execution)
+            for chunk in chunks:
+                collect(_run_chunk(chunk))
+        elif chunks:
+            start_methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in start_methods else None)
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_worker,
+                                     initargs=(hists, execution)) as executor:
+                futures = [executor.submit(_run_chunk, chunk) for chunk in chunks]
+                for future in as_completed(futures):
+                    collect(future.result())
+    finally:
+        if results_file is not None:
+            results_file.close()
+
+    results = pd.DataFrame(new_results, columns=RESULT_COLUMNS)
+    if not done.empty:
+        results = pd.concat([done, results], ignore_index=True) if new_results else done
+    return rank_results(results)
+
+
+# COMMAND LINE
+#
+#   python -m final_project.sweep --periods 2 3 5 --gain-caps 0.05 0.1 --holding-period-caps 3 5 \
+#       --results sweep.csv
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Run the pairs backtest over a grid of parameters.')
+    parser.add_argument('--periods', type=int, nargs='+', default=[PERIOD])
+    parser.add_argument('--lots', type=float, nargs='+', default=[LOT])
+    parser.add_argument('--gain-caps', type=float, nargs='+', default=[GAIN_CAP])
+    parser.add_argument('--include-risk-free', choices=['True', 'False'], nargs='+',
+                        default=[str(INCLUDE_RISK_FREE)])
+    parser.add_argument('--holding-period-caps', type=int, nargs='+', default=[HOLDING_PERIOD_CAP])
+    parser.add_argument('--results', help='CSV the results are appended to; an existing file is resumed')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--top', type=int, default=20, help='number of best results to print')
+    args = parser.parse_args(args)
+
+    parameters_list = parameter_grid(args.periods, args.lots, args.gain_caps,
+                                     [value == 'True' for value in args.include_risk_free],
+                                     args.holding_period_caps)
+    results = run_sweep(parameters_list, args.results, args.workers)
+    print(results.head(args.top).to_string())
+    return results
+
+
+if __name__ == '__main__':
+    main()
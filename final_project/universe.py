@@ -0,0 +1,177 @@
+import itertools
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from final_project.algo_trading import PERIOD, LOT, GAIN_CAP, INCLUDE_RISK_FREE, HOLDING_PERIOD_CAP, \
+    SYMBOLS, backtest_calendar, backtest_pair, leg_arrays
+from final_project.blotter import trade_blotter
+
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+PAIR_RESULT_COLUMNS = ['symbol_a', 'symbol_b', 'entry_orders', 'filled_exit_orders', 'forced_exit_orders',
+                       'gain_loss_a', 'gain_loss_b', 'total_gain_loss']
+
+
+# UNIVERSE DATA
+
+# A universe is a panel: one row per date (oldest first) and MultiIndex columns (field, symbol), e.g.
+# panel['Close']['AMZN'] or panel['Close'] for the closes of every symbol.
+def panel_from_long(long_hist):
+    panel = long_hist.pivot_table(index='Date', columns='Symbol', values=FIELDS, aggfunc='last')
+    panel = panel.reindex(columns=FIELDS, level=0).sort_index()
+    return panel
+
+
+# Long CSV with one row per date and symbol: Date, Symbol, Open, High, Low, Close, Volume.
+def load_universe(path):
+    return panel_from_long(pd.read_csv(path, parse_dates=['Date']))
+
+
+# The panel for the hist load_data returns (amzn_* and wmt_* columns).
+def panel_from_hist(hist, symbols=SYMBOLS):
+    return pd.concat({field: pd.DataFrame({symbol: hist[f'{symbol.lower()}_{field}'] for symbol in symbols})
+                      for field in FIELDS}, axis=1)
+
+
+def log_returns(panel):
+    closes = panel['Close']
+    return np.log(closes) - np.log(closes.shift(1))
+
+
+# Every pair of symbols once, as (i, j) column positions with i < j.
+def all_pairs(symbol_count):
+    return np.array(list(itertools.combinations(range(symbol_count), 2)), dtype=np.intp).reshape(-1, 2)
+
+
+# ROLLING CORRELATIONS
+
+# Rolling correlation of every pair in pairs over windows of period rows, as rolling(period).corr gives it one pair
+# at a time. Windows are centered before multiplying, and for each block of dates the covariance matrices of all
+# symbols come out of one matmul; only the requested pairs are kept. Yields (first_row, correlations) with
+# correlations of shape (rows in the block, len(pairs)); the first period - 1 rows are NaN.
+def rolling_correlation_blocks(closes, period, pairs, max_block_values=2 ** 22):
+    closes = np.asarray(closes, dtype=np.float64)
+    row_count, symbol_count = closes.shape
+    pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+    first_rows = min(period - 1, row_count)
+    if first_rows:
+        yield 0, np.full((first_rows, len(pairs)), np.nan)
+    if row_count < period:
+        return
+    windows = sliding_window_view(closes, period, axis=0)
+    block_rows = max(1, max_block_values // max(symbol_count * max(symbol_count, period), len(pairs)))
+    for start in range(0, len(windows), block_rows):
+        block = windows[start:start + block_rows]
+        centered = block - block.mean(axis=2, keepdims=True)
+        covariances = np.matmul(centered, centered.transpose(0, 2, 1))
+        variances = np.diagonal(covariances, axis1=1, axis2=2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlations = covariances[:, pairs[:, 0], pairs[:, 1]] / \
+                np.sqrt(variances[:, pairs[:, 0]] * variances[:, pairs[:, 1]])
+        yield start + period - 1, correlations
+
+
+def rolling_correlations(closes, period, pairs):
+    return np.concatenate([block for _, block in rolling_correlation_blocks(closes, period, pairs)])
+
+
+# corr_coef < 0 for every pair and date as a (pairs, dates) boolean array, one row per pair; a few hundred tickers
+# give tens of thousands of pairs, so the correlations themselves are never kept for all of them at once.
+def negative_correlation_signals(closes, period, pairs):
+    signals = np.zeros((len(pairs), len(closes)), dtype=bool)
+    for first_row, correlations in rolling_correlation_blocks(closes, period, pairs):
+        signals[:, first_row:first_row + len(correlations)] = (correlations < 0).T
+    return signals
+
+
+# BACKTEST EVERY PAIR
+
+# Gain/loss and order counts of one pair as backtest_pair's trades come in, without keeping the blotter.
+class _pair_summary:
+    def __init__(self, symbol_a, symbol_b):
+        self.symbols = (symbol_a, symbol_b)
+        self.sales = [0.0, 0.0]
+        self.purchases = [0.0, 0.0]
+        self.entry_orders = 0
+        self.filled_exit_orders = 0
+        self.forced_exit_orders = 0
+
+    def add_trade(self, date, symbol, trip, action, price, size, status, fill_date=None):
+        if trip == 'ENTRY':
+            self.entry_orders += 1
+        elif status == 'FILLED':
+            self.filled_exit_orders += 1
+        elif status == 'FORCED':
+            self.forced_exit_orders += 1
+        if status == 'CANCELED':
+            return
+        leg = 0 if symbol == self.symbols[0] else 1
+        if action == 'SELL':
+            self.sales[leg] += price * size
+        else:
+            self.purchases[leg] += price * size
+
+    def result(self):
+        gain_loss = [self.sales[leg] - self.purchases[leg] for leg in (0, 1)]
+        return [self.symbols[0], self.symbols[1], self.entry_orders, self.filled_exit_orders,
+                self.forced_exit_orders, gain_loss[0], gain_loss[1], gain_loss[0] + gain_loss[1]]
+
+
+# Inputs every pair of the panel shares: the calendar, each symbol's price arrays and the interest rates.
+def _universe_arrays(panel, period, holding_period_cap, include_risk_free, interest_rate):
+    calendar = backtest_calendar(panel.index, period, holding_period_cap)
+    returns = log_returns(panel)
+    legs = {symbol: leg_arrays(*(panel[field][symbol] for field in FIELDS), returns[symbol])
+            for symbol in panel['Close'].columns}
+    interest_rates = None
+    if include_risk_free:
+        interest_rates = interest_rate.reindex(panel.index).to_numpy()
+    return calendar, legs, interest_rates
+
+
+# The pairs strategy for every pair in the panel (or the (symbol_a, symbol_b) pairs given), with the same rules as
+# run_backtest: symbol_a plays AMZN's part and symbol_b WMT's. The correlation signals of all pairs are computed
+# up front; each pair is then run by the same engine as run_backtest, keeping only its gain/loss and order counts.
+# A signal on the last date is ignored, as there is no next day to enter on. interest_rate is a Series by date,
+# only needed with include_risk_free. on_pair(result_row) is called as each pair finishes.
+#
+# Returns one row per pair, best total gain/loss first.
+def run_universe_backtest(panel, period=PERIOD, lot=LOT, gain_cap=GAIN_CAP, include_risk_free=INCLUDE_RISK_FREE,
+                          holding_period_cap=HOLDING_PERIOD_CAP, pairs=None, interest_rate=None, on_pair=None):
+    symbols = list(panel['Close'].columns)
+    if pairs is None:
+        pair_positions = all_pairs(len(symbols))
+    else:
+        pair_positions = np.array([(symbols.index(a), symbols.index(b)) for a, b in pairs],
+                                  dtype=np.intp).reshape(-1, 2)
+    calendar, legs, interest_rates = _universe_arrays(panel, period, holding_period_cap, include_risk_free,
+                                                      interest_rate)
+    signals = negative_correlation_signals(panel['Close'].to_numpy(), period, pair_positions)
+    signals[:, -1:] = False
+
+    results = []
+    for (i, j), pair_signals in zip(pair_positions, signals):
+        summary = _pair_summary(symbols[i], symbols[j])
+        backtest_pair(calendar, summary.symbols, [legs[symbols[i]], legs[symbols[j]]],
+                      np.flatnonzero(pair_signals), interest_rates, lot, gain_cap, include_risk_free,
+                      summary.add_trade)
+        result = summary.result()
+        results.append(result)
+        if on_pair is not None:
+            on_pair(result)
+
+    results = pd.DataFrame(results, columns=PAIR_RESULT_COLUMNS)
+    return results.sort_values('total_gain_loss', ascending=False, kind='stable').reset_index(drop=True)
+
+
+# Blotter of one pair of the universe, in run_backtest's format, to look into a pair the screen picked out.
+def run_pair_backtest(panel, symbol_a, symbol_b, period=PERIOD, lot=LOT, gain_cap=GAIN_CAP,
+                      include_risk_free=INCLUDE_RISK_FREE, holding_period_cap=HOLDING_PERIOD_CAP,
+                      interest_rate=None):
+    calendar, legs, interest_rates = _universe_arrays(panel[[(field, symbol) for field in FIELDS
+                                                             for symbol in (symbol_a, symbol_b)]],
+                                                      period, holding_period_cap, include_risk_free, interest_rate)
+    signals = negative_correlation_signals(panel['Close'][[symbol_a, symbol_b]].to_numpy(), period, [(0, 1)])
+    trades = trade_blotter(calendar[0].dtype)
+    backtest_pair(calendar, [symbol_a, symbol_b], [legs[symbol_a], legs[symbol_b]], np.flatnonzero(signals[0]),
+                  interest_rates, lot, gain_cap, include_risk_free, trades.add)
+    return trades.to_frame()
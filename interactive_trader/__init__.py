@@ -1,7 +1,21 @@
 from interactive_trader.synchronous_functions import fetch_managed_accounts
 from interactive_trader.synchronous_functions import fetch_historical_data
+from interactive_trader.synchronous_functions import fetch_historical_data_many
+from interactive_trader.synchronous_functions import fetch_historical_data_cached
 from interactive_trader.synchronous_functions import fetch_contract_details
 from interactive_trader.synchronous_functions import fetch_current_time
 from interactive_trader.synchronous_functions import fetch_matching_symbols
+from interactive_trader.synchronous_functions import warm_contract_cache
 from interactive_trader.synchronous_functions import place_order
 from interactive_trader.ibkr_app import ibkr_app
+from interactive_trader.session_pool import ibkr_session
+from interactive_trader.session_pool import ibkr_session_pool
+from interactive_trader.session_pool import get_session_pool
+from interactive_trader.bar_store import bar_store
+from interactive_trader.contract_cache import contract_cache
+from interactive_trader.streaming import market_data_stream
+from interactive_trader.async_client import ibkr_async_client
+from interactive_trader.connection_supervisor import connection_supervisor
+from interactive_trader.table_store import table_store
+from interactive_trader.table_store import ibkr_tables
+from interactive_trader.order_journal import order_journal
@@ -0,0 +1,207 @@
+from interactive_trader.session_pool import ibkr_session, allocate_client_id, \
+    release_client_id
+from interactive_trader.streaming import market_data_stream
+from interactive_trader.contract_cache import default_contract_cache
+from interactive_trader.ibkr_app import CURRENT_TIME_REQUEST
+from interactive_trader.exceptions import ibkr_request_error, \
+    ibkr_timeout_error
+from interactive_trader.pacing import MESSAGE_LIMIT, rolling_window_limit
+import asyncio
+import threading
+import time
+
+
+# Puts item on an asyncio.Queue from the event loop's side; a full queue
+# drops its oldest item so a slow consumer sees the newest data instead of
+# stalling the API thread.
+def _put_latest(queue, item):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(item)
+
+
+# asyncio counterpart of the synchronous functions over one long-lived
+# connection. Every request is a Future in ibkr_app's registry; the API
+# thread completes it and asyncio.wrap_future hands the result to the event
+# loop with call_soon_threadsafe, so any number of requests and
+# subscriptions can be outstanding without a thread waiting on each.
+#
+#     async with ibkr_async_client() as client:
+#         bars = await client.fetch_historical_data(contract)
+#         async for kind, record in client.stream_market_data(contract):
+#             ...
+class ibkr_async_client:
+    def __init__(self, hostname='127.0.0.1', port=7497, client_id=10645,
+                 timeout_sec=5, session=None, stream_queue_size=10000):
+        self.timeout_sec = timeout_sec
+        self.stream_queue_size = stream_queue_size
+        self._client_id = None
+        if session is None:
+            self._client_id = allocate_client_id(client_id)
+            session = ibkr_session(hostname, port, self._client_id,
+                                   timeout_sec)
+        self.session = session
+        self.app = session.app
+        self.market_data = market_data_stream(self.app)
+        self.market_data.add_callback(self._on_market_data)
+        self._stream_queues = {}
+        self._stream_lock = threading.Lock()
+        self._current_time = None
+        self._message_limit = rolling_window_limit(*MESSAGE_LIMIT)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # Connecting blocks on the socket handshake, so it runs in the loop's
+    # default executor.
+    async def connect(self):
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.session.connect
+        )
+
+    async def close(self):
+        self.market_data.close()
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.session.close
+        )
+        if self._client_id is not None:
+            release_client_id(self._client_id)
+            self._client_id = None
+
+    async def _wait_for(self, future, req_id, function_name, message):
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future),
+                                          self.timeout_sec)
+        except asyncio.TimeoutError:
+            self.app.forget_request(req_id)
+            raise ibkr_timeout_error(function_name, "timeout", message)
+
+    # Spaces sends out so a burst of coroutines can't go over the 50
+    # messages a second TWS allows.
+    async def _throttle(self):
+        delay = self._message_limit.delay(time.monotonic())
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._message_limit.delay(time.monotonic())
+        self._message_limit.record(time.monotonic())
+
+    async def fetch_managed_accounts(self):
+        received = await asyncio.get_running_loop().run_in_executor(
+            None, self.app.managed_accounts_event.wait, self.timeout_sec
+        )
+        if not received:
+            raise ibkr_timeout_error("fetch_managed_accounts", "timeout",
+                                     "managed_accounts not received")
+        return list(self.app.managed_accounts)
+
+    # reqCurrentTime has no reqId, so callers asking at the same time share
+    # one request.
+    async def fetch_current_time(self):
+        if self._current_time is None or self._current_time.done():
+            future = self.app.register_request(CURRENT_TIME_REQUEST)
+            await self._throttle()
+            self.app.reqCurrentTime()
+            self._current_time = future
+        return await self._wait_for(
+            self._current_time, CURRENT_TIME_REQUEST, "fetch_current_time",
+            "current_time not received"
+        )
+
+    # Goes through the session's historical_data_scheduler, which paces the
+    # request and times it out once sent. The scheduler's Future may be
+    # shared with other callers, so cancelling this coroutine must not
+    # cancel it.
+    async def fetch_historical_data(self, contract, endDateTime='',
+                                    durationStr='30 D',
+                                    barSizeSetting='1 hour',
+                                    whatToShow='MIDPOINT', useRTH=True,
+                                    priority=0):
+        return await asyncio.shield(asyncio.wrap_future(
+            self.session.historical_data_scheduler.submit(
+                contract, endDateTime, durationStr, barSizeSetting,
+                whatToShow, useRTH, priority
+            )
+        ))
+
+    async def fetch_contract_details(self, contract, use_cache=True):
+        cache = default_contract_cache()
+        if use_cache:
+            contract_details = cache.get_contract_details(contract)
+            if contract_details is not None:
+                return contract_details
+        await self._throttle()
+        req_id, future = self.app.request_contract_details(contract)
+        try:
+            contract_details = await self._wait_for(
+                future, req_id, "fetch_contract_details",
+                "contract_details not received"
+            )
+        except ibkr_request_error as error:
+            cache.put_contract_details_error(contract, error)
+            raise
+        cache.put_contract_details(contract, contract_details)
+        return contract_details
+
+    async def fetch_matching_symbols(self, pattern, use_cache=True):
+        cache = default_contract_cache()
+        if use_cache:
+            matching_symbols = cache.get_matching_symbols(pattern)
+            if matching_symbols is not None:
+                return matching_symbols
+        await self._throttle()
+        req_id, future = self.app.request_matching_symbols(pattern)
+        matching_symbols = await self._wait_for(
+            future, req_id, "fetch_matching_symbols",
+            "matching_symbols not received"
+        )
+        cache.put_matching_symbols(pattern, matching_symbols)
+        return matching_symbols
+
+    async def place_order(self, contract, order):
+        order_id = self.app.next_request_id()
+        future = self.app.register_request(order_id)
+        await self._throttle()
+        self.app.placeOrder(order_id, contract, order)
+        await self._wait_for(future, order_id, "place_order",
+                             "order_status not received")
+        order_status = self.app.order_status
+        return order_status[order_status['order_id'] == order_id] \
+            .reset_index(drop=True)
+
+    # Ticks and 5 second bars for contract as (kind, record) pairs, kind
+    # being 'tick' or 'bar'. The subscription stays open while any iterator
+    # on the contract is running and is cancelled when the last one ends.
+    async def stream_market_data(self, contract, generic_ticks='',
+                                 realtime_bars=False):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.stream_queue_size)
+        key = self.market_data.key(contract)
+        with self._stream_lock:
+            self._stream_queues.setdefault(key, []).append((loop, queue))
+        try:
+            await self._throttle()
+            self.market_data.subscribe(contract, generic_ticks,
+                                       realtime_bars)
+            while True:
+                yield await queue.get()
+        finally:
+            with self._stream_lock:
+                queues = self._stream_queues[key]
+                queues.remove((loop, queue))
+                last = not queues
+                if last:
+                    del self._stream_queues[key]
+            if last:
+                self.market_data.unsubscribe(contract)
+
+    # Runs on the API thread.
+    def _on_market_data(self, key, kind, record):
+        queues = self._stream_queues.get(key)
+        if not queues:
+            return
+        for loop, queue in list(queues):
+            loop.call_soon_threadsafe(_put_latest, queue, (kind, record))
@@ -0,0 +1,191 @@
+from interactive_trader.ibkr_app import HISTORICAL_DATA_COLUMNS
+from datetime import datetime, timedelta
+import json
+import math
+import os
+import re
+import threading
+import numpy as np
+import pandas as pd
+
+# One record per bar. Dates are stored as int64 nanoseconds so the files can
+# be memory-mapped and searched with np.searchsorted.
+BAR_DTYPE = np.dtype([
+    ('date', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'),
+    ('close', '<f8'), ('volume', '<f8'), ('bar_count', '<i8'),
+    ('average', '<f8')
+])
+
+DURATION_UNITS = {
+    'S': timedelta(seconds=1),
+    'D': timedelta(days=1),
+    'W': timedelta(weeks=1),
+    'M': timedelta(days=31),
+    'Y': timedelta(days=366)
+}
+
+
+def bar_store_key(contract, barSizeSetting, whatToShow, useRTH):
+    return (str(contract.conId or contract.symbol), contract.secType,
+            contract.currency, barSizeSetting, whatToShow, bool(useRTH))
+
+
+# IB durationStr ('30 D', '3600 S', '1 Y', ...) as a timedelta. Months and
+# years are rounded up, so a window computed from them never falls short.
+def parse_duration(durationStr):
+    amount, unit = durationStr.split()
+    return int(amount) * DURATION_UNITS[unit.upper()]
+
+
+# The shortest durationStr IB accepts that covers span.
+def format_duration(span):
+    seconds = max(math.ceil(span.total_seconds()), 1)
+    if seconds <= 86400:
+        return f'{seconds} S'
+    days = math.ceil(seconds / 86400)
+    if days <= 365:
+        return f'{days} D'
+    return f'{math.ceil(days / 365)} Y'
+
+
+# Bar dates as sent with formatDate=1: 'yyyymmdd' for daily bars and
+# 'yyyymmdd  hh:mm:ss' (newer TWS versions add a time zone name) for
+# intraday bars. Time zone names are dropped; dates stay in exchange time.
+def parse_bar_dates(dates):
+    dates = pd.Series(dates, dtype=object).astype(str)
+    if dates.empty:
+        return pd.Series(dates, dtype='datetime64[ns]')
+    parts = dates.str.split(expand=True)
+    if parts.shape[1] == 1:
+        return pd.to_datetime(parts[0], format='%Y%m%d')
+    return pd.to_datetime(parts[0] + ' ' + parts[1],
+                          format='%Y%m%d %H:%M:%S')
+
+
+def bars_to_records(historical_data):
+    records = np.empty(len(historical_data), dtype=BAR_DTYPE)
+    records['date'] = parse_bar_dates(historical_data['date']) \
+        .to_numpy(dtype='datetime64[ns]').view('<i8')
+    for column in BAR_DTYPE.names[1:]:
+        records[column] = pd.to_numeric(historical_data[column],
+                                        errors='coerce')
+    return records
+
+
+def records_to_bars(records):
+    bars = pd.DataFrame({
+        column: records[column] for column in BAR_DTYPE.names
+    }, columns=HISTORICAL_DATA_COLUMNS)
+    bars['date'] = records['date'].view('datetime64[ns]')
+    return bars
+
+
+# Bars kept on disk, one .npy file per (contract, barSizeSetting, whatToShow,
+# useRTH) plus a small .json with the time range the file is known to cover.
+# Files are read memory-mapped and only the requested slice is copied out,
+# so a warm read of a year of minute bars takes milliseconds.
+class bar_store:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+
+    def _path(self, key, extension):
+        name = '_'.join(str(part) for part in key)
+        name = re.sub(r'[^A-Za-z0-9.-]+', '_', name)
+        return os.path.join(self.directory, f'{name}.{extension}')
+
+    def coverage(self, key):
+        path = self._path(key, 'json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            covered = json.load(f)
+        return (pd.Timestamp(covered['from']), pd.Timestamp(covered['to']))
+
+    def read_records(self, key, start=None, end=None):
+        path = self._path(key, 'npy')
+        with self._lock:
+            if not os.path.exists(path):
+                return np.empty(0, dtype=BAR_DTYPE)
+            records = np.load(path, mmap_mode='r')
+            dates = records['date']
+            first = 0 if start is None else \
+                np.searchsorted(dates, pd.Timestamp(start).value, 'left')
+            last = len(dates) if end is None else \
+                np.searchsorted(dates, pd.Timestamp(end).value, 'right')
+            # Copying the slice lets the memory map close, so the file can
+            # be replaced by the next write (Windows refuses while it is
+            # mapped).
+            selected = np.array(records[first:last])
+            del records, dates
+        return selected
+
+    def read(self, key, start=None, end=None):
+        return records_to_bars(self.read_records(key, start, end))
+
+    # Merges bars into the file; where dates overlap the new bar wins, so a
+    # bar that was still forming when it was first stored gets replaced.
+    # covered_from / covered_to extend the range recorded as complete.
+    def write(self, key, historical_data, covered_from, covered_to):
+        new = historical_data if isinstance(historical_data, np.ndarray) \
+            else bars_to_records(historical_data)
+        with self._lock:
+            old = self.read_records(key)
+            merged = np.concatenate([new, old])
+            _, first_seen = np.unique(merged['date'], return_index=True)
+            merged = merged[first_seen]
+
+            coverage = self.coverage(key)
+            if coverage is not None:
+                covered_from = min(pd.Timestamp(covered_from), coverage[0])
+                covered_to = max(pd.Timestamp(covered_to), coverage[1])
+
+            path = self._path(key, 'npy')
+            temporary = path + '.tmp.npy'
+            np.save(temporary, merged)
+            os.replace(temporary, path)
+            with open(self._path(key, 'json'), 'w') as f:
+                json.dump({'from': pd.Timestamp(covered_from).isoformat(),
+                           'to': pd.Timestamp(covered_to).isoformat()}, f)
+
+    # The (end, durationStr) requests still needed to cover [start, end]
+    # given what the store already holds: the whole window if nothing is
+    # stored, otherwise only the part before and/or after the covered range.
+    # A window that doesn't touch the covered range is stretched up to it,
+    # so the covered range always stays in one piece.
+    def missing_requests(self, key, start, end):
+        coverage = self.coverage(key)
+        if coverage is None:
+            return [(end, format_duration(end - start))]
+        requests = []
+        if start < coverage[0]:
+            requests.append((coverage[0], format_duration(coverage[0] - start)))
+        if end > coverage[1]:
+            requests.append((end, format_duration(end - coverage[1])))
+        return requests
+
+
+_default_store = None
+
+
+def default_bar_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = bar_store(os.getenv(
+            'ITA_BAR_STORE_PATH',
+            os.path.join(os.path.expanduser('~'), '.interactive_trader', 'bars')
+        ))
+    return _default_store
+
+
+def format_end_date_time(timestamp):
+    return pd.Timestamp(timestamp).strftime('%Y%m%d %H:%M:%S')
+
+
+# The [start, end] a request asks for. TWS reads endDateTime in the time zone
+# of the machine running it, which is assumed to be this one.
+def request_window(endDateTime, durationStr, now=None):
+    end = pd.Timestamp(now or datetime.now()) if not endDateTime else \
+        pd.Timestamp(parse_bar_dates([endDateTime]).iloc[0])
+    return end - parse_duration(durationStr), end
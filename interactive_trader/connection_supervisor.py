@@ -0,0 +1,131 @@
+from interactive_trader.ibkr_app import ibkr_app
+import queue
+import threading
+
+CONNECTED = 'CONNECTED'
+CONNECTING = 'CONNECTING'
+DISCONNECTED = 'DISCONNECTED'
+
+_DISCONNECT = 'disconnect'
+_STOP = 'stop'
+
+
+# Keeps one ibkr_app connected from a background thread, so that callers
+# (e.g. Dash callbacks on waitress' worker threads) only hand over where to
+# connect and return at once. connect() queues the new target; commands that
+# come in within settle_sec of each other are coalesced into the last one,
+# so someone typing a port number causes one connection attempt instead of
+# one per keystroke, and a target the app is already connected to is left
+# alone. Every attempt (socket handshake and nextValidId) runs on the
+# supervisor's thread with timeout_sec.
+#
+# status is CONNECTED, CONNECTING, DISCONNECTED or the error of the last
+# attempt; status_sequence goes up with every change, for readers polling
+# it. With health_check_interval a connection that dropped is reconnected.
+class connection_supervisor:
+    def __init__(self, app=None, timeout_sec=5, settle_sec=0.5,
+                 health_check_interval=5):
+        self.app = app or ibkr_app()
+        self.timeout_sec = timeout_sec
+        self.settle_sec = settle_sec
+        self.health_check_interval = health_check_interval
+        self.target = None
+        self.connected_target = None
+        self.status = DISCONNECTED
+        self.status_sequence = 0
+        self.api_thread = None
+        self._commands = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                daemon=True)
+                self._thread.start()
+        return self
+
+    def connect(self, hostname, port, client_id):
+        self.start()
+        self._commands.put((hostname, int(port), int(client_id)))
+        return self.status
+
+    def disconnect(self):
+        self._commands.put(_DISCONNECT)
+
+    def stop(self, timeout=None):
+        self._commands.put(_STOP)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def is_healthy(self):
+        return self.app.isConnected() and self.api_thread is not None and \
+            self.api_thread.is_alive()
+
+    def _set_status(self, status):
+        if status != self.status:
+            self.status = status
+            self.status_sequence += 1
+
+    # The last command of a burst: waits until settle_sec passes without a
+    # new one.
+    def _next_command(self):
+        try:
+            command = self._commands.get(timeout=self.health_check_interval)
+        except queue.Empty:
+            return None
+        while command != _STOP:
+            try:
+                command = self._commands.get(timeout=self.settle_sec)
+            except queue.Empty:
+                break
+        return command
+
+    def _run(self):
+        while True:
+            command = self._next_command()
+            if command == _STOP:
+                self._disconnect()
+                return
+            if command == _DISCONNECT:
+                self.target = None
+                self._disconnect()
+            elif command is not None:
+                self.target = command
+            if self.target is None:
+                continue
+            if self.target != self.connected_target or not self.is_healthy():
+                self._connect(self.target)
+
+    def _connect(self, target):
+        self._disconnect()
+        self._set_status(CONNECTING)
+        app = self.app
+        hostname, port, client_id = target
+        try:
+            app.connect(hostname, port, client_id)
+        except Exception as e:
+            self._set_status(f"couldn't connect to IBKR: {e}")
+            return
+        if not app.isConnected():
+            self._set_status("couldn't connect to IBKR")
+            return
+        self.api_thread = threading.Thread(target=app.run, daemon=True)
+        self.api_thread.start()
+        if not app.wait_for_next_valid_id(self.timeout_sec):
+            self._disconnect()
+            self._set_status("next_valid_id not received")
+            return
+        self.connected_target = target
+        self._set_status(CONNECTED)
+
+    def _disconnect(self):
+        if self.app.isConnected():
+            self.app.disconnect()
+        if self.api_thread is not None:
+            self.api_thread.join(self.timeout_sec)
+        self.api_thread = None
+        self.connected_target = None
+        self._set_status(DISCONNECTED)
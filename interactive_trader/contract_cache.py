@@ -0,0 +1,180 @@
+from interactive_trader.exceptions import ibkr_request_error
+from collections import OrderedDict
+import atexit
+import os
+import pickle
+import threading
+import time
+
+# Codes TWS answers a contract query with when nothing matches. Those answers
+# are cached too (negative caching), so an unknown symbol typed again and
+# again doesn't go back to TWS every time.
+NOT_FOUND_ERROR_CODES = (200,)
+
+
+# LRU of at most max_size entries, each expiring ttl_sec after it was put.
+# Expiry uses wall-clock time so entries saved to disk stay valid across
+# restarts for as long as they would have in memory.
+class ttl_lru_cache:
+    def __init__(self, max_size=10000, ttl_sec=24 * 3600, clock=time.time):
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Returns (True, value) on a hit and (False, None) on a miss.
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires < self.clock():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def put(self, key, value, ttl_sec=None):
+        expires = self.clock() + (self.ttl_sec if ttl_sec is None else ttl_sec)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def items(self):
+        now = self.clock()
+        with self._lock:
+            return [(key, entry) for key, entry in self._entries.items()
+                    if entry[0] >= now]
+
+    def load_items(self, items):
+        now = self.clock()
+        with self._lock:
+            for key, entry in items:
+                if entry[0] >= now:
+                    self._entries[key] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+# Enough of a Contract to tell contracts apart without asking TWS; conId
+# alone when the contract has one.
+def contract_cache_key(contract):
+    if contract.conId:
+        return ('con_id', contract.conId)
+    return ('contract', contract.symbol, contract.secType, contract.exchange,
+            contract.primaryExchange, contract.currency,
+            contract.lastTradeDateOrContractMonth, contract.strike,
+            contract.right, contract.multiplier, contract.localSymbol)
+
+
+def _copy_error(error):
+    return ibkr_request_error(error.req_id, error.error_code,
+                              error.error_string)
+
+
+# Results of fetch_contract_details and fetch_matching_symbols. Contract
+# details are kept under the query they answered and under each matching
+# conId. Queries TWS found nothing for are kept for negative_ttl_sec and
+# raise an ibkr_request_error with the same code and message again. Frames go
+# in and come out as copies, so callers can change what they get without
+# changing the cache. With a path the cache is loaded from and saved to disk.
+class contract_cache:
+    def __init__(self, path=None, max_size=10000, ttl_sec=24 * 3600,
+                 symbols_ttl_sec=3600, negative_ttl_sec=600):
+        self.path = path
+        self.negative_ttl_sec = negative_ttl_sec
+        self.contract_details = ttl_lru_cache(max_size, ttl_sec)
+        self.matching_symbols = ttl_lru_cache(max_size, symbols_ttl_sec)
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def get_contract_details(self, contract):
+        found, details = self.contract_details.get(
+            contract_cache_key(contract)
+        )
+        if found and isinstance(details, ibkr_request_error):
+            # A new exception each time, so raising it doesn't pile this
+            # caller's traceback onto the cached one.
+            raise _copy_error(details)
+        return details.copy() if found else None
+
+    def put_contract_details(self, contract, details):
+        details = details.copy()
+        self.contract_details.put(contract_cache_key(contract), details)
+        if len(details) > 1:
+            for position in range(len(details)):
+                self.contract_details.put(
+                    ('con_id', int(details['con_id'].iloc[position])),
+                    details.iloc[[position]].reset_index(drop=True)
+                )
+        elif len(details) == 1:
+            self.contract_details.put(
+                ('con_id', int(details['con_id'].iloc[0])), details
+            )
+
+    # Returns True if the error was a not-found answer and got cached.
+    def put_contract_details_error(self, contract, error):
+        if getattr(error, 'error_code', None) not in NOT_FOUND_ERROR_CODES:
+            return False
+        self.contract_details.put(contract_cache_key(contract),
+                                  _copy_error(error), self.negative_ttl_sec)
+        return True
+
+    def get_matching_symbols(self, pattern):
+        found, symbols = self.matching_symbols.get(pattern.upper())
+        return symbols.copy() if found else None
+
+    def put_matching_symbols(self, pattern, symbols):
+        self.matching_symbols.put(
+            pattern.upper(), symbols.copy(),
+            self.negative_ttl_sec if symbols.empty else None
+        )
+
+    def clear(self):
+        self.contract_details.clear()
+        self.matching_symbols.clear()
+
+    def save(self):
+        if self.path is None:
+            return
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as f:
+            pickle.dump({
+                'contract_details': self.contract_details.items(),
+                'matching_symbols': self.matching_symbols.items()
+            }, f)
+        os.replace(temporary, self.path)
+
+    def load(self):
+        with open(self.path, 'rb') as f:
+            saved = pickle.load(f)
+        self.contract_details.load_items(saved['contract_details'])
+        self.matching_symbols.load_items(saved['matching_symbols'])
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+# Used by the synchronous functions. Set ITA_CONTRACT_CACHE_PATH to keep it
+# on disk between runs; it is saved when the process exits.
+def default_contract_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = contract_cache(
+                os.getenv('ITA_CONTRACT_CACHE_PATH')
+            )
+            atexit.register(_default_cache.save)
+    return _default_cache
@@ -0,0 +1,31 @@
+# Errors raised by interactive_trader. They carry the same
+# (function, reason, message) arguments the package has always raised plain
+# Exceptions with, so existing `except Exception` handlers keep working.
+class ibkr_error(Exception):
+    pass
+
+
+# The answer to a request didn't arrive in time.
+class ibkr_timeout_error(ibkr_error):
+    pass
+
+
+# The connection to TWS / Gateway couldn't be made or was lost.
+class ibkr_connection_error(ibkr_error):
+    pass
+
+
+# TWS answered a request with an error message for its reqId / orderId.
+class ibkr_request_error(ibkr_error):
+    def __init__(self, req_id, error_code, error_string):
+        super().__init__(req_id, error_code, error_string)
+        self.req_id = req_id
+        self.error_code = error_code
+        self.error_string = error_string
+
+
+# Codes TWS sends through error() that are notices, not failures: the
+# 21xx farm status / warning range, order warnings (399) and delayed data
+# notices (10167).
+def is_informational_error(error_code):
+    return 2100 <= error_code < 2200 or error_code in (399, 10167)
@@ -1,4 +1,3 @@
-
 import pandas as pd
 from ibapi.client import EClient
 from ibapi.wrapper import EWrapper
@@ -6,141 +5,453 @@ from ibapi.common import *
 from ibapi.contract import *
 from ibapi.order import *
 from ibapi.order_state import OrderState
+from ibapi.execution import Execution
+from interactive_trader.row_buffer import row_buffer, keyed_row_buffer, \
+    spill_to_csv
+from interactive_trader.exceptions import ibkr_connection_error, \
+    ibkr_request_error, is_informational_error
+from concurrent.futures import Future
 from datetime import datetime
+import os
+import sys
+import threading
+
+# Key for reqCurrentTime in the request registry; it's the only request that
+# doesn't take a reqId.
+CURRENT_TIME_REQUEST = 'current_time'
+
+# Order statuses that end the wait in place_order. Orders TWS holds until
+# they can be routed (outside regular hours, simulated order types, ...) stay
+# PreSubmitted, which is an acknowledgement all the same.
+ORDER_SUBMITTED_STATUSES = ('PreSubmitted', 'Submitted', 'Filled')
+ORDER_CANCELLED_STATUSES = ('Cancelled', 'ApiCancelled')
+
+ERROR_MESSAGES_COLUMNS = ['reqId', 'errorCode', 'errorString']
+HISTORICAL_DATA_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume',
+                           'bar_count', 'average']
+CONTRACT_DETAILS_COLUMNS = ['con_id', 'symbol', 'long_name', 'industry',
+                            'category', 'subcategory', 'sec_type',
+                            'stock_type', 'exchange', 'primary_exchange',
+                            'currency', 'local_symbol', 'market_name',
+                            'min_tick', 'order_types', 'valid_exchanges',
+                            'price_magnifier', 'time_zone_id',
+                            'trading_hours', 'liquid_hours']
+MATCHING_SYMBOLS_COLUMNS = ['con_id', 'symbol', 'sec_type', 'primary_exchange',
+                            'currency']
+ORDER_STATUS_COLUMNS = ['order_id', 'perm_id', 'status', 'filled',
+                        'remaining', 'avg_fill_price', 'parent_id',
+                        'last_fill_price', 'client_id', 'why_held',
+                        'mkt_cap_price']
+ORDER_STATUS_KEY = ['order_id', 'perm_id']
+
+
+# Resident memory of this process in bytes, or None where it can't be read
+# (only Linux's /proc is used; elsewhere the peak from getrusage).
+def resident_memory_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, other systems kilobytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
 
 # This is the main app that we'll be using for sync and async functions.
 class ibkr_app(EWrapper, EClient):
-    def __init__(self):
+    def __init__(self, journal=None, max_rows=None, max_age_sec=None,
+                 spill_directory=None, collapse_informational_errors=True):
         EClient.__init__(self, self)
-        self.error_messages = pd.DataFrame(columns=[
-            'reqId', 'errorCode', 'errorString'
-        ])
+        # With an order_journal, order events and errors are also written
+        # to disk (see order_journal).
+        self.journal = journal
+        # Callback rows are collected in row_buffers and only turned into
+        # DataFrames when error_messages / historical_data / order_status
+        # are read. For long sessions, max_rows / max_age_sec bound each of
+        # error_messages, order_status and latest_order_status; evicted
+        # rows are appended to CSV files in spill_directory if given (with
+        # a journal they are on disk already).
+        self.max_rows = max_rows
+        self.max_age_sec = max_age_sec
+        self.spill_directory = spill_directory
+        self._error_messages = row_buffer(
+            ERROR_MESSAGES_COLUMNS, max_rows=max_rows,
+            max_age_sec=max_age_sec, on_evict=self._spill('error_messages')
+        )
+        # Informational errors (farm status and the like) repeat all day;
+        # with collapse_informational_errors only the first of each
+        # (errorCode, errorString) is kept and the rest are counted.
+        self.collapse_informational_errors = collapse_informational_errors
+        self._informational_error_counts = {}
         self.next_valid_id = None
+        self.managed_accounts = None
         self.current_time = None
-        self.historical_data = pd.DataFrame(
-            columns=['date', 'open', 'high', 'low', 'close', 'volume',
-                     'bar_count', 'average']
-        )
-        self.historical_data_end = None
+        self.reset_historical_data()
+        self._contract_details = {}
         self.contract_details = None
         self.contract_details_end = None
         self.matching_symbols = None
-        self.order_status = pd.DataFrame(
-            columns=['order_id', 'perm_id', 'status', 'filled', 'remaining',
-                     'avg_fill_price', 'parent_id', 'last_fill_price',
-                     'client_id', 'why_held', 'mkt_cap_price']
+        self._order_status = row_buffer(
+            ORDER_STATUS_COLUMNS, unique=True, max_rows=max_rows,
+            max_age_sec=max_age_sec, on_evict=self._spill('order_status')
+        )
+        # The latest status of every order, for the dashboard to pick up only
+        # the orders that changed since it last asked.
+        self._latest_order_status = keyed_row_buffer(
+            ORDER_STATUS_COLUMNS, ORDER_STATUS_KEY, max_rows=max_rows,
+            on_evict=self._spill('latest_order_status')
+        )
+        # Ids for requests and orders sent on a long-lived connection. Seeded
+        # by nextValidId and then handed out locally so that several callers
+        # sharing one app never reuse an id.
+        self._request_id_lock = threading.Lock()
+        self._next_request_id = None
+        # Callers waiting on an answer register a Future under the reqId /
+        # orderId they send; the callbacks below complete it as soon as the
+        # answer (or an error for that id) comes in.
+        self._requests = {}
+        self._requests_lock = threading.Lock()
+        self.next_valid_id_event = threading.Event()
+        self.managed_accounts_event = threading.Event()
+        # Streaming requests (reqMktData, reqRealTimeBars) keep sending
+        # under their reqId; their callbacks go to the handler registered
+        # for it, usually a market_data_stream. Orders whose every status
+        # change matters register a handler under their orderId the same
+        # way.
+        self._stream_handlers = {}
+
+    def register_request(self, req_id):
+        future = Future()
+        with self._requests_lock:
+            self._requests[req_id] = future
+        return future
+
+    def forget_request(self, req_id):
+        with self._requests_lock:
+            self._requests.pop(req_id, None)
+        self._historical_data.pop(req_id, None)
+        self._contract_details.pop(req_id, None)
+
+    def _resolve_request(self, req_id, result):
+        with self._requests_lock:
+            future = self._requests.pop(req_id, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def _fail_request(self, req_id, exception):
+        with self._requests_lock:
+            future = self._requests.pop(req_id, None)
+        if future is not None and not future.done():
+            future.set_exception(exception)
+
+    def add_stream_handler(self, req_id, handler):
+        self._stream_handlers[req_id] = handler
+
+    def remove_stream_handler(self, req_id):
+        self._stream_handlers.pop(req_id, None)
+
+    def wait_for_next_valid_id(self, timeout):
+        return self.next_valid_id_event.wait(timeout)
+
+    def connect(self, host, port, clientId):
+        self.next_valid_id = None
+        self.next_valid_id_event.clear()
+        self.managed_accounts_event.clear()
+        EClient.connect(self, host, port, clientId)
+
+    def connectionClosed(self):
+        with self._requests_lock:
+            pending = list(self._requests.items())
+            self._requests.clear()
+        for req_id, future in pending:
+            if not future.done():
+                future.set_exception(ibkr_connection_error(
+                    "ibkr_app", "connection closed",
+                    f"request {req_id} got no answer"
+                ))
+
+    # Bars are kept per reqId so that any number of history requests can be
+    # in flight on one connection. historical_data is the result of the last
+    # request that finished.
+    def reset_historical_data(self):
+        self._historical_data = {}
+        self._last_historical_data = row_buffer(HISTORICAL_DATA_COLUMNS)
+        self.historical_data_end = None
+
+    def request_historical_data(self, contract, endDateTime='',
+                                durationStr='30 D', barSizeSetting='1 hour',
+                                whatToShow='MIDPOINT', useRTH=True):
+        req_id = self.next_request_id()
+        future = self.register_request(req_id)
+        self.reqHistoricalData(
+            req_id, contract, endDateTime, durationStr, barSizeSetting,
+            whatToShow, useRTH, formatDate=1, keepUpToDate=False,
+            chartOptions=[])
+        return req_id, future
+
+    def request_contract_details(self, contract):
+        req_id = self.next_request_id()
+        future = self.register_request(req_id)
+        self.reqContractDetails(req_id, contract)
+        return req_id, future
+
+    def request_matching_symbols(self, pattern):
+        req_id = self.next_request_id()
+        future = self.register_request(req_id)
+        self.reqMatchingSymbols(req_id, pattern)
+        return req_id, future
+
+    @property
+    def error_messages(self):
+        return self._error_messages.to_frame()
+
+    @property
+    def historical_data(self):
+        return self._last_historical_data.to_frame()
+
+    @property
+    def order_status(self):
+        return self._order_status.to_frame()
+
+    @property
+    def latest_order_status(self):
+        return self._latest_order_status.to_frame()
+
+    # (sequence, changes) for the orders whose status changed after
+    # `sequence`; see keyed_row_buffer.changes_since.
+    def order_status_changes(self, sequence=0):
+        return self._latest_order_status.changes_since(sequence)
+
+    # (count, records) for the error messages after the first `count`.
+    def error_messages_since(self, count=0):
+        return self._error_messages.rows_since(count)
+
+    # How many times each collapsed informational error came in.
+    @property
+    def error_counts(self):
+        return pd.DataFrame(
+            [key + (count,) for key, count in
+             list(self._informational_error_counts.items())],
+            columns=['errorCode', 'errorString', 'count']
         )
 
+    def _spill(self, name):
+        if self.spill_directory is None:
+            return None
+        os.makedirs(self.spill_directory, exist_ok=True)
+        return spill_to_csv(os.path.join(self.spill_directory, name + '.csv'))
+
+    # Rows held and their approximate size per buffer, and the resident
+    # memory of the process, to watch a long session stay flat.
+    def memory_usage(self):
+        buffers = {
+            'error_messages': self._error_messages,
+            'order_status': self._order_status,
+            'latest_order_status': self._latest_order_status,
+            'historical_data': self._last_historical_data
+        }
+        usage = {name: {'rows': len(buffer),
+                        'bytes': buffer.memory_usage()}
+                 for name, buffer in buffers.items()}
+        usage['informational_error_counts'] = {
+            'rows': len(self._informational_error_counts),
+            'bytes': sys.getsizeof(self._informational_error_counts)
+        }
+        usage['resident_bytes'] = resident_memory_bytes()
+        return usage
+
+    # Puts back order status and error message rows from an earlier run
+    # (order_journal.replay) without journaling them again.
+    def restore(self, order_status_rows=(), error_message_rows=()):
+        for row in order_status_rows:
+            row = tuple(row)
+            self._order_status.append(*row)
+            self._latest_order_status.upsert(*row)
+        for row in error_message_rows:
+            self._add_error_message(*row)
+
+    # False for a repeat of a collapsed informational error.
+    def _add_error_message(self, reqId, errorCode, errorString):
+        if self.collapse_informational_errors and \
+                is_informational_error(errorCode):
+            key = (errorCode, errorString)
+            count = self._informational_error_counts.get(key, 0)
+            self._informational_error_counts[key] = count + 1
+            if count:
+                return False
+        self._error_messages.append(reqId, errorCode, errorString)
+        return True
 
     def error(self, reqId:TickerId, errorCode:int, errorString:str):
-        self.error_messages = pd.concat(
-            [self.error_messages, pd.DataFrame({
-                "reqId": [reqId],
-                "errorCode": [errorCode],
-                "errorString": [errorString]
-            })])
+        if self._add_error_message(reqId, errorCode, errorString) and \
+                self.journal is not None:
+            self.journal.record_error(reqId, errorCode, errorString)
+        if reqId is not None and reqId >= 0 and \
+                not is_informational_error(errorCode):
+            self._historical_data.pop(reqId, None)
+            self._contract_details.pop(reqId, None)
+            stream_handler = self._stream_handlers.get(reqId)
+            if stream_handler is not None:
+                stream_handler.on_error(reqId, errorCode, errorString)
+            self._fail_request(
+                reqId, ibkr_request_error(reqId, errorCode, errorString)
+            )
 
     def managedAccounts(self, accountsList:str):
         self.managed_accounts = [i for i in accountsList.split(",") if i]
+        self.managed_accounts_event.set()
 
     def nextValidId(self, orderId:int):
+        with self._request_id_lock:
+            if self._next_request_id is None or \
+                    orderId > self._next_request_id:
+                self._next_request_id = orderId
         self.next_valid_id = orderId
+        self.next_valid_id_event.set()
+
+    def next_request_id(self):
+        with self._request_id_lock:
+            if self._next_request_id is None:
+                raise Exception(
+                    "next_request_id",
+                    "not connected",
+                    "next_valid_id not received"
+                )
+            request_id = self._next_request_id
+            self._next_request_id += 1
+        return request_id
 
     def currentTime(self, time:int):
         self.current_time = datetime.fromtimestamp(time)
+        self._resolve_request(CURRENT_TIME_REQUEST, self.current_time)
 
     def historicalData(self, reqId:int, bar:BarData):
-        self.historical_data = pd.concat(
-            [
-                self.historical_data,
-                pd.DataFrame(
-                    {
-                        'date': [bar.date],
-                        'open': [bar.open],
-                        'high': [bar.high],
-                        'low': [bar.low],
-                        'close': [bar.close],
-                    }
-                )
-            ],
-            ignore_index=True
+        bars = self._historical_data.get(reqId)
+        if bars is None:
+            bars = self._historical_data[reqId] = \
+                row_buffer(HISTORICAL_DATA_COLUMNS)
+        bars.append(
+            bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume,
+            bar.barCount, bar.average
         )
 
+    def tickPrice(self, reqId:TickerId, tickType:int, price:float,
+                  attrib:TickAttrib):
+        stream_handler = self._stream_handlers.get(reqId)
+        if stream_handler is not None:
+            stream_handler.on_tick_price(reqId, tickType, price)
+
+    def tickSize(self, reqId:TickerId, tickType:int, size):
+        stream_handler = self._stream_handlers.get(reqId)
+        if stream_handler is not None:
+            stream_handler.on_tick_size(reqId, tickType, float(size))
+
+    def realtimeBar(self, reqId:TickerId, time:int, open_:float, high:float,
+                    low:float, close:float, volume, wap, count:int):
+        stream_handler = self._stream_handlers.get(reqId)
+        if stream_handler is not None:
+            stream_handler.on_realtime_bar(
+                reqId,
+                (time, open_, high, low, close, float(volume), float(wap),
+                 count)
+            )
+
     def historicalDataEnd(self, reqId:int, start:str, end:str):
+        bars = self._historical_data.pop(reqId, None)
+        if bars is None:
+            bars = row_buffer(HISTORICAL_DATA_COLUMNS)
+        self._last_historical_data = bars
         self.historical_data_end = reqId
+        self._resolve_request(reqId, bars.to_frame())
 
+    # A query can match several contracts; all of them are collected under
+    # the reqId and handed over together when the end message arrives.
     def contractDetailsEnd(self, reqId: int):
+        details = self._contract_details.pop(reqId, None)
+        if details is None:
+            details = row_buffer(CONTRACT_DETAILS_COLUMNS)
+        self.contract_details = details.to_frame()
         self.contract_details_end = reqId
+        self._resolve_request(reqId, self.contract_details)
 
     def contractDetails(self, reqId:int, contractDetails:ContractDetails):
-        self.contract_details = pd.DataFrame({
-            "con_id": [contractDetails.contract.conId],
-            "symbol": [contractDetails.contract.symbol],
-            "long_name": [contractDetails.longName],
-            "industry": [contractDetails.industry],
-            "category": [contractDetails.category],
-            "subcategory": [contractDetails.subcategory],
-            "sec_type": [contractDetails.contract.secType],
-            "stock_type": [contractDetails.stockType],
-            "exchange": [contractDetails.contract.exchange],
-            "primary_exchange": [contractDetails.contract.primaryExchange],
-            "currency": [contractDetails.contract.currency],
-            "local_symbol": [contractDetails.contract.localSymbol],
-            "market_name": [contractDetails.marketName],
-            "min_tick": [contractDetails.minTick],
-            "order_types": [contractDetails.orderTypes],
-            "valid_exchanges": [contractDetails.validExchanges],
-            "price_magnifier": [contractDetails.priceMagnifier],
-            "time_zone_id": [contractDetails.timeZoneId],
-            "trading_hours": [contractDetails.tradingHours],
-            "liquid_hours": [contractDetails.liquidHours]
-        })
+        details = self._contract_details.get(reqId)
+        if details is None:
+            details = self._contract_details[reqId] = \
+                row_buffer(CONTRACT_DETAILS_COLUMNS)
+        details.append(
+            contractDetails.contract.conId,
+            contractDetails.contract.symbol,
+            contractDetails.longName,
+            contractDetails.industry,
+            contractDetails.category,
+            contractDetails.subcategory,
+            contractDetails.contract.secType,
+            contractDetails.stockType,
+            contractDetails.contract.exchange,
+            contractDetails.contract.primaryExchange,
+            contractDetails.contract.currency,
+            contractDetails.contract.localSymbol,
+            contractDetails.marketName,
+            contractDetails.minTick,
+            contractDetails.orderTypes,
+            contractDetails.validExchanges,
+            contractDetails.priceMagnifier,
+            contractDetails.timeZoneId,
+            contractDetails.tradingHours,
+            contractDetails.liquidHours
+        )
 
     def symbolSamples(self, reqId:int,
                       contractDescriptions:ListOfContractDescription):
         df = pd.DataFrame(
-            columns=[
-                'con_id', 'symbol', 'sec_type', 'primary_exchange', 'currency'
-            ]
-        )
-        for contract_description in contractDescriptions:
-            df = pd.concat([
-                df,
-                pd.DataFrame({
-                    "con_id": [contract_description.contract.conId],
-                    "symbol": [contract_description.contract.symbol],
-                    "sec_type": [contract_description.contract.secType],
-                    "primary_exchange": [
-                        contract_description.contract.primaryExchange
-                    ],
-                    "currency": [contract_description.contract.currency]
-                })
+            [
+                (
+                    contract_description.contract.conId,
+                    contract_description.contract.symbol,
+                    contract_description.contract.secType,
+                    contract_description.contract.primaryExchange,
+                    contract_description.contract.currency
+                )
+                for contract_description in contractDescriptions
             ],
-                ignore_index=True
-            )
+            columns=MATCHING_SYMBOLS_COLUMNS
+        )
         self.matching_symbols = df
+        self._resolve_request(reqId, df)
 
     def orderStatus(self, orderId:OrderId , status:str, filled:float,
                     remaining:float, avgFillPrice:float, permId:int,
                     parentId:int, lastFillPrice:float, clientId:int,
                     whyHeld:str, mktCapPrice: float):
-        self.order_status = pd.concat(
-            [
-                self.order_status,
-                pd.DataFrame({
-                    'order_id': [orderId],
-                    'perm_id': [permId],
-                    'status': [status],
-                    'filled': [filled],
-                    'remaining': [remaining],
-                    'avg_fill_price': [avgFillPrice],
-                    'parent_id': [parentId],
-                    'last_fill_price': [lastFillPrice],
-                    'client_id': [clientId],
-                    'why_held': [whyHeld],
-                    'mkt_cap_price': [mktCapPrice]
-                })
-            ],
-            ignore_index=True
-        )
-        self.order_status.drop_duplicates(inplace=True)
+        row = (orderId, permId, status, filled, remaining, avgFillPrice,
+               parentId, lastFillPrice, clientId, whyHeld, mktCapPrice)
+        self._order_status.append(*row)
+        self._latest_order_status.upsert(*row)
+        if self.journal is not None:
+            self.journal.record_order_status(*row)
+        stream_handler = self._stream_handlers.get(orderId)
+        if stream_handler is not None:
+            stream_handler.on_order_status(orderId, status, filled,
+                                           avgFillPrice)
+        if status in ORDER_SUBMITTED_STATUSES:
+            self._resolve_request(orderId, status)
+        elif status in ORDER_CANCELLED_STATUSES:
+            self._fail_request(orderId, ibkr_request_error(
+                orderId, None, f"order {status}"
+            ))
+
+    def openOrder(self, orderId:OrderId, contract:Contract, order:Order,
+                  orderState:OrderState):
+        if self.journal is not None:
+            self.journal.record_open_order(orderId, contract, order,
+                                           orderState)
+
+    def execDetails(self, reqId:int, contract:Contract, execution:Execution):
+        if self.journal is not None:
+            self.journal.record_execution(contract, execution)
@@ -0,0 +1,224 @@
+from interactive_trader.ibkr_app import ORDER_STATUS_COLUMNS, \
+    ERROR_MESSAGES_COLUMNS
+import queue
+import sqlite3
+import threading
+import time
+import pandas as pd
+
+OPEN_ORDER_COLUMNS = ['order_id', 'perm_id', 'client_id', 'symbol',
+                      'sec_type', 'exchange', 'currency', 'action',
+                      'order_type', 'total_quantity', 'lmt_price',
+                      'aux_price', 'tif', 'account', 'status']
+EXECUTION_COLUMNS = ['exec_id', 'order_id', 'perm_id', 'client_id',
+                     'symbol', 'sec_type', 'exchange', 'currency', 'side',
+                     'shares', 'price', 'cum_qty', 'avg_price', 'account',
+                     'exec_time']
+
+# Every table starts with the time the event was journaled (seconds since
+# the epoch) and is indexed on it and on the ids and symbol it has.
+JOURNAL_TABLES = {
+    'order_status': ORDER_STATUS_COLUMNS,
+    'open_orders': OPEN_ORDER_COLUMNS,
+    'executions': EXECUTION_COLUMNS,
+    'error_messages': ERROR_MESSAGES_COLUMNS
+}
+JOURNAL_INDEXES = {
+    'order_status': [['order_id'], ['perm_id'], ['ts']],
+    'open_orders': [['order_id'], ['perm_id'], ['symbol'], ['ts']],
+    'executions': [['order_id'], ['perm_id'], ['symbol'], ['ts']],
+    'error_messages': [['reqId'], ['ts']]
+}
+
+_CLOSE = object()
+
+
+def _quote(name):
+    return '"' + name + '"'
+
+
+# Durable journal of order events (orderStatus, openOrder, execDetails and
+# errors) in SQLite, in WAL mode. record() only stamps the row and queues
+# it, so the API thread spends microseconds on it; a writer thread takes
+# everything queued up to max_batch_delay_sec after the first row and
+# commits it in one transaction, so a burst of fills costs one commit rather
+# than one per row. flush() waits until everything recorded so far is on
+# disk.
+#
+# The tables are indexed by order_id, perm_id, symbol (where the event has
+# one) and timestamp, so order_history(order_id) is an index lookup.
+# replay(app) puts the order status and error messages of earlier runs back
+# into an ibkr_app on startup.
+class order_journal:
+    def __init__(self, path, max_batch_delay_sec=0.05, max_batch_rows=5000):
+        self.path = path
+        self.max_batch_delay_sec = max_batch_delay_sec
+        self.max_batch_rows = max_batch_rows
+        self._queue = queue.SimpleQueue()
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+        self._create_tables(self._reader)
+        self._writer_error = None
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # With WAL, NORMAL only syncs at checkpoints: a power cut can lose
+        # the last transactions, but the file can't be corrupted.
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    @staticmethod
+    def _create_tables(connection):
+        with connection:
+            for table, columns in JOURNAL_TABLES.items():
+                column_list = ', '.join(_quote(c) for c in ['ts'] + columns)
+                connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ({column_list})"
+                )
+                for index_columns in JOURNAL_INDEXES[table]:
+                    index_name = '_'.join([table] + index_columns)
+                    connection.execute(
+                        f"CREATE INDEX IF NOT EXISTS {index_name} "
+                        f"ON {table} "
+                        f"({', '.join(_quote(c) for c in index_columns)})"
+                    )
+
+    # RECORDING
+    def record(self, table, *row):
+        self._queue.put((table, (time.time(),) + row))
+
+    def record_order_status(self, *row):
+        self.record('order_status', *row)
+
+    def record_error(self, *row):
+        self.record('error_messages', *row)
+
+    def record_open_order(self, order_id, contract, order, order_state):
+        self.record('open_orders', order_id, order.permId, order.clientId,
+                    contract.symbol, contract.secType, contract.exchange,
+                    contract.currency, order.action, order.orderType,
+                    float(order.totalQuantity), order.lmtPrice,
+                    order.auxPrice, order.tif, order.account,
+                    order_state.status)
+
+    def record_execution(self, contract, execution):
+        self.record('executions', execution.execId, execution.orderId,
+                    execution.permId, execution.clientId, contract.symbol,
+                    contract.secType, contract.exchange, contract.currency,
+                    execution.side, float(execution.shares), execution.price,
+                    float(execution.cumQty), execution.avgPrice,
+                    execution.acctNumber, execution.time)
+
+    # WRITER
+    def _write_loop(self):
+        connection = self._connect()
+        sql = {
+            table: f"INSERT INTO {table} VALUES "
+                   f"({', '.join('?' for _ in range(len(columns) + 1))})"
+            for table, columns in JOURNAL_TABLES.items()
+        }
+        closing = False
+        while not closing:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_batch_delay_sec
+            # A flush or close is handled at once instead of waiting out
+            # the batch.
+            while len(batch) < self.max_batch_rows and \
+                    isinstance(batch[-1], tuple):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            rows = {}
+            waiting = []
+            for item in batch:
+                if item is _CLOSE:
+                    closing = True
+                elif isinstance(item, threading.Event):
+                    waiting.append(item)
+                else:
+                    rows.setdefault(item[0], []).append(item[1])
+            if rows:
+                try:
+                    with connection:
+                        for table, table_rows in rows.items():
+                            connection.executemany(sql[table], table_rows)
+                except sqlite3.Error as e:
+                    self._writer_error = e
+            for event in waiting:
+                event.set()
+        connection.close()
+
+    def flush(self, timeout=None):
+        event = threading.Event()
+        self._queue.put(event)
+        if not event.wait(timeout):
+            return False
+        if self._writer_error is not None:
+            error, self._writer_error = self._writer_error, None
+            raise error
+        return True
+
+    def close(self, timeout=None):
+        if self._writer.is_alive():
+            self._queue.put(_CLOSE)
+            self._writer.join(timeout)
+        with self._read_lock:
+            self._reader.close()
+
+    # QUERIES
+    def query(self, table, where=None, order_by='ts'):
+        columns = ['ts'] + JOURNAL_TABLES[table]
+        order_by = order_by if order_by in columns else 'ts'
+        where = {column: value for column, value in (where or {}).items()
+                 if column in columns and value is not None}
+        where_sql = ' AND '.join(f"{_quote(c)} = ?" for c in where)
+        with self._read_lock:
+            rows = self._reader.execute(
+                f"SELECT * FROM {table}"
+                f"{' WHERE ' + where_sql if where_sql else ''} "
+                f"ORDER BY {_quote(order_by)}, rowid",
+                list(where.values())
+            ).fetchall()
+        frame = pd.DataFrame(rows, columns=columns)
+        frame['ts'] = pd.to_datetime(frame['ts'], unit='s')
+        return frame
+
+    # What happened to one order: its open order, status and execution
+    # events, each by time.
+    def order_history(self, order_id=None, perm_id=None):
+        where = {'order_id': order_id, 'perm_id': perm_id}
+        return {table: self.query(table, where)
+                for table in ('open_orders', 'order_status', 'executions')}
+
+    def executions(self, symbol=None):
+        return self.query('executions', {'symbol': symbol})
+
+    # REPLAY
+
+    # Puts the journaled order status and error messages back into app, only
+    # the newest app.max_rows of each when the app has a limit.
+    def replay(self, app):
+        limit = getattr(app, 'max_rows', None)
+        order_status = self._newest('order_status', ORDER_STATUS_COLUMNS,
+                                    limit)
+        error_messages = self._newest('error_messages',
+                                      ERROR_MESSAGES_COLUMNS, limit)
+        app.restore(order_status, error_messages)
+        return len(order_status), len(error_messages)
+
+    def _newest(self, table, columns, limit):
+        with self._read_lock:
+            rows = self._reader.execute(
+                f"SELECT {', '.join(_quote(c) for c in columns)} "
+                f"FROM {table} ORDER BY rowid DESC LIMIT ?",
+                (-1 if limit is None else limit,)
+            ).fetchall()
+        rows.reverse()
+        return rows
@@ -0,0 +1,286 @@
+from interactive_trader.exceptions import ibkr_request_error, \
+    ibkr_timeout_error
+from concurrent.futures import Future
+from collections import deque
+import heapq
+import itertools
+import threading
+import time
+
+# IB's historical data pacing rules. Breaking any of them gets the request
+# answered with error 162 instead of bars.
+IDENTICAL_REQUEST_SEC = 15          # no identical request within 15 s
+SAME_CONTRACT_LIMIT = (6, 2)        # <= 6 per contract/exchange/tick type in 2 s
+REQUEST_LIMIT = (60, 600)           # <= 60 requests in any 10 minutes
+# 162 also carries other historical data errors (no data, a query TWS
+# refused, ...); only those whose message says it is a pacing violation are
+# worth retrying.
+PACING_VIOLATION = 162
+PACING_VIOLATION_TEXT = 'pacing violation'
+# TWS disconnects clients that send more than 50 messages a second.
+MESSAGE_LIMIT = (50, 1)
+
+
+# At most max_requests in any window of window_sec. The send times are kept,
+# so a request can go out the moment the oldest one leaves the window: the
+# full allowance is used, and, unlike a token bucket refilled at the same
+# average rate, a burst at the edge of one window can't be followed by a
+# second full burst in the next.
+class rolling_window_limit:
+    __slots__ = ('max_requests', 'window_sec', 'sent')
+
+    def __init__(self, max_requests, window_sec):
+        self.max_requests = max_requests
+        self.window_sec = window_sec
+        self.sent = deque()
+
+    def delay(self, now):
+        while self.sent and self.sent[0] <= now - self.window_sec:
+            self.sent.popleft()
+        if len(self.sent) < self.max_requests:
+            return 0
+        return self.sent[0] + self.window_sec - now
+
+    def record(self, now):
+        self.sent.append(now)
+
+
+class _scheduled_request:
+    __slots__ = ('key', 'contract_key', 'args', 'priority', 'future',
+                 'attempts', 'not_before', 'req_id', 'sent_at')
+
+    def __init__(self, key, contract_key, args, priority):
+        self.key = key
+        self.contract_key = contract_key
+        self.args = args
+        self.priority = priority
+        self.future = Future()
+        self.attempts = 0
+        self.not_before = 0
+        self.req_id = None
+        self.sent_at = None
+
+
+def is_pacing_violation(exception):
+    return isinstance(exception, ibkr_request_error) and \
+        exception.error_code == PACING_VIOLATION and \
+        PACING_VIOLATION_TEXT in str(exception.error_string).lower()
+
+
+def contract_pacing_key(contract, whatToShow):
+    return (contract.conId or contract.symbol, contract.secType,
+            contract.exchange, contract.primaryExchange, contract.currency,
+            whatToShow)
+
+
+# Sits in front of reqHistoricalData. Requests are queued by priority
+# (higher first) and sent as soon as none of the pacing rules would be
+# broken; an identical request that is already queued or in flight gets the
+# same Future instead of a second request. A request answered with a pacing
+# violation is sent again after an exponential backoff.
+#
+# send(contract, endDateTime, durationStr, barSizeSetting, whatToShow,
+# useRTH) must return (req_id, Future), which is what
+# ibkr_app.request_historical_data does; pass app= to use it. clock is
+# injectable so the pacing can be tested without waiting: call dispatch()
+# directly instead of start().
+class historical_data_scheduler:
+    def __init__(self, app=None, send=None, cancel=None, clock=time.monotonic,
+                 max_in_flight=50, request_timeout=None, max_retries=3,
+                 backoff_sec=IDENTICAL_REQUEST_SEC):
+        if app is not None:
+            send = send or app.request_historical_data
+            if cancel is None:
+                def cancel(req_id):
+                    app.cancelHistoricalData(req_id)
+                    app.forget_request(req_id)
+        self.send = send
+        self.cancel = cancel
+        self.clock = clock
+        self.max_in_flight = max_in_flight
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.backoff_sec = backoff_sec
+
+        self.request_limit = rolling_window_limit(*REQUEST_LIMIT)
+        self.contract_limits = {}
+        self.last_sent = {}
+        self.queue = []
+        self.pending = {}
+        self.in_flight = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        self._stopped = False
+        # Set whenever there is something new for dispatch() to look at, so
+        # the dispatch thread doesn't sleep through a submit or an answer
+        # that came in while it was busy.
+        self._dirty = False
+
+    def submit(self, contract, endDateTime='', durationStr='30 D',
+               barSizeSetting='1 hour', whatToShow='MIDPOINT', useRTH=True,
+               priority=0):
+        contract_key = contract_pacing_key(contract, whatToShow)
+        key = (contract_key, endDateTime, durationStr, barSizeSetting,
+               bool(useRTH))
+        with self._lock:
+            request = self.pending.get(key)
+            if request is not None:
+                return request.future
+            request = _scheduled_request(
+                key, contract_key,
+                (contract, endDateTime, durationStr, barSizeSetting,
+                 whatToShow, useRTH),
+                priority
+            )
+            self.pending[key] = request
+            self._enqueue(request)
+            self._notify()
+        return request.future
+
+    def _notify(self):
+        self._dirty = True
+        self._wakeup.notify()
+
+    def _enqueue(self, request):
+        heapq.heappush(self.queue, (-request.priority, next(self._sequence),
+                                    request))
+
+    def _delay(self, request, now):
+        contract_limit = self.contract_limits.get(request.contract_key)
+        return max(
+            request.not_before - now,
+            self.last_sent.get(request.key, -IDENTICAL_REQUEST_SEC)
+            + IDENTICAL_REQUEST_SEC - now,
+            contract_limit.delay(now) if contract_limit else 0
+        )
+
+    # Sends every queued request that may go out now and fails in-flight
+    # requests older than request_timeout. Returns the number of seconds
+    # until something else could be sent, or None if nothing is waiting.
+    def dispatch(self):
+        to_send = []
+        timed_out = []
+        with self._lock:
+            self._dirty = False
+            now = self.clock()
+            if self.request_timeout is not None:
+                for req_id, request in list(self.in_flight.items()):
+                    if now - request.sent_at > self.request_timeout:
+                        del self.in_flight[req_id]
+                        self.pending.pop(request.key, None)
+                        timed_out.append(request)
+
+            next_delay = None
+            waiting = []
+            while self.queue and len(self.in_flight) + len(to_send) < \
+                    self.max_in_flight:
+                global_delay = self.request_limit.delay(now)
+                if global_delay > 0:
+                    next_delay = global_delay
+                    break
+                entry = heapq.heappop(self.queue)
+                request = entry[2]
+                delay = self._delay(request, now)
+                if delay > 0:
+                    waiting.append(entry)
+                    next_delay = delay if next_delay is None \
+                        else min(next_delay, delay)
+                    continue
+                self.request_limit.record(now)
+                self.contract_limits.setdefault(
+                    request.contract_key,
+                    rolling_window_limit(*SAME_CONTRACT_LIMIT)
+                ).record(now)
+                self.last_sent[request.key] = now
+                request.attempts += 1
+                request.sent_at = now
+                to_send.append(request)
+            for entry in waiting:
+                heapq.heappush(self.queue, entry)
+            if self.request_timeout is not None and self.in_flight:
+                oldest = min(r.sent_at for r in self.in_flight.values())
+                timeout_delay = oldest + self.request_timeout - now
+                next_delay = timeout_delay if next_delay is None \
+                    else min(next_delay, timeout_delay)
+            self._forget_old_requests(now)
+
+        for request in timed_out:
+            if self.cancel is not None:
+                self.cancel(request.req_id)
+            request.future.set_exception(ibkr_timeout_error(
+                "historical_data_scheduler", "timeout",
+                "historical_data not received"
+            ))
+        for request in to_send:
+            self._send(request)
+        return next_delay
+
+    def _send(self, request):
+        try:
+            req_id, future = self.send(*request.args)
+        except Exception as exception:
+            with self._lock:
+                self.pending.pop(request.key, None)
+            request.future.set_exception(exception)
+            return
+        with self._lock:
+            request.req_id = req_id
+            self.in_flight[req_id] = request
+        future.add_done_callback(
+            lambda answer: self._on_answer(request, req_id, answer)
+        )
+
+    # Runs on the API thread when TWS answers.
+    def _on_answer(self, request, req_id, answer):
+        exception = answer.exception()
+        with self._lock:
+            if self.in_flight.pop(req_id, None) is None:
+                return
+            if is_pacing_violation(exception) and \
+                    request.attempts <= self.max_retries:
+                request.not_before = self.clock() + \
+                    self.backoff_sec * 2 ** (request.attempts - 1)
+                self._enqueue(request)
+                self._notify()
+                return
+            self.pending.pop(request.key, None)
+            self._notify()
+        if exception is None:
+            request.future.set_result(answer.result())
+        else:
+            request.future.set_exception(exception)
+
+    def _forget_old_requests(self, now):
+        for key in [key for key, sent in self.last_sent.items()
+                    if sent <= now - IDENTICAL_REQUEST_SEC]:
+            del self.last_sent[key]
+        for key in [key for key, limit in self.contract_limits.items()
+                    if limit.delay(now) == 0 and not limit.sent]:
+            del self.contract_limits[key]
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped = False
+
+        def dispatch_loop():
+            while True:
+                delay = self.dispatch()
+                with self._lock:
+                    if self._stopped:
+                        return
+                    if not self._dirty:
+                        self._wakeup.wait(delay)
+
+        self._thread = threading.Thread(target=dispatch_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._notify()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
@@ -0,0 +1,237 @@
+from collections import OrderedDict
+import bisect
+import os
+import sys
+import threading
+import time
+import pandas as pd
+
+
+# Rows that arrive one callback at a time. Every column is a plain list, so
+# appending a row is O(1) no matter how many rows came before it; the
+# DataFrame is only built when somebody reads it, and is cached until more
+# rows come in. With unique=True exact duplicate rows are dropped on the way
+# in, which replaces calling drop_duplicates on the whole frame.
+#
+# For sessions that run for days, max_rows and max_age_sec bound what is
+# kept: the oldest rows are evicted in batches of evict_batch (so the buffer
+# can briefly hold that many more), and handed to on_evict as a DataFrame,
+# e.g. a spill_to_csv. Positions given to and by rows_since count every row
+# ever appended, evicted or not.
+class row_buffer:
+    __slots__ = ('columns', '_data', '_frame', '_frame_total', '_seen',
+                 'max_rows', 'max_age_sec', 'evict_batch', 'on_evict',
+                 '_clock', '_times', '_dropped', '_lock')
+
+    def __init__(self, columns, unique=False, max_rows=None, max_age_sec=None,
+                 on_evict=None, evict_batch=None, clock=time.monotonic):
+        self.columns = list(columns)
+        self._data = [[] for _ in self.columns]
+        self._frame = None
+        self._frame_total = None
+        self._seen = set() if unique else None
+        self.max_rows = max_rows
+        self.max_age_sec = max_age_sec
+        self.evict_batch = evict_batch or max(1, (max_rows or 1024) // 16)
+        self.on_evict = on_evict
+        self._clock = clock
+        self._times = [] if max_age_sec is not None else None
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    # Rows are appended by the API thread while readers may be on another
+    # one; the last column is written last, so its length is the number of
+    # complete rows.
+    def __len__(self):
+        return len(self._data[-1])
+
+    # Rows appended so far, including the evicted ones.
+    @property
+    def total(self):
+        return self._dropped + len(self)
+
+    def append(self, *row):
+        if self._seen is not None:
+            if row in self._seen:
+                return False
+            self._seen.add(row)
+        if self._times is not None:
+            self._times.append(self._clock())
+        for column, value in zip(self._data, row):
+            column.append(value)
+        if self.max_rows is not None or self._times is not None:
+            self._evict()
+        return True
+
+    def _evict(self):
+        rows = len(self)
+        count = rows - self.max_rows if self.max_rows is not None else 0
+        if self._times and self._times[0] < self._clock() - self.max_age_sec:
+            count = max(count, bisect.bisect_left(
+                self._times, self._clock() - self.max_age_sec
+            ))
+        if count < self.evict_batch:
+            return
+        with self._lock:
+            evicted = [column[:count] for column in self._data]
+            for column in self._data:
+                del column[:count]
+            if self._times is not None:
+                del self._times[:count]
+            self._dropped += count
+        if self._seen is not None:
+            self._seen.difference_update(zip(*evicted))
+        if self.on_evict is not None:
+            self.on_evict(pd.DataFrame(dict(zip(self.columns, evicted)),
+                                       columns=self.columns))
+
+    # The rows from position start on as records, with the position to ask
+    # from next time; a reader that keeps it gets only the new rows. Rows
+    # evicted since are skipped.
+    def rows_since(self, start):
+        with self._lock:
+            rows = len(self)
+            first = max(start - self._dropped, 0)
+            return self._dropped + rows, [
+                dict(zip(self.columns, row))
+                for row in zip(*(column[first:rows] for column in self._data))
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._dropped += len(self)
+            for column in self._data:
+                column.clear()
+            if self._times is not None:
+                self._times.clear()
+        if self._seen is not None:
+            self._seen.clear()
+        self._frame = None
+
+    # The frame is built once per batch of new rows and cached; every reader
+    # gets its own copy of it (cheap with pandas' copy-on-write), so changing
+    # the result can't reach other readers or later calls.
+    def to_frame(self):
+        with self._lock:
+            rows = len(self)
+            total = self._dropped + rows
+            if self._frame is None or self._frame_total != total:
+                self._frame = pd.DataFrame(
+                    {
+                        name: column[:rows]
+                        for name, column in zip(self.columns, self._data)
+                    },
+                    columns=self.columns
+                )
+                self._frame_total = total
+            return self._frame.copy()
+
+    # Rough size in bytes of the rows held: the column lists plus their
+    # values, sized from the last value of each column.
+    def memory_usage(self):
+        size = 0
+        for column in self._data:
+            size += sys.getsizeof(column)
+            if column:
+                size += sys.getsizeof(column[-1]) * len(column)
+        return size
+
+
+# An on_evict for row_buffer / keyed_row_buffer that appends evicted rows to
+# a CSV file, writing the header when the file is new.
+def spill_to_csv(path):
+    def spill(frame):
+        frame.to_csv(path, mode='a', index=False,
+                     header=not os.path.exists(path) or
+                     os.path.getsize(path) == 0)
+    return spill
+
+
+# The latest row for every key (e.g. every order), for readers that only want
+# what changed since they last looked. Every change takes the next sequence
+# number, and changes_since walks back from the newest change to the first
+# one the reader already has, so it costs the number of changes rather than
+# the number of rows. A key keeps the position it was first seen at, which
+# lets a reader patch its copy of the rows in place.
+#
+# With max_rows, the keys that went longest without a change are evicted
+# (and handed to on_evict as a DataFrame) once there are more.
+class keyed_row_buffer:
+    __slots__ = ('columns', '_key_indexes', '_positions', '_rows', '_changes',
+                 '_sequence', '_next_position', 'max_rows', 'on_evict',
+                 '_lock')
+
+    def __init__(self, columns, key_columns, max_rows=None, on_evict=None):
+        self.columns = list(columns)
+        self._key_indexes = [self.columns.index(name) for name in key_columns]
+        self._positions = {}
+        # key -> latest row, in the order the keys were first seen.
+        self._rows = {}
+        # key -> sequence of its last change, oldest change first.
+        self._changes = OrderedDict()
+        self._sequence = 0
+        self._next_position = 0
+        self.max_rows = max_rows
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def sequence(self):
+        return self._sequence
+
+    # Adds the row, or replaces the one with the same key. An unchanged row
+    # doesn't count as a change.
+    def upsert(self, *row):
+        key = tuple(row[index] for index in self._key_indexes)
+        evicted = []
+        with self._lock:
+            old_row = self._rows.get(key)
+            if old_row is None:
+                self._positions[key] = self._next_position
+                self._next_position += 1
+            elif old_row == row:
+                return False
+            self._rows[key] = row
+            self._sequence += 1
+            self._changes[key] = self._sequence
+            self._changes.move_to_end(key)
+            if self.max_rows is not None:
+                while len(self._rows) > self.max_rows:
+                    old_key, _ = self._changes.popitem(last=False)
+                    del self._positions[old_key]
+                    evicted.append(self._rows.pop(old_key))
+        if evicted and self.on_evict is not None:
+            self.on_evict(pd.DataFrame(evicted, columns=self.columns))
+        return True
+
+    # (sequence, changes): the sequence to ask from next time, and
+    # (position, record) for every key changed after `sequence`, by position.
+    # Positions past the rows a reader has are new keys. A reader with no
+    # rows yet asks for changes_since(0).
+    def changes_since(self, sequence):
+        changes = []
+        with self._lock:
+            for key in reversed(self._changes):
+                if self._changes[key] <= sequence:
+                    break
+                changes.append((self._positions[key],
+                                dict(zip(self.columns, self._rows[key]))))
+            current = self._sequence
+        changes.sort(key=lambda change: change[0])
+        return current, changes
+
+    def to_frame(self):
+        with self._lock:
+            return pd.DataFrame(list(self._rows.values()),
+                                columns=self.columns)
+
+    def memory_usage(self):
+        with self._lock:
+            row = next(iter(self._rows.values()), None)
+            row_size = 0 if row is None else \
+                sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+            return sys.getsizeof(self._rows) + sys.getsizeof(self._changes) \
+                + sys.getsizeof(self._positions) + row_size * len(self._rows)
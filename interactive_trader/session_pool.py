@@ -0,0 +1,238 @@
+from interactive_trader.ibkr_app import ibkr_app, CURRENT_TIME_REQUEST
+from interactive_trader.pacing import historical_data_scheduler
+from interactive_trader.exceptions import ibkr_connection_error, \
+    ibkr_error, ibkr_timeout_error
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+import atexit
+import queue
+import threading
+
+# Client ids in use by sessions of this process. TWS drops the second
+# connection that uses a client id, so every pooled session gets its own.
+_client_id_lock = threading.Lock()
+_allocated_client_ids = set()
+
+
+def allocate_client_id(preferred_client_id):
+    with _client_id_lock:
+        client_id = int(preferred_client_id)
+        while client_id in _allocated_client_ids:
+            client_id += 1
+        _allocated_client_ids.add(client_id)
+    return client_id
+
+
+def release_client_id(client_id):
+    with _client_id_lock:
+        _allocated_client_ids.discard(client_id)
+
+
+# One long-lived connection: an ibkr_app, the thread running its message loop
+# and the handshake (isConnected + nextValidId) that used to be repeated in
+# every synchronous function. History requests on the session go through its
+# historical_data_scheduler so they respect IB's pacing rules.
+class ibkr_session:
+    def __init__(self, hostname, port, client_id, timeout_sec=5,
+                 max_historical_requests_in_flight=50):
+        self.hostname = hostname
+        self.port = int(port)
+        self.client_id = int(client_id)
+        self.timeout_sec = timeout_sec
+        self.app = ibkr_app()
+        self.api_thread = None
+        self.historical_data_scheduler = historical_data_scheduler(
+            app=self.app, request_timeout=timeout_sec,
+            max_in_flight=max_historical_requests_in_flight
+        )
+
+    def connect(self):
+        app = self.app
+        # EClient.connect does the socket handshake itself, so the app is
+        # either connected when it returns or the connection failed.
+        app.connect(self.hostname, self.port, self.client_id)
+        if not app.isConnected():
+            raise ibkr_connection_error(
+                "ibkr_session", "connect", "couldn't connect to IBKR"
+            )
+
+        self.api_thread = threading.Thread(target=app.run, daemon=True)
+        self.api_thread.start()
+        if not app.wait_for_next_valid_id(self.timeout_sec):
+            self.disconnect()
+            raise ibkr_timeout_error(
+                "ibkr_session", "timeout", "next_valid_id not received"
+            )
+        self.historical_data_scheduler.start()
+
+    def disconnect(self):
+        if self.app.isConnected():
+            self.app.disconnect()
+        if self.api_thread is not None and \
+                self.api_thread is not threading.current_thread():
+            self.api_thread.join(self.timeout_sec)
+        self.api_thread = None
+
+    def close(self):
+        self.historical_data_scheduler.stop()
+        self.disconnect()
+
+    def reconnect(self):
+        self.disconnect()
+        self.connect()
+
+    def is_healthy(self):
+        return self.app.isConnected() and self.api_thread is not None and \
+            self.api_thread.is_alive()
+
+    # Round trip through TWS. A socket can look connected long after the
+    # other side stopped answering, so the health checks use this.
+    def ping(self):
+        if not self.is_healthy():
+            return False
+        future = self.app.register_request(CURRENT_TIME_REQUEST)
+        self.app.reqCurrentTime()
+        try:
+            future.result(timeout=self.timeout_sec)
+        except (FutureTimeoutError, ibkr_error):
+            self.app.forget_request(CURRENT_TIME_REQUEST)
+            return False
+        return True
+
+    def ensure_connected(self):
+        if not self.is_healthy():
+            self.reconnect()
+
+
+# A fixed number of sessions to one TWS / Gateway. Sessions are created
+# lazily, checked out one caller at a time and reconnected when a health
+# check or a checkout finds them broken.
+class ibkr_session_pool:
+    def __init__(self, hostname, port, client_id, pool_size=1, timeout_sec=5,
+                 health_check_interval=None, session_factory=ibkr_session):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self.hostname = hostname
+        self.port = int(port)
+        self.client_id = int(client_id)
+        self.pool_size = pool_size
+        self.timeout_sec = timeout_sec
+        self.session_factory = session_factory
+        self.sessions = []
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._health_thread = None
+        self._stop_health_checks = threading.Event()
+        if health_check_interval:
+            self.start_health_checks(health_check_interval)
+
+    def _new_session(self):
+        client_id = allocate_client_id(self.client_id + len(self.sessions))
+        session = self.session_factory(
+            self.hostname, self.port, client_id, self.timeout_sec
+        )
+        self.sessions.append(session)
+        return session
+
+    def _checkout(self):
+        if self._closed:
+            raise ibkr_connection_error("ibkr_session_pool", "closed",
+                                        "the session pool has been closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self.sessions) < self.pool_size:
+                return self._new_session()
+        try:
+            return self._idle.get(timeout=self.timeout_sec)
+        except queue.Empty:
+            raise ibkr_timeout_error("ibkr_session_pool", "timeout",
+                                     "no session became available")
+
+    @contextmanager
+    def session(self):
+        session = self._checkout()
+        try:
+            session.ensure_connected()
+            yield session
+        finally:
+            self._idle.put(session)
+
+    def check_health(self):
+        # Only idle sessions are checked; a session that is checked out is
+        # checked again by ensure_connected the next time it is handed out.
+        for _ in range(self._idle.qsize()):
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if not session.ping():
+                    session.reconnect()
+            except Exception:
+                session.disconnect()
+            finally:
+                self._idle.put(session)
+
+    def start_health_checks(self, interval):
+        if self._health_thread is not None:
+            return
+
+        def health_loop():
+            while not self._stop_health_checks.wait(interval):
+                self.check_health()
+
+        self._stop_health_checks.clear()
+        self._health_thread = threading.Thread(target=health_loop,
+                                               daemon=True)
+        self._health_thread.start()
+
+    def stop_health_checks(self):
+        self._stop_health_checks.set()
+        if self._health_thread is not None:
+            self._health_thread.join()
+        self._health_thread = None
+
+    def close(self):
+        self._closed = True
+        self.stop_health_checks()
+        with self._lock:
+            for session in self.sessions:
+                session.close()
+                release_client_id(session.client_id)
+            self.sessions = []
+
+
+# Pools shared by the synchronous functions, one per
+# (hostname, port, client_id) they are called with.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_session_pool(hostname, port, client_id, pool_size=1, timeout_sec=5,
+                     health_check_interval=None):
+    key = (hostname, int(port), int(client_id))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ibkr_session_pool(
+                hostname, port, client_id, pool_size=pool_size,
+                timeout_sec=timeout_sec,
+                health_check_interval=health_check_interval
+            )
+            _pools[key] = pool
+    return pool
+
+
+def close_session_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_session_pools)
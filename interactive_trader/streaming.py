@@ -0,0 +1,224 @@
+from interactive_trader.exceptions import ibkr_request_error
+from ibapi.ticktype import TickTypeEnum
+import threading
+import time
+import numpy as np
+
+TICK_DTYPE = np.dtype([
+    ('time', '<f8'), ('tick_type', '<i2'), ('price', '<f8'), ('size', '<f8')
+])
+REALTIME_BAR_DTYPE = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'),
+    ('close', '<f8'), ('volume', '<f8'), ('wap', '<f8'), ('count', '<i8')
+])
+
+
+# Fixed-size buffer of records allocated up front; once full, every new
+# record overwrites the oldest one, so memory stays the same however long
+# a subscription runs.
+class ring_buffer:
+    __slots__ = ('capacity', '_records', '_count', '_lock')
+
+    def __init__(self, dtype, capacity):
+        self.capacity = capacity
+        self._records = np.zeros(capacity, dtype=dtype)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def append(self, record):
+        with self._lock:
+            self._records[self._count % self.capacity] = record
+            self._count += 1
+
+    # The newest n records (all of them by default), oldest first, as a
+    # copy of the structured array: last(100)['price'] is a float64 array.
+    def last(self, n=None):
+        with self._lock:
+            available = min(self._count, self.capacity)
+            n = available if n is None else min(n, available)
+            end = self._count % self.capacity
+            start = end - n
+            if start >= 0:
+                return self._records[start:end].copy()
+            return np.concatenate(
+                [self._records[start:], self._records[:end]]
+            )
+
+    def latest(self):
+        with self._lock:
+            if self._count == 0:
+                return None
+            return self._records[(self._count - 1) % self.capacity].copy()
+
+
+# Everything received for one subscribed contract: ticks, 5 second bars and
+# a snapshot of the latest value of every tick type ('BID', 'ASK', 'LAST',
+# 'BID_SIZE', 'VOLUME', ...).
+class market_data_subscription:
+    def __init__(self, key, contract, tick_capacity, bar_capacity):
+        self.key = key
+        self.contract = contract
+        self.ticks = ring_buffer(TICK_DTYPE, tick_capacity)
+        self.bars = ring_buffer(REALTIME_BAR_DTYPE, bar_capacity)
+        self.snapshot = {}
+        self.market_data_req_id = None
+        self.realtime_bars_req_id = None
+        # What the requests were sent with, so resubscribe asks for the same.
+        self.generic_ticks = ''
+        self.bar_what_to_show = 'TRADES'
+        self.useRTH = False
+        self.error = None
+
+
+# Streaming market data for many contracts over one connection. ibkr_app
+# routes tickPrice / tickSize / realtimeBar to the stream by reqId; ticks
+# and bars go into per-contract ring buffers, which can be read at any time
+# (latest, last_ticks, last_bars) or followed with add_callback.
+#
+# Contracts are keyed by conId, or by symbol for contracts without one;
+# the contract cache can resolve conIds first.
+class market_data_stream:
+    def __init__(self, app, tick_capacity=100000, bar_capacity=10000):
+        self.app = app
+        self.tick_capacity = tick_capacity
+        self.bar_capacity = bar_capacity
+        self.subscriptions = {}
+        self._by_req_id = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(contract):
+        return contract.conId or contract.symbol
+
+    def subscribe(self, contract, generic_ticks='', realtime_bars=False,
+                  bar_what_to_show='TRADES', useRTH=False):
+        key = self.key(contract)
+        with self._lock:
+            subscription = self.subscriptions.get(key)
+            if subscription is None:
+                subscription = market_data_subscription(
+                    key, contract, self.tick_capacity, self.bar_capacity
+                )
+                self.subscriptions[key] = subscription
+            send_ticks = subscription.market_data_req_id is None
+            send_bars = realtime_bars and \
+                subscription.realtime_bars_req_id is None
+            if send_ticks:
+                subscription.market_data_req_id = self.app.next_request_id()
+                subscription.generic_ticks = generic_ticks
+                self._by_req_id[subscription.market_data_req_id] = \
+                    subscription
+            if send_bars:
+                subscription.realtime_bars_req_id = self.app.next_request_id()
+                subscription.bar_what_to_show = bar_what_to_show
+                subscription.useRTH = useRTH
+                self._by_req_id[subscription.realtime_bars_req_id] = \
+                    subscription
+
+        if send_ticks:
+            self.app.add_stream_handler(subscription.market_data_req_id, self)
+            self.app.reqMktData(subscription.market_data_req_id, contract,
+                                generic_ticks, False, False, [])
+        if send_bars:
+            self.app.add_stream_handler(subscription.realtime_bars_req_id,
+                                        self)
+            self.app.reqRealTimeBars(subscription.realtime_bars_req_id,
+                                     contract, 5, bar_what_to_show, useRTH,
+                                     [])
+        return subscription
+
+    def unsubscribe(self, contract):
+        with self._lock:
+            subscription = self.subscriptions.pop(self.key(contract), None)
+            if subscription is None:
+                return
+            for req_id in (subscription.market_data_req_id,
+                           subscription.realtime_bars_req_id):
+                self._by_req_id.pop(req_id, None)
+        if subscription.market_data_req_id is not None:
+            self.app.remove_stream_handler(subscription.market_data_req_id)
+            self.app.cancelMktData(subscription.market_data_req_id)
+        if subscription.realtime_bars_req_id is not None:
+            self.app.remove_stream_handler(subscription.realtime_bars_req_id)
+            self.app.cancelRealTimeBars(subscription.realtime_bars_req_id)
+
+    def close(self):
+        for subscription in list(self.subscriptions.values()):
+            self.unsubscribe(subscription.contract)
+
+    # Subscriptions die with the connection; after a reconnect this sends
+    # them again under new reqIds, keeping the buffers and what's in them.
+    def resubscribe(self):
+        with self._lock:
+            subscriptions = list(self.subscriptions.values())
+            self._by_req_id.clear()
+        for subscription in subscriptions:
+            realtime_bars = subscription.realtime_bars_req_id is not None
+            for req_id in (subscription.market_data_req_id,
+                           subscription.realtime_bars_req_id):
+                if req_id is not None:
+                    self.app.remove_stream_handler(req_id)
+            subscription.market_data_req_id = None
+            subscription.realtime_bars_req_id = None
+            subscription.error = None
+            self.subscribe(subscription.contract,
+                           generic_ticks=subscription.generic_ticks,
+                           realtime_bars=realtime_bars,
+                           bar_what_to_show=subscription.bar_what_to_show,
+                           useRTH=subscription.useRTH)
+
+    # callback(key, kind, record) is called on the API thread for every
+    # tick (kind 'tick') and bar (kind 'bar'); keep it short.
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self._callbacks.remove(callback)
+
+    def latest(self, key):
+        return dict(self.subscriptions[key].snapshot)
+
+    def last_ticks(self, key, n=None):
+        return self.subscriptions[key].ticks.last(n)
+
+    def last_bars(self, key, n=None):
+        return self.subscriptions[key].bars.last(n)
+
+    def _publish(self, subscription, kind, record):
+        for callback in self._callbacks:
+            callback(subscription.key, kind, record)
+
+    # Called by ibkr_app on the API thread.
+    def on_tick_price(self, req_id, tick_type, price):
+        self._on_tick(req_id, tick_type, price, np.nan, price)
+
+    def on_tick_size(self, req_id, tick_type, size):
+        self._on_tick(req_id, tick_type, np.nan, size, size)
+
+    def _on_tick(self, req_id, tick_type, price, size, value):
+        subscription = self._by_req_id.get(req_id)
+        if subscription is None:
+            return
+        record = (time.time(), tick_type, price, size)
+        subscription.ticks.append(record)
+        subscription.snapshot[TickTypeEnum.to_str(tick_type)] = value
+        if self._callbacks:
+            self._publish(subscription, 'tick', record)
+
+    def on_realtime_bar(self, req_id, record):
+        subscription = self._by_req_id.get(req_id)
+        if subscription is None:
+            return
+        subscription.bars.append(record)
+        if self._callbacks:
+            self._publish(subscription, 'bar', record)
+
+    def on_error(self, req_id, error_code, error_string):
+        subscription = self._by_req_id.get(req_id)
+        if subscription is not None:
+            subscription.error = ibkr_request_error(req_id, error_code,
+                                                    error_string)
@@ -1,256 +1,280 @@
-
-from interactive_trader.ibkr_app import ibkr_app
-import threading
+from interactive_trader.session_pool import get_session_pool
+from interactive_trader.bar_store import bar_store_key, default_bar_store, \
+    format_end_date_time, parse_bar_dates, parse_duration, request_window
+from interactive_trader.contract_cache import default_contract_cache
+from interactive_trader.ibkr_app import CURRENT_TIME_REQUEST
+from interactive_trader.exceptions import ibkr_request_error, \
+    ibkr_timeout_error
+from interactive_trader.pacing import MESSAGE_LIMIT, rolling_window_limit
+from ibapi.contract import Contract
 import time
-from datetime import datetime
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 # If you want different default values, configure it here.
 default_hostname = '127.0.0.1'
 default_port = 7497
 default_client_id = 10645 # can set and use your Master Client ID
 timeout_sec = 5
+# Connections kept open per (hostname, port, client_id). Pooled sessions use
+# client ids counting up from client_id.
+pool_size = 1
+health_check_interval = 30
+# Longest a history call waits, queueing included. IB allows 60 history
+# requests in any 10 minutes, so a long batch can take that long.
+historical_data_timeout_sec = 600
+
+
+def _session_pool(hostname, port, client_id):
+    return get_session_pool(
+        hostname, port, client_id, pool_size=pool_size,
+        timeout_sec=timeout_sec, health_check_interval=health_check_interval
+    )
+
+
+# Blocks until the callbacks complete the request registered under req_id.
+# Errors TWS sends for req_id are raised from here as ibkr_request_error.
+def _wait_for(future, req_id, session, function_name, message):
+    try:
+        return future.result(timeout=timeout_sec)
+    except FutureTimeoutError:
+        # Answers are kept by req_id, so once the request is forgotten a
+        # late one is dropped rather than mixed with the next caller's. The
+        # connection stays up: other callers' history requests are still in
+        # flight on it.
+        session.app.forget_request(req_id)
+        raise ibkr_timeout_error(function_name, "timeout", message)
+
+
+# History requests are queued by the session's historical_data_scheduler,
+# which sends them and collects the answers on its own. The session goes back
+# to the pool as soon as they are submitted, so other callers can use the
+# connection while the requests wait for their turn under IB's pacing rules.
+def _submit_historical_data(hostname, port, client_id, requests):
+    with _session_pool(hostname, port, client_id).session() as session:
+        scheduler = session.historical_data_scheduler
+        return [scheduler.submit(*request) for request in requests]
+
+
+# Waits until deadline (time.monotonic()) for a submitted history request and
+# returns the error TWS answered it with, or None. The scheduler times out
+# requests that were sent and got no answer; time spent queued behind the
+# pacing limits only counts towards historical_data_timeout_sec.
+def _wait_for_historical_data(future, deadline, function_name):
+    try:
+        return future.exception(timeout=max(0, deadline - time.monotonic()))
+    except FutureTimeoutError:
+        raise ibkr_timeout_error(function_name, "timeout",
+                                 "historical_data not received")
+
 
 def fetch_managed_accounts(hostname=default_hostname, port=default_port,
                            client_id=default_client_id):
-
-    app = ibkr_app()
-    app.connect(hostname, int(port), int(client_id))
-
-    start_time = datetime.now()
-    while not app.isConnected():
-        time.sleep(0.01)
-        if (datetime.now() - start_time).seconds > timeout_sec:
-            app.disconnect()
-            raise Exception(
-                "fetch_managed_accounts",
-                "timeout",
-                "couldn't connect to IBKR"
-            )
-
-    def run_loop():
-        app.run()
-
-    api_thread = threading.Thread(target=run_loop, daemon=True)
-    api_thread.start()
-    while app.next_valid_id is None:
-        time.sleep(0.01)
-    app.disconnect()
-    return app.managed_accounts
+    with _session_pool(hostname, port, client_id).session() as session:
+        app = session.app
+        if not app.managed_accounts_event.wait(timeout_sec):
+            raise ibkr_timeout_error("fetch_managed_accounts", "timeout",
+                                     "managed_accounts not received")
+        return list(app.managed_accounts)
 
 def fetch_current_time(hostname=default_hostname,
                        port=default_port, client_id=default_client_id):
-    app = ibkr_app()
-    app.connect(hostname, int(port), int(client_id))
-    start_time = datetime.now()
-    while not app.isConnected():
-        time.sleep(0.01)
-        if (datetime.now() - start_time).seconds > timeout_sec:
-            app.disconnect()
-            raise Exception(
-                "fetch_current_time",
-                "timeout",
-                "couldn't connect to IBKR"
-            )
-
-    def run_loop():
-        app.run()
-
-    api_thread = threading.Thread(target=run_loop, daemon=True)
-    api_thread.start()
-    start_time = datetime.now()
-    while app.next_valid_id is None:
-        time.sleep(0.01)
-        if (datetime.now() - start_time).seconds > timeout_sec:
-            app.disconnect()
-            raise Exception(
-                "fetch_current_time",
-                "timeout",
-                "next_valid_id not received"
-            )
-
-    app.reqCurrentTime()
-    start_time = datetime.now()
-    while app.current_time is None:
-        time.sleep(0.01)
-        if (datetime.now() - start_time).seconds > timeout_sec:
-            app.disconnect()
-            raise Exception(
-                "fetch_current_time",
-                "timeout",
-                "current_time not received"
-            )
-    app.disconnect()
-    return app.current_time
+    with _session_pool(hostname, port, client_id).session() as session:
+        app = session.app
+        future = app.register_request(CURRENT_TIME_REQUEST)
+        app.reqCurrentTime()
+        return _wait_for(future, CURRENT_TIME_REQUEST, session,
+                         "fetch_current_time", "current_time not received")
 
 
 def fetch_historical_data(contract, endDateTime='', durationStr='30 D',
                           barSizeSetting='1 hour', whatToShow='MIDPOINT',
                           useRTH=True, hostname=default_hostname,
                           port=default_port, client_id=default_client_id):
-    app = ibkr_app()
-    app.connect(hostname, int(port), int(client_id))
-    start_time = datetime.now()
-    while not app.isConnected():
-        time.sleep(0.01)
-    if (datetime.now() - start_time).seconds > timeout_sec:
-        app.disconnect()
-        raise Exception(
-            "fetch_historical_data",
-            "timeout",
-            "couldn't connect to IBKR"
+    deadline = time.monotonic() + historical_data_timeout_sec
+    future, = _submit_historical_data(
+        hostname, port, client_id,
+        [(contract, endDateTime, durationStr, barSizeSetting, whatToShow,
+          useRTH)]
+    )
+    exception = _wait_for_historical_data(future, deadline,
+                                          "fetch_historical_data")
+    if exception is not None:
+        raise exception
+    return future.result()
+
+# Same as fetch_historical_data for a list of contracts, sent over one
+# connection as fast as IB's pacing rules allow. Returns the DataFrames in
+# the order of contracts. With return_exceptions=True a request TWS answers
+# with an error gives its exception in place of a DataFrame instead of
+# raising it.
+def fetch_historical_data_many(contracts, endDateTime='', durationStr='30 D',
+                               barSizeSetting='1 hour', whatToShow='MIDPOINT',
+                               useRTH=True, return_exceptions=False,
+                               hostname=default_hostname, port=default_port,
+                               client_id=default_client_id):
+    deadline = time.monotonic() + historical_data_timeout_sec
+    futures = _submit_historical_data(
+        hostname, port, client_id,
+        [(contract, endDateTime, durationStr, barSizeSetting, whatToShow,
+          useRTH) for contract in contracts]
+    )
+    results = []
+    for future in futures:
+        exception = _wait_for_historical_data(future, deadline,
+                                              "fetch_historical_data_many")
+        if exception is None:
+            results.append(future.result())
+        elif return_exceptions:
+            results.append(exception)
+        else:
+            raise exception
+    return results
+
+# Same as fetch_historical_data, but served from a local bar_store: only the
+# part of the window the store doesn't cover yet is requested from IB (the
+# missing head and/or the new tail), merged into the store and the whole
+# window is then read back from disk. Dates come back as datetime64 rather
+# than IB's strings.
+def fetch_historical_data_cached(contract, endDateTime='', durationStr='30 D',
+                                 barSizeSetting='1 hour',
+                                 whatToShow='MIDPOINT', useRTH=True,
+                                 store=None, hostname=default_hostname,
+                                 port=default_port,
+                                 client_id=default_client_id):
+    store = store or default_bar_store()
+    key = bar_store_key(contract, barSizeSetting, whatToShow, useRTH)
+    start, end = request_window(endDateTime, durationStr)
+    missing = store.missing_requests(key, start, end)
+    if missing:
+        deadline = time.monotonic() + historical_data_timeout_sec
+        futures = _submit_historical_data(
+            hostname, port, client_id,
+            [(contract,
+              '' if not endDateTime and request_end == end
+              else format_end_date_time(request_end),
+              duration, barSizeSetting, whatToShow, useRTH)
+             for request_end, duration in missing]
         )
-
-    def run_loop():
-        app.run()
-    api_thread = threading.Thread(target=run_loop, daemon=True)
-    api_thread.start()
-    start_time = datetime.now()
-    while app.next_valid_id is None:
-        time.sleep(0.01)
-        if (datetime.now() - start_time).seconds > timeout_sec:
-            app.disconnect()
-            raise Exception(
-                "fetch_historical_data",
-                "timeout",
-                "next_valid_id not received"
+        for (request_end, duration), future in zip(missing, futures):
+            exception = _wait_for_historical_data(
+                future, deadline, "fetch_historical_data_cached"
             )
-    tickerId = app.next_valid_id
-    app.reqHistoricalData(
-        tickerId, contract, endDateTime, durationStr, barSizeSetting,
-        whatToShow, useRTH, formatDate=1, keepUpToDate=False, chartOptions=[])
-    start_time = datetime.now()
-    while app.historical_data_end != tickerId:
-        time.sleep(0.01)
-        if (datetime.now() - start_time).seconds > timeout_sec:
-            app.disconnect()
-            raise Exception(
-                "fetch_historical_data",
-                "timeout",
-                "historical_data not received"
-            )
-    app.disconnect()
-    return app.historical_data
-
+            if exception is not None:
+                raise exception
+            bars = future.result()
+            covered_to = request_end
+            if request_end == end and not bars.empty:
+                # The last bar may still be forming; leave it outside the
+                # covered range so the next call fetches it again.
+                covered_to = min(
+                    request_end, parse_bar_dates(bars['date']).iloc[-1]
+                )
+            store.write(key, bars, request_end - parse_duration(duration),
+                        covered_to)
+    return store.read(key, start, end)
+
+# Answers come from the contract cache when it has them (including cached
+# "no security definition" errors); use_cache=False always asks TWS.
 def fetch_contract_details(contract, hostname=default_hostname,
-                           port=default_port, client_id=default_client_id):
-    app = ibkr_app()
-    app.connect(hostname, int(port), int(client_id))
-    start_time = datetime.now()
-    while not app.isConnected():
-        time.sleep(0.01)
-        if (datetime.now() - start_time).seconds > timeout_sec:
-            app.disconnect()
-            raise Exception(
-                "fetch_contract_details",
-                "timeout",
-                "couldn't connect to IBKR"
-            )
-
-    def run_loop():
-        app.run()
-
-    api_thread = threading.Thread(target=run_loop, daemon=True)
-    api_thread.start()
-    start_time = datetime.now()
-    while app.next_valid_id is None:
-        time.sleep(0.01)
-        if (datetime.now() - start_time).seconds > timeout_sec:
-            app.disconnect()
-            raise Exception(
-                "fetch_contract_details",
-                "timeout",
-                "next_valid_id not received"
-            )
-
-    tickerId = app.next_valid_id
-    app.reqContractDetails(tickerId, contract)
-
-    start_time = datetime.now()
-    while app.contract_details_end != tickerId:
-        time.sleep(0.01)
-        if (datetime.now() - start_time).seconds > timeout_sec:
-            app.disconnect()
-            raise Exception(
-                "fetch_contract_details",
-                "timeout",
-                "contract_details not received"
-            )
-
-    app.disconnect()
-
-    return app.contract_details
+                           port=default_port, client_id=default_client_id,
+                           use_cache=True):
+    cache = default_contract_cache()
+    if use_cache:
+        contract_details = cache.get_contract_details(contract)
+        if contract_details is not None:
+            return contract_details
+
+    with _session_pool(hostname, port, client_id).session() as session:
+        tickerId, future = session.app.request_contract_details(contract)
+        try:
+            contract_details = _wait_for(future, tickerId, session,
+                                         "fetch_contract_details",
+                                         "contract_details not received")
+        except ibkr_request_error as error:
+            cache.put_contract_details_error(contract, error)
+            raise
+    cache.put_contract_details(contract, contract_details)
+    return contract_details
 
 def fetch_matching_symbols(pattern, hostname=default_hostname,
-                           port=default_port, client_id=default_client_id):
-    app = ibkr_app()
-    app.connect(hostname, int(port), int(client_id))
-    start_time = datetime.now()
-    while not app.isConnected():
-        time.sleep(0.01)
-        if (datetime.now() - start_time).seconds > timeout_sec:
-            app.disconnect()
-            raise Exception(
-                "fetch_contract_details",
-                "timeout",
-                "couldn't connect to IBKR"
-            )
-
-    def run_loop():
-        app.run()
-
-    api_thread = threading.Thread(target=run_loop, daemon=True)
-    api_thread.start()
-    start_time = datetime.now()
-    while app.next_valid_id is None:
-        time.sleep(0.01)
-        if (datetime.now() - start_time).seconds > timeout_sec:
-            app.disconnect()
-            raise Exception(
-                "fetch_contract_details",
-                "timeout",
-                "next_valid_id not received"
-            )
-
-    req_id = app.next_valid_id
-    app.reqMatchingSymbols(req_id, pattern)
-
-    start_time = datetime.now()
-    while app.matching_symbols is None:
-        time.sleep(0.01)
-        if (datetime.now() - start_time).seconds > timeout_sec:
-            app.disconnect()
-            raise Exception(
-                "fetch_contract_details",
-                "timeout",
-                "contract_details not received"
+                           port=default_port, client_id=default_client_id,
+                           use_cache=True):
+    cache = default_contract_cache()
+    if use_cache:
+        matching_symbols = cache.get_matching_symbols(pattern)
+        if matching_symbols is not None:
+            return matching_symbols
+
+    with _session_pool(hostname, port, client_id).session() as session:
+        req_id, future = session.app.request_matching_symbols(pattern)
+        matching_symbols = _wait_for(future, req_id, session,
+                                     "fetch_matching_symbols",
+                                     "matching_symbols not received")
+    cache.put_matching_symbols(pattern, matching_symbols)
+    return matching_symbols
+
+# Fills the contract cache for a list of symbols (or Contracts) in one go,
+# with all the queries in flight on one connection at once. Returns the
+# number of contracts that resolved.
+def warm_contract_cache(symbols, sec_type='STK', exchange='SMART',
+                        currency='USD', hostname=default_hostname,
+                        port=default_port, client_id=default_client_id):
+    cache = default_contract_cache()
+    contracts = []
+    for symbol in symbols:
+        if isinstance(symbol, Contract):
+            contracts.append(symbol)
+            continue
+        contract = Contract()
+        contract.symbol = symbol
+        contract.secType = sec_type
+        contract.exchange = exchange
+        contract.currency = currency
+        contracts.append(contract)
+
+    resolved = 0
+    message_limit = rolling_window_limit(*MESSAGE_LIMIT)
+    with _session_pool(hostname, port, client_id).session() as session:
+        requests = []
+        for contract in contracts:
+            time.sleep(message_limit.delay(time.monotonic()))
+            message_limit.record(time.monotonic())
+            requests.append(
+                (contract, session.app.request_contract_details(contract))
             )
-
-    app.disconnect()
-
-    return app.matching_symbols
-
+        for contract, (req_id, future) in requests:
+            try:
+                contract_details = _wait_for(future, req_id, session,
+                                             "warm_contract_cache",
+                                             "contract_details not received")
+            except ibkr_request_error as error:
+                cache.put_contract_details_error(contract, error)
+                continue
+            cache.put_contract_details(contract, contract_details)
+            resolved += 1
+    return resolved
+
+# Returns the order_status rows of the order placed. Before connections were
+# pooled this was the whole order_status frame of a connection opened for the
+# order; a pooled session's frame also holds every other order its client id
+# has seen, so it is narrowed to this order (callers reading the columns of
+# the result, like Examples/place_orders_example.py, are unaffected).
 def place_order(contract, order, hostname=default_hostname,
                            port=default_port, client_id=default_client_id):
-
-    app = ibkr_app()
-    app.connect(hostname, port, client_id)
-    while not app.isConnected():
-        time.sleep(0.01)
-
-    def run_loop():
-        app.run()
-
-    api_thread = threading.Thread(target=run_loop, daemon=True)
-    api_thread.start()
-
-    while app.next_valid_id is None:
-        time.sleep(0.01)
-
-    app.placeOrder(app.next_valid_id, contract, order)
-    while not ('Submitted' in set(app.order_status['status'])):
-        time.sleep(0.25)
-
-    app.disconnect()
-
-    return app.order_status
-
+    with _session_pool(hostname, port, client_id).session() as session:
+        app = session.app
+        order_id = app.next_request_id()
+        future = app.register_request(order_id)
+        app.placeOrder(order_id, contract, order)
+        try:
+            future.result(timeout=timeout_sec)
+        except FutureTimeoutError:
+            # The order has gone out and may be working, so the connection
+            # is kept: its status updates are keyed by order_id, which no
+            # other request uses, and keep arriving in order_status.
+            app.forget_request(order_id)
+            raise ibkr_timeout_error("place_order", "timeout",
+                                     "order_status not received")
+        order_status = app.order_status
+        return order_status[order_status['order_id'] == order_id] \
+            .reset_index(drop=True)
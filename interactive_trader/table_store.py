@@ -0,0 +1,286 @@
+from interactive_trader.ibkr_app import ORDER_STATUS_COLUMNS, \
+    ORDER_STATUS_KEY, ERROR_MESSAGES_COLUMNS
+import sqlite3
+import threading
+
+# Operators of a DataTable filter_query (filter_action='custom'), longest
+# first so that '>=' isn't read as '>'.
+FILTER_OPERATORS = [
+    ('>=', '>='), ('ge', '>='), ('<=', '<='), ('le', '<='), ('!=', '!='),
+    ('ne', '!='), ('<', '<'), ('lt', '<'), ('>', '>'), ('gt', '>'),
+    ('=', '='), ('eq', '='), ('contains', 'contains'),
+    ('datestartswith', 'datestartswith')
+]
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _filter_value(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'`':
+        return value[1:-1]
+    try:
+        return float(value) if '.' in value or 'e' in value.lower() \
+            else int(value)
+    except ValueError:
+        return value
+
+
+# One '{column} operator value' term of a filter_query, as
+# (column, operator, value), or None if it can't be read.
+def split_filter_part(filter_part):
+    filter_part = filter_part.strip()
+    if not filter_part.startswith('{') or '}' not in filter_part:
+        return None
+    column, rest = filter_part[1:].split('}', 1)
+    rest = rest.strip()
+    # 'i' / 's' in front of an operator ask for a case-insensitive or
+    # case-sensitive comparison; both are run the same way.
+    for case in ('', 'i', 's'):
+        for name, operator in FILTER_OPERATORS:
+            name = case + name
+            if rest.startswith(name) and \
+                    (not name.isalpha() or rest[len(name):][:1] in ' '):
+                return column, operator, _filter_value(rest[len(name):])
+    return None
+
+
+# The WHERE clause (without WHERE) and its parameters for a DataTable
+# filter_query. Terms on columns the table doesn't have are dropped, and
+# every value goes in as a parameter.
+def filter_to_sql(filter_query, columns):
+    clauses = []
+    params = []
+    for filter_part in (filter_query or '').split(' && '):
+        term = split_filter_part(filter_part)
+        if term is None or term[0] not in columns:
+            continue
+        column, operator, value = term
+        if operator == 'contains':
+            clauses.append(f"{_quote(column)} LIKE ? ESCAPE '\\'")
+            params.append('%' + _escape_like(str(value)) + '%')
+        elif operator == 'datestartswith':
+            clauses.append(f"{_quote(column)} LIKE ? ESCAPE '\\'")
+            params.append(_escape_like(str(value)) + '%')
+        else:
+            clauses.append(f"{_quote(column)} {operator} ?")
+            params.append(value)
+    return ' AND '.join(clauses), params
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%') \
+        .replace('_', '\\_')
+
+
+# ORDER BY (without ORDER BY) for a DataTable sort_by; rows without a sort
+# keep the order they came in.
+def sort_to_sql(sort_by, columns):
+    terms = [
+        f"{_quote(sort['column_id'])} "
+        f"{'DESC' if sort.get('direction') == 'desc' else 'ASC'}"
+        for sort in (sort_by or []) if sort.get('column_id') in columns
+    ]
+    return ', '.join(terms + ['rowid'])
+
+
+# Tables in SQLite (in memory by default) that DataTables page through with
+# page_action / sort_action / filter_action = 'custom': page() runs the
+# table's filter and sort on indexed columns and returns only the rows of
+# the page being shown. One connection is shared by every thread, behind a
+# lock.
+class table_store:
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.columns = {}
+        self.key_columns = {}
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    # Rows with the same key_columns replace each other (and keep their
+    # place); every list in indexes gets an index.
+    def create_table(self, name, columns, key_columns=None, indexes=()):
+        self.columns[name] = list(columns)
+        self.key_columns[name] = list(key_columns or [])
+        column_list = ', '.join(_quote(column) for column in columns)
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {_quote(name)} ({column_list})"
+            )
+            if key_columns:
+                self._connection.execute(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS "
+                    f"{_quote(name + '_key')} ON {_quote(name)} "
+                    f"({', '.join(_quote(column) for column in key_columns)})"
+                )
+            for index_columns in indexes:
+                index_name = '_'.join([name] + list(index_columns))
+                self._connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {_quote(index_name)} "
+                    f"ON {_quote(name)} "
+                    f"({', '.join(_quote(c) for c in index_columns)})"
+                )
+
+    def _insert_sql(self, name):
+        columns = self.columns[name]
+        key_columns = self.key_columns[name]
+        sql = f"INSERT INTO {_quote(name)} VALUES " \
+              f"({', '.join('?' for _ in columns)})"
+        if key_columns:
+            updates = ', '.join(f"{_quote(c)} = excluded.{_quote(c)}"
+                                for c in columns if c not in key_columns)
+            sql += f" ON CONFLICT " \
+                   f"({', '.join(_quote(c) for c in key_columns)}) " \
+                   f"DO UPDATE SET {updates}"
+        return sql
+
+    def _rows(self, name, records):
+        columns = self.columns[name]
+        return [tuple(record[column] for column in columns)
+                for record in records]
+
+    def insert(self, name, records):
+        rows = self._rows(name, records)
+        with self._lock, self._connection:
+            self._connection.executemany(self._insert_sql(name), rows)
+        return len(rows)
+
+    # Replaces the rows matching every column == value of where (all of
+    # them without where) with records, in one transaction.
+    def replace(self, name, records, where=None):
+        where_sql, params = self._where(name, where)
+        rows = self._rows(name, records)
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"DELETE FROM {_quote(name)}{where_sql}", params
+            )
+            self._connection.executemany(self._insert_sql(name), rows)
+        return len(rows)
+
+    def delete(self, name, where=None):
+        where_sql, params = self._where(name, where)
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"DELETE FROM {_quote(name)}{where_sql}", params
+            )
+
+    # Deletes the oldest rows (first inserted) past the newest max_rows.
+    def trim(self, name, max_rows):
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"DELETE FROM {_quote(name)} WHERE rowid <= "
+                f"(SELECT rowid FROM {_quote(name)} ORDER BY rowid DESC "
+                f"LIMIT 1 OFFSET ?)", (max_rows,)
+            )
+
+    def _where(self, name, where, filter_query=None):
+        columns = self.columns[name]
+        clauses = [f"{_quote(column)} = ?" for column in (where or {})
+                   if column in columns]
+        params = [value for column, value in (where or {}).items()
+                  if column in columns]
+        filter_sql, filter_params = filter_to_sql(filter_query, columns)
+        if filter_sql:
+            clauses.append(filter_sql)
+            params += filter_params
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def count(self, name, where=None, filter_query=None):
+        where_sql, params = self._where(name, where, filter_query)
+        with self._lock:
+            return self._connection.execute(
+                f"SELECT COUNT(*) FROM {_quote(name)}{where_sql}", params
+            ).fetchone()[0]
+
+    # (records, page_count) for one page of a DataTable: page_current and
+    # page_size as the table sends them, sort_by and filter_query in the
+    # DataTable's format, and where for fixed column == value conditions.
+    def page(self, name, page_current=0, page_size=50, sort_by=None,
+             filter_query=None, where=None, columns=None):
+        columns = columns or self.columns[name]
+        where_sql, params = self._where(name, where, filter_query)
+        order_sql = sort_to_sql(sort_by, self.columns[name])
+        page_current = page_current or 0
+        with self._lock:
+            total = self._connection.execute(
+                f"SELECT COUNT(*) FROM {_quote(name)}{where_sql}", params
+            ).fetchone()[0]
+            rows = self._connection.execute(
+                f"SELECT {', '.join(_quote(c) for c in columns)} "
+                f"FROM {_quote(name)}{where_sql} ORDER BY {order_sql} "
+                f"LIMIT ? OFFSET ?",
+                params + [page_size, page_current * page_size]
+            ).fetchall()
+        page_count = max(1, -(-total // page_size))
+        return [dict(zip(columns, row)) for row in rows], page_count
+
+    # Every row page() pages through, in the same order: what a DataTable
+    # with custom paging should export, rather than its visible page.
+    def rows(self, name, sort_by=None, filter_query=None, where=None,
+             columns=None):
+        columns = columns or self.columns[name]
+        where_sql, params = self._where(name, where, filter_query)
+        order_sql = sort_to_sql(sort_by, self.columns[name])
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {', '.join(_quote(c) for c in columns)} "
+                f"FROM {_quote(name)}{where_sql} ORDER BY {order_sql}",
+                params
+            ).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+
+# The dashboard's copy of an ibkr_app's order status (latest row per order)
+# and error messages, in a table_store. refresh() copies only what changed
+# since the last refresh, so it can be called on every interval tick. With
+# max_rows each table keeps only its newest max_rows rows (and a batch more).
+class ibkr_tables:
+    def __init__(self, app, store=None, max_rows=None):
+        self.app = app
+        self.max_rows = max_rows
+        self._pending_trim = {'order_status': 0, 'error_messages': 0}
+        self.store = store or table_store()
+        self.store.create_table(
+            'order_status', ORDER_STATUS_COLUMNS,
+            key_columns=ORDER_STATUS_KEY,
+            indexes=[['status'], ['perm_id'], ['client_id']]
+        )
+        self.store.create_table(
+            'error_messages', ERROR_MESSAGES_COLUMNS,
+            indexes=[['reqId'], ['errorCode']]
+        )
+        self.order_status_sequence = 0
+        self.error_message_count = 0
+        self._lock = threading.Lock()
+
+    # (order status sequence, error message count), which go up whenever
+    # there is something new to show.
+    def refresh(self):
+        with self._lock:
+            sequence, changes = self.app.order_status_changes(
+                self.order_status_sequence
+            )
+            if changes:
+                self._insert('order_status',
+                             [record for _, record in changes])
+            self.order_status_sequence = sequence
+            count, records = self.app.error_messages_since(
+                self.error_message_count
+            )
+            if records:
+                self._insert('error_messages', records)
+            self.error_message_count = count
+            return self.order_status_sequence, self.error_message_count
+
+    def _insert(self, name, records):
+        self._pending_trim[name] += self.store.insert(name, records)
+        if self.max_rows is not None and \
+                self._pending_trim[name] >= max(1, self.max_rows // 16):
+            self.store.trim(name, self.max_rows)
+            self._pending_trim[name] = 0
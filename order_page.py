@@ -1,4 +1,4 @@
-from dash import dash_table
+from dash import dash_table, dcc, html
 import datetime
 import pandas as pd
 
@@ -8,10 +8,22 @@ blotter = pd.DataFrame(
              'client_id', 'why_held', 'mkt_cap_price']
 )
 
-order_page = dash_table.DataTable(
-    columns=[{"name": i, "id": i} for i in blotter.columns],
-    data=blotter.to_dict('records'),
-    id='trade-blotter'
-)
-
-
+# The table is paged, sorted and filtered on the server: it only ever holds
+# the page being shown. trade-blotter-sync holds the order status sequence
+# that page was read at, so an interval tick with nothing new sends nothing.
+order_page = html.Div([
+    dash_table.DataTable(
+        columns=[{"name": i, "id": i} for i in blotter.columns],
+        data=blotter.to_dict('records'),
+        page_current=0,
+        page_size=50,
+        page_action='custom',
+        sort_action='custom',
+        sort_mode='multi',
+        sort_by=[],
+        filter_action='custom',
+        filter_query='',
+        id='trade-blotter'
+    ),
+    dcc.Store(id='trade-blotter-sync')
+])
@@ -1,12 +1,34 @@
 import dash
+import os
+import threading
+import uuid
+from collections import deque
 import pandas as pd
-import final_project as fp
-from dash import dcc, html, callback, dash_table
+from dash import dcc, html, callback, dash_table, no_update
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
+from final_project.jobs import backtest_job_manager, FINISHED_STATES, DONE
+from final_project.result_cache import backtest_result_cache
+from interactive_trader.table_store import table_store
 
 blotter_data = pd.DataFrame(
     columns=['Date', 'Symbol', 'Trip', 'Action', 'Price', 'Size', 'Status'])
 
+# Blotters of the last MAX_BLOTTER_RUNS backtests, one run_id per run, so the blotter table can be paged, sorted and
+# filtered on the server instead of getting every trade.
+MAX_BLOTTER_RUNS = 20
+blotter_store = table_store()
+blotter_store.create_table('backtest_blotter', ['run_id'] + list(blotter_data.columns),
+                           indexes=[['run_id', 'Date'], ['run_id', 'Symbol'], ['run_id', 'Status']])
+blotter_runs = deque()
+blotter_runs_lock = threading.Lock()
+
+# Backtests run in worker processes; the callbacks below only submit them and poll their progress, so a run doesn't
+# hold up a web server thread. Identical parameters share one job, and parameters already run on the same data come
+# back from the result cache at once; set ITA_RESULT_CACHE_PATH to keep its results on disk across restarts.
+backtest_jobs = backtest_job_manager(
+    result_cache=backtest_result_cache(directory=os.getenv('ITA_RESULT_CACHE_PATH')))
+
 page_1 = html.Div([
     html.H4("Select period of days for correlation coefficient:"),
     html.Div(
@@ -71,6 +93,10 @@ page_1 = html.Div([
     html.Br(),
 
     html.Button('Run Backtest', id='run-backtest-button', n_clicks=0, disabled=False),
+    html.Button('Cancel', id='cancel-backtest-button', n_clicks=0),
+    html.Div(id='backtest-progress', children=''),
+    dcc.Store(id='backtest-job-id'),
+    dcc.Interval(id='backtest-progress-interval', interval=500, disabled=True),
     # Divs that only serve as a state holder
     html.Div(id='run-button-disabled', children=0, style=dict(display='none')),
     html.Div(id='run-button-enabled', children=0, style=dict(display='none')),
@@ -79,6 +105,8 @@ page_1 = html.Div([
     dcc.Loading(
         id="loading-1",
         type="default",
+        # The progress polls update the outputs without anything to wait for; only a slow update shows the spinner.
+        delay_show=1000,
         children=html.Div(id='output-container',
                           style={'text-align': 'center'},
                           children=[
@@ -111,10 +139,19 @@ page_1 = html.Div([
                                   children=[
                                       dash_table.DataTable(
                                           columns=[{"name": i, "id": i} for i in blotter_data.columns],
+                                          page_current=0,
                                           page_size=50,
-                                          export_format="csv",
+                                          page_action='custom',
+                                          sort_action='custom',
+                                          sort_mode='multi',
+                                          sort_by=[],
+                                          filter_action='custom',
+                                          filter_query='',
                                           id='blotter-data-tbl'
-                                      )],
+                                      ),
+                                      html.Button('Export CSV', id='blotter-export-button', n_clicks=0),
+                                      dcc.Download(id='blotter-download'),
+                                      dcc.Store(id='blotter-run-id')],
                                   style={'width': '50%', 'margin': '0 auto'}
                               )
                           ]),
@@ -155,11 +192,8 @@ def trigger_enable_submit_button(n_click):
 
 
 @callback(
-    [Output(component_id='blotter-data-tbl', component_property='data'),
-     Output(component_id='total-orders-output', component_property='children'),
-     Output(component_id='amzn-output', component_property='children'),
-     Output(component_id='wmt-output', component_property='children'),
-     Output(component_id='total-gain-loss-output', component_property='children')],
+    [Output('backtest-job-id', 'data'),
+     Output('backtest-progress-interval', 'disabled')],
     Input('run-backtest-button', 'n_clicks'),
     [State('corr-coef-period', 'value'),
      State('trade-lot', 'value'),
@@ -172,14 +206,101 @@ def trigger_enable_submit_button(n_click):
 def run_backtest(n_clicks, period, trade_lot, gain_cap_perc, risk_free_flag, holding_period_cap):
     gain_cap = round(gain_cap_perc / 100, 2)
     is_risk_free = risk_free_flag == 'True'
-    history = fp.load_data(period)
     print(f'Inputs: period={period}, trade_lot={trade_lot}, '
           f'gain_cap={gain_cap}, is_risk_free={is_risk_free},'
           f'holding_period={holding_period_cap}')
-    blotter = fp.run_backtest(history, period, trade_lot, gain_cap, is_risk_free, holding_period_cap)
-    messages = fp.get_stats(history, blotter)
+    job_id = backtest_jobs.submit({'period': period, 'lot': trade_lot, 'gain_cap': gain_cap,
+                                   'include_risk_free': is_risk_free, 'holding_period_cap': holding_period_cap})
+    return job_id, False
+
+
+@callback(
+    Output('backtest-progress', 'children', allow_duplicate=True),
+    Input('cancel-backtest-button', 'n_clicks'),
+    State('backtest-job-id', 'data'),
+    prevent_initial_call=True
+)
+def cancel_backtest(n_clicks, job_id):
+    if job_id is None or not backtest_jobs.cancel(job_id):
+        raise PreventUpdate
+    return 'Cancelling...'
+
+
+# Shows the job's progress every tick and its results once it is done (or failed or was cancelled), which also
+# re-enables the run button.
+@callback(
+    [Output('backtest-progress', 'children'),
+     Output('backtest-progress-interval', 'disabled', allow_duplicate=True),
+     Output(component_id='blotter-run-id', component_property='data'),
+     Output(component_id='total-orders-output', component_property='children'),
+     Output(component_id='amzn-output', component_property='children'),
+     Output(component_id='wmt-output', component_property='children'),
+     Output(component_id='total-gain-loss-output', component_property='children')],
+    Input('backtest-progress-interval', 'n_intervals'),
+    State('backtest-job-id', 'data'),
+    prevent_initial_call=True
+)
+def update_backtest_progress(n_intervals, job_id):
+    status = backtest_jobs.status(job_id)
+    if status is None:
+        return 'Backtest not found', True, None, 'No messages', 'No messages', 'No messages', 'No messages'
+    progress = f"{status['message']} ({status['progress']:.0%})"
+    if status['state'] not in FINISHED_STATES:
+        return progress, False, no_update, no_update, no_update, no_update, no_update
+    if status['state'] != DONE:
+        return status['message'], True, None, status['message'], 'No messages', 'No messages', 'No messages'
+    result = backtest_jobs.result(job_id)
+    messages = result['stats']
     order_messages = [html.P(x) for x in messages[0]]
     amzn_messages = [html.P(x) for x in messages[1]]
     wmt_messages = [html.P(x) for x in messages[2]]
     gain_loss_messages = [html.P(x) for x in messages[3]]
-    return blotter.to_dict(orient='records'), order_messages, amzn_messages, wmt_messages, gain_loss_messages
+    return progress, True, store_blotter(result['blotter']), order_messages, amzn_messages, wmt_messages, \
+        gain_loss_messages
+
+
+def store_blotter(blotter):
+    run_id = uuid.uuid4().hex
+    columns = {column: blotter[column].tolist() for column in blotter_data.columns}
+    columns['Date'] = blotter['Date'].dt.strftime('%Y-%m-%d').tolist()
+    records = [dict(zip(columns, values), run_id=run_id) for values in zip(*columns.values())]
+    with blotter_runs_lock:
+        blotter_store.insert('backtest_blotter', records)
+        blotter_runs.append(run_id)
+        while len(blotter_runs) > MAX_BLOTTER_RUNS:
+            blotter_store.delete('backtest_blotter', {'run_id': blotter_runs.popleft()})
+    return run_id
+
+
+@callback(
+    [Output('blotter-data-tbl', 'data'), Output('blotter-data-tbl', 'page_count')],
+    [Input('blotter-run-id', 'data'),
+     Input('blotter-data-tbl', 'page_current'),
+     Input('blotter-data-tbl', 'page_size'),
+     Input('blotter-data-tbl', 'sort_by'),
+     Input('blotter-data-tbl', 'filter_query')],
+    prevent_initial_call=True
+)
+def update_blotter_page(run_id, page_current, page_size, sort_by, filter_query):
+    if run_id is None:
+        return [], 1
+    return blotter_store.page('backtest_blotter', page_current, page_size, sort_by, filter_query,
+                              where={'run_id': run_id}, columns=list(blotter_data.columns))
+
+
+# The table only holds the page on screen, so the export reads every row of the run from blotter_store, sorted and
+# filtered as the table is.
+@callback(
+    Output('blotter-download', 'data'),
+    Input('blotter-export-button', 'n_clicks'),
+    [State('blotter-run-id', 'data'),
+     State('blotter-data-tbl', 'sort_by'),
+     State('blotter-data-tbl', 'filter_query')],
+    prevent_initial_call=True
+)
+def export_blotter(n_clicks, run_id, sort_by, filter_query):
+    if run_id is None:
+        raise PreventUpdate
+    rows = blotter_store.rows('backtest_blotter', sort_by, filter_query, where={'run_id': run_id},
+                              columns=list(blotter_data.columns))
+    return dcc.send_data_frame(pd.DataFrame(rows, columns=blotter_data.columns).to_csv, 'blotter.csv', index=False)
@@ -45,7 +45,7 @@ sidebar = html.Div(
             vertical=True,
             pills=True
         ),
-        html.P(children="False", id='ibkr-async-conn-status'),
+        html.P(children="DISCONNECTED", id='ibkr-async-conn-status'),
         html.Div(children='', id='placeholder-div'),
         dbc.Label('Master Client ID'),
         dbc.Input(id="master-client-id", type="number", value=10645),
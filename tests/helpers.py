@@ -0,0 +1,85 @@
+from unittest import mock
+from ibapi.contract import Contract
+from interactive_trader import ibkr_app, ibkr_session_pool
+from interactive_trader import synchronous_functions
+from interactive_trader.pacing import historical_data_scheduler
+from benchmarks.data import make_data
+
+# Helpers shared by the test modules. make_data, the synthetic prices, is the
+# benchmarks' and is imported from here too.
+
+def make_contract(symbol, con_id=0):
+    contract = Contract()
+    contract.symbol = symbol
+    contract.conId = con_id
+    contract.secType = 'STK'
+    contract.exchange = 'SMART'
+    contract.currency = 'USD'
+    return contract
+
+# A clock the test moves by hand: set now.
+class fake_clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+# An ibkr_app that is never connected: it has its first order id, and keeps
+# the orders and cancels it is sent instead of sending them to TWS. Test
+# modules subclass it to answer the requests they are about.
+class fake_app(ibkr_app):
+    def __init__(self):
+        ibkr_app.__init__(self)
+        self.nextValidId(1)
+        self.placed = {}
+        self.cancelled = []
+
+    def placeOrder(self, orderId, contract, order):
+        self.placed[orderId] = (contract.symbol, order)
+
+    def cancelOrder(self, orderId, manualCancelOrderTime=''):
+        self.cancelled.append(orderId)
+
+    # Reports a placed order as filled at price, as TWS would.
+    def fill(self, order_id, price):
+        order = self.placed[order_id][1]
+        self.orderStatus(order_id, 'Filled', order.totalQuantity, 0, price,
+                         0, 0, price, 0, '', 0)
+
+# Stands in for ibkr_session in a session pool: an app_factory app with a
+# running historical_data_scheduler, and no connection to make or drop.
+class fake_session:
+    app_factory = fake_app
+
+    def __init__(self, hostname, port, client_id, timeout_sec):
+        self.client_id = client_id
+        self.app = self.app_factory()
+        self.disconnects = 0
+        self.historical_data_scheduler = historical_data_scheduler(
+            app=self.app, request_timeout=timeout_sec
+        )
+        self.historical_data_scheduler.start()
+
+    def ensure_connected(self):
+        pass
+
+    # Fails whatever is in flight, as a dropped connection would.
+    def disconnect(self):
+        self.disconnects += 1
+        self.app.connectionClosed()
+
+    def close(self):
+        self.historical_data_scheduler.stop()
+
+# Has the synchronous functions use a pool of session_factory sessions for
+# the rest of test_case; returns the pool.
+def use_session_pool(test_case, session_factory, client_id):
+    pool = ibkr_session_pool('127.0.0.1', 7497, client_id,
+                             session_factory=session_factory)
+    patcher = mock.patch.object(synchronous_functions, '_session_pool',
+                                return_value=pool)
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    test_case.addCleanup(pool.close)
+    return pool
@@ -0,0 +1,128 @@
+import unittest
+import numpy as np
+import pandas as pd
+from final_project import backtest_trades, calculate_gain_loss, run_backtest
+from final_project.analytics import blotter_arrays, order_counts, \
+    symbol_totals, tear_sheet
+from tests.helpers import make_data
+
+class tear_sheet_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.hist = make_data(399)
+        self.blotter = run_backtest(self.hist)
+        self.sheet = tear_sheet(backtest_trades(self.hist), self.hist)
+
+    def test_same_from_frame_and_trade_blotter(self):
+        sheet = tear_sheet(self.blotter, self.hist)
+        pd.testing.assert_frame_equal(sheet['trades'], self.sheet['trades'])
+        pd.testing.assert_frame_equal(sheet['equity'], self.sheet['equity'])
+
+    def test_counts_and_totals_match_the_blotter(self):
+        blotter = self.blotter
+        arrays, symbols = blotter_arrays(blotter)
+        counts = order_counts(arrays)
+        exits = blotter[blotter['Trip'] == 'EXIT']
+        self.assertEqual(counts['entry_orders'],
+                         (blotter['Trip'] == 'ENTRY').sum())
+        self.assertEqual(counts['forced_exit_orders'],
+                         (exits['Status'] == 'FORCED').sum())
+        self.assertEqual(counts['canceled_exit_orders'],
+                         (exits['Status'] == 'CANCELED').sum())
+        totals = symbol_totals(arrays, symbols)
+        for symbol in ('AMZN', 'WMT'):
+            self.assertAlmostEqual(totals.loc[symbol, 'gain_loss'],
+                                   calculate_gain_loss(symbol, blotter, []),
+                                   places=6)
+        self.assertAlmostEqual(self.sheet['summary']['total_gain_loss'],
+                               totals['gain_loss'].sum(), places=6)
+
+    def test_round_trips(self):
+        trades = self.sheet['trades']
+        self.assertEqual(len(trades), self.sheet['summary']['entry_orders'])
+        self.assertAlmostEqual(trades['pnl'].sum(),
+                               self.sheet['summary']['total_gain_loss'],
+                               places=6)
+        # Every position is one trade per symbol, closed by a filled, forced
+        # or pending exit.
+        self.assertTrue((trades.groupby('position').size() == 2).all())
+        self.assertTrue(set(trades['status']) <= {'FILLED', 'FORCED',
+                                                  'PENDING'})
+        self.assertTrue((trades['exit_date'] >= trades['entry_date']).all())
+        first = trades.iloc[0]
+        sign = 1 if first['direction'] == 'BUY' else -1
+        self.assertAlmostEqual(
+            first['pnl'],
+            (first['exit_price'] - first['entry_price']) * first['size']
+            * sign
+        )
+
+    def test_equity_and_ratios(self):
+        trades = self.sheet['trades']
+        equity = self.sheet['equity']
+        closed = trades[trades['status'] != 'PENDING']
+        self.assertEqual(len(equity), len(self.hist))
+        self.assertAlmostEqual(equity['equity'].iloc[-1], closed['pnl'].sum(),
+                               places=6)
+        self.assertTrue((equity['drawdown'] <= 0).all())
+        peak = np.maximum.accumulate(np.maximum(equity['equity'], 0))
+        self.assertAlmostEqual(self.sheet['summary']['max_drawdown'],
+                               (equity['equity'] - peak).min())
+        pnl = equity['pnl']
+        self.assertAlmostEqual(self.sheet['summary']['sharpe'],
+                               pnl.mean() / pnl.std() * np.sqrt(252))
+        summary = self.sheet['summary']
+        self.assertAlmostEqual(summary['hit_rate'],
+                               (closed['pnl'] > 0).mean())
+
+    def test_holding_days_and_exposure(self):
+        trades = self.sheet['trades']
+        closed = trades[trades['status'] != 'PENDING']
+        holding_days = self.sheet['holding_days']
+        self.assertEqual(holding_days.sum(), len(closed))
+        self.assertEqual(
+            holding_days[holding_days > 0].to_dict(),
+            closed['holding_days'].value_counts().sort_index().to_dict()
+        )
+        by_symbol = self.sheet['by_symbol']
+        self.assertEqual(by_symbol['trades'].sum(), len(trades))
+        self.assertAlmostEqual(by_symbol.loc['WMT', 'gain_loss'],
+                               trades.loc[trades['symbol'] == 'WMT',
+                                          'pnl'].sum())
+        self.assertTrue(((by_symbol['time_in_market'] > 0) &
+                         (by_symbol['time_in_market'] <= 1)).all())
+
+    def test_limit_exit_filled_before_expiry(self):
+        blotter = backtest_trades(self.hist).to_frame(fill_dates=True)
+        exits = blotter[(blotter['Trip'] == 'EXIT') &
+                        (blotter['Status'] == 'FILLED') &
+                        (blotter['Fill_Date'] < blotter['Date'])]
+        self.assertGreater(len(exits), 0)
+        exit_row = exits.iloc[0]
+        fill_date = pd.Timestamp(exit_row['Fill_Date'])
+        trades = self.sheet['trades']
+        trade = trades[(trades['symbol'] == exit_row['Symbol']) &
+                       (trades['exit_date'] == fill_date)].iloc[0]
+        self.assertEqual(trade['holding_days'],
+                         np.busday_count(trade['entry_date'].date(),
+                                         fill_date.date()))
+        self.assertLess(trade['holding_days'], 5)
+        # Its gain/loss is booked on the day it filled, not on expiry.
+        equity = self.sheet['equity']
+        closing = trades[(trades['exit_date'] == fill_date) &
+                         (trades['status'] != 'PENDING')]
+        self.assertAlmostEqual(equity.at[fill_date, 'pnl'],
+                               closing['pnl'].sum())
+        self.assertGreater(len(self.sheet['holding_days'][
+            self.sheet['holding_days'] > 0]), 2)
+
+    def test_empty_blotter(self):
+        hist = make_data(50)
+        hist['corr_coef'] = 1.0
+        sheet = tear_sheet(run_backtest(hist), hist)
+        self.assertEqual(len(sheet['trades']), 0)
+        self.assertEqual(sheet['summary']['total_gain_loss'], 0)
+        self.assertTrue((sheet['equity']['equity'] == 0).all())
+
+if __name__ == '__main__':
+    unittest.main()
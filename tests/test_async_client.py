@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import unittest
+from interactive_trader import ibkr_async_client
+from tests import helpers
+from tests.helpers import make_contract
+
+# Answers requests from a separate thread, the way the API thread would.
+class fake_app(helpers.fake_app):
+    def __init__(self):
+        helpers.fake_app.__init__(self)
+        self.current_time_requests = 0
+
+    def reqCurrentTime(self):
+        self.current_time_requests += 1
+        threading.Timer(0.01, self.currentTime, (1650000000,)).start()
+
+    def reqMatchingSymbols(self, reqId, pattern):
+        threading.Timer(0.01, self.error,
+                        (reqId, 321, 'Error validating request')).start()
+
+    def reqMktData(self, reqId, contract, *args):
+        threading.Timer(0.01, self.tickPrice, (reqId, 4, 101.5, None)).start()
+
+    def cancelMktData(self, reqId):
+        self.cancelled = reqId
+
+class fake_session:
+    def __init__(self):
+        self.app = fake_app()
+
+    def connect(self):
+        pass
+
+    def close(self):
+        pass
+
+class async_client_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.client = ibkr_async_client(session=fake_session(),
+                                        timeout_sec=1)
+
+    def run_with_client(self, coroutine):
+        async def main():
+            async with self.client:
+                return await coroutine
+        return asyncio.run(main())
+
+    def test_concurrent_current_time_requests_are_shared(self):
+        async def fetch_twice():
+            return await asyncio.gather(self.client.fetch_current_time(),
+                                        self.client.fetch_current_time())
+        first, second = self.run_with_client(fetch_twice())
+        self.assertEqual(first, second)
+        self.assertEqual(self.client.app.current_time_requests, 1)
+
+    def test_request_errors_are_raised(self):
+        with self.assertRaises(Exception) as raised:
+            self.run_with_client(
+                self.client.fetch_matching_symbols('ZZZZ', use_cache=False)
+            )
+        self.assertEqual(raised.exception.error_code, 321)
+
+    def test_stream_yields_ticks(self):
+        contract = make_contract('AMZN')
+
+        async def first_tick():
+            async for kind, record in \
+                    self.client.stream_market_data(contract):
+                return kind, record
+
+        kind, record = self.run_with_client(first_tick())
+        self.assertEqual(kind, 'tick')
+        self.assertEqual(record[2], 101.5)
+        self.assertNotIn('AMZN', self.client.market_data.subscriptions)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+import pandas as pd
+from final_project import run_backtest, run_backtest_iterrows
+from tests.helpers import make_data
+
+class run_backtest_test_case(unittest.TestCase):
+
+    def assert_same_blotter(self, hist, **parameters):
+        expected = run_backtest_iterrows(hist, **parameters)
+        blotter = run_backtest(hist, **parameters)
+        pd.testing.assert_frame_equal(blotter, expected)
+        return blotter
+
+    def test_same_blotter_as_iterrows(self):
+        blotter = self.assert_same_blotter(make_data(400))
+        self.assertGreater(len(blotter), 0)
+        self.assertTrue((blotter['Status'] == 'FORCED').any())
+        self.assertTrue(
+            ((blotter['Trip'] == 'EXIT') & (blotter['Status'] == 'FILLED'))
+            .any()
+        )
+
+    def test_same_blotter_with_other_parameters(self):
+        hist = make_data(300, seed=1)
+        self.assert_same_blotter(hist, period=5, gain_cap=0.02,
+                                 holding_period_cap=2)
+        self.assert_same_blotter(hist, include_risk_free=True, gain_cap=0.01)
+
+    def test_position_left_open_at_the_end(self):
+        hist = make_data(300, seed=2)
+        self.assert_same_blotter(hist.iloc[:-3], gain_cap=0.5)
+
+    def test_no_entry_signal(self):
+        hist = make_data(50)
+        hist['corr_coef'] = 1.0
+        self.assert_same_blotter(hist)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import tempfile
+from ibapi.contract import Contract
+from interactive_trader import bar_store
+from interactive_trader.bar_store import bar_store_key
+import pandas as pd
+
+def make_bars(dates, close):
+    return pd.DataFrame({
+        'date': dates, 'open': close, 'high': close, 'low': close,
+        'close': close, 'volume': 100, 'bar_count': 10, 'average': close
+    })
+
+class bar_store_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.store = bar_store(self.directory.name)
+        contract = Contract()
+        contract.symbol = 'AMZN'
+        contract.secType = 'STK'
+        contract.currency = 'USD'
+        self.key = bar_store_key(contract, '1 day', 'TRADES', True)
+        self.store.write(
+            self.key,
+            make_bars(['20220103', '20220104', '20220105'], 1.0),
+            pd.Timestamp('2022-01-03'), pd.Timestamp('2022-01-05')
+        )
+
+    def test_read_has_correct_columns(self):
+        bars = self.store.read(self.key)
+        self.assertListEqual(list(bars.columns),
+                             ['date', 'open', 'high', 'low', 'close',
+                              'volume', 'bar_count', 'average'])
+        self.assertEqual(bars.shape[0], 3)
+
+    def test_read_slices_by_date(self):
+        bars = self.store.read(self.key, '2022-01-04', '2022-01-04')
+        self.assertListEqual(list(bars['date']),
+                             [pd.Timestamp('2022-01-04')])
+
+    def test_newer_bars_replace_overlapping_ones(self):
+        self.store.write(self.key, make_bars(['20220105', '20220106'], 2.0),
+                         pd.Timestamp('2022-01-05'),
+                         pd.Timestamp('2022-01-06'))
+        bars = self.store.read(self.key)
+        self.assertListEqual(list(bars['close']), [1.0, 1.0, 2.0, 2.0])
+        self.assertEqual(self.store.coverage(self.key),
+                         (pd.Timestamp('2022-01-03'),
+                          pd.Timestamp('2022-01-06')))
+
+    def test_only_missing_tail_is_requested(self):
+        requests = self.store.missing_requests(
+            self.key, pd.Timestamp('2022-01-04'), pd.Timestamp('2022-01-10')
+        )
+        self.assertListEqual(requests, [(pd.Timestamp('2022-01-10'), '5 D')])
+
+    def test_covered_window_needs_no_request(self):
+        requests = self.store.missing_requests(
+            self.key, pd.Timestamp('2022-01-03'), pd.Timestamp('2022-01-05')
+        )
+        self.assertListEqual(requests, [])
+
+    def test_intraday_dates_are_parsed(self):
+        self.store.write(
+            self.key, make_bars(['20220107  09:30:00',
+                                 '20220107 10:30:00 US/Eastern'], 3.0),
+            pd.Timestamp('2022-01-07 09:30'), pd.Timestamp('2022-01-07 10:30')
+        )
+        bars = self.store.read(self.key, '2022-01-07')
+        self.assertListEqual(list(bars['date']),
+                             [pd.Timestamp('2022-01-07 09:30'),
+                              pd.Timestamp('2022-01-07 10:30')])
+
+if __name__ == '__main__':
+    unittest.main()
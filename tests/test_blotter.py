@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+import pandas as pd
+from final_project import run_backtest, run_backtest_iterrows, backtest_trades
+from final_project.blotter import trade_blotter
+from tests.helpers import make_data
+
+class trade_blotter_test_case(unittest.TestCase):
+
+    def test_frame_same_as_run_backtest(self):
+        hist = make_data(400)
+        trades = backtest_trades(hist)
+        pd.testing.assert_frame_equal(trades.to_frame(),
+                                      run_backtest_iterrows(hist))
+        pd.testing.assert_frame_equal(
+            trade_blotter.from_frame(run_backtest(hist)).to_frame(),
+            trades.to_frame()
+        )
+
+    def test_typed_columns(self):
+        trades = backtest_trades(make_data(400))
+        arrays = trades.arrays()
+        self.assertEqual(len(arrays['Date']), len(trades))
+        self.assertEqual(arrays['Symbol'].dtype, np.int16)
+        self.assertEqual(arrays['Status'].dtype, np.int8)
+        self.assertEqual(arrays['Price'].dtype, np.float64)
+        self.assertEqual(trades.symbols, ['AMZN', 'WMT'])
+
+    def test_grows_past_capacity(self):
+        trades = trade_blotter(capacity=1)
+        for day in range(10):
+            trades.add(np.datetime64('2020-01-01') + day, 'AMZN', 'ENTRY',
+                       'BUY', 100.0 + day, 100, 'FILLED')
+        frame = trades.to_frame()
+        self.assertEqual(len(frame), 10)
+        self.assertEqual(frame['Price'].tolist(),
+                         [100.0 + day for day in range(10)])
+
+    def test_empty(self):
+        frame = trade_blotter().to_frame()
+        self.assertEqual(len(frame), 0)
+        self.assertEqual(list(frame.columns),
+                         ['Date', 'Symbol', 'Trip', 'Action', 'Price', 'Size',
+                          'Status'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import threading
+import time
+import unittest
+from interactive_trader import connection_supervisor
+from interactive_trader.connection_supervisor import CONNECTED, \
+    DISCONNECTED
+
+# Stands in for ibkr_app so the supervisor can be tested without TWS
+# running. Only port 7497 answers.
+class fake_app:
+    def __init__(self):
+        self.connects = []
+        self.connected = False
+        self._stop = threading.Event()
+
+    def connect(self, hostname, port, client_id):
+        self.connects.append((hostname, port, client_id))
+        self.connected = port == 7497
+        self._stop.clear()
+
+    def isConnected(self):
+        return self.connected
+
+    def run(self):
+        self._stop.wait()
+
+    def disconnect(self):
+        self.connected = False
+        self._stop.set()
+
+    def wait_for_next_valid_id(self, timeout):
+        return self.connected
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+class connection_supervisor_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.app = fake_app()
+        self.supervisor = connection_supervisor(self.app, timeout_sec=1,
+                                                settle_sec=0.05,
+                                                health_check_interval=0.05)
+
+    def tearDown(self):
+        self.supervisor.stop()
+
+    def test_connect_returns_before_connecting(self):
+        self.assertEqual(self.supervisor.connect('127.0.0.1', 7497, 1),
+                         DISCONNECTED)
+        self.assertTrue(
+            wait_for(lambda: self.supervisor.status == CONNECTED)
+        )
+
+    def test_burst_of_commands_connects_once(self):
+        for port in (7, 74, 749, 7497):
+            self.supervisor.connect('127.0.0.1', port, 1)
+        self.assertTrue(
+            wait_for(lambda: self.supervisor.status == CONNECTED)
+        )
+        self.assertListEqual(self.app.connects, [('127.0.0.1', 7497, 1)])
+
+    def test_same_target_is_not_reconnected(self):
+        self.supervisor.connect('127.0.0.1', 7497, 1)
+        wait_for(lambda: self.supervisor.status == CONNECTED)
+        self.supervisor.connect('127.0.0.1', '7497', 1)
+        time.sleep(0.2)
+        self.assertEqual(len(self.app.connects), 1)
+
+    def test_failed_connection_is_reported(self):
+        self.supervisor.connect('127.0.0.1', 1, 1)
+        self.assertTrue(wait_for(
+            lambda: self.supervisor.status.startswith("couldn't connect")
+        ))
+
+    def test_dropped_connection_is_reconnected(self):
+        self.supervisor.connect('127.0.0.1', 7497, 1)
+        wait_for(lambda: self.supervisor.status == CONNECTED)
+        self.app.disconnect()
+        self.assertTrue(wait_for(lambda: len(self.app.connects) == 2))
+        self.assertTrue(
+            wait_for(lambda: self.supervisor.status == CONNECTED)
+        )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+import os
+import tempfile
+from ibapi.contract import Contract
+from interactive_trader import contract_cache
+from interactive_trader.contract_cache import ttl_lru_cache
+from interactive_trader.exceptions import ibkr_request_error
+import pandas as pd
+from tests.helpers import fake_clock, make_contract
+
+class ttl_lru_cache_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = fake_clock()
+        self.cache = ttl_lru_cache(max_size=2, ttl_sec=10, clock=self.clock)
+
+    def test_entries_expire(self):
+        self.cache.put('a', 1)
+        self.clock.now += 11
+        self.assertEqual(self.cache.get('a'), (False, None))
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.get('a')
+        self.cache.put('c', 3)
+        self.assertEqual(self.cache.get('b'), (False, None))
+        self.assertEqual(self.cache.get('a'), (True, 1))
+
+class contract_cache_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'contracts.pickle')
+        self.cache = contract_cache(self.path)
+        self.details = pd.DataFrame({'con_id': [3691937, 3691938],
+                                     'symbol': ['AMZN', 'AMZN']})
+
+    def test_all_matches_are_kept(self):
+        self.cache.put_contract_details(make_contract('AMZN'), self.details)
+        self.assertEqual(
+            self.cache.get_contract_details(make_contract('AMZN')).shape[0], 2
+        )
+
+    def test_matches_are_found_by_con_id(self):
+        self.cache.put_contract_details(make_contract('AMZN'), self.details)
+        contract = Contract()
+        contract.conId = 3691938
+        self.assertListEqual(
+            list(self.cache.get_contract_details(contract)['con_id']),
+            [3691938]
+        )
+
+    def test_unknown_contract_is_cached_as_error(self):
+        error = ibkr_request_error(1, 200, 'No security definition')
+        self.assertTrue(
+            self.cache.put_contract_details_error(make_contract('XXXX'), error)
+        )
+        with self.assertRaises(ibkr_request_error):
+            self.cache.get_contract_details(make_contract('XXXX'))
+
+    def test_cached_error_is_raised_fresh(self):
+        error = ibkr_request_error(1, 200, 'No security definition')
+        self.cache.put_contract_details_error(make_contract('XXXX'), error)
+        raised = []
+        for _ in range(2):
+            with self.assertRaises(ibkr_request_error) as context:
+                self.cache.get_contract_details(make_contract('XXXX'))
+            raised.append(context.exception)
+        self.assertIsNot(raised[0], raised[1])
+        self.assertIsNot(raised[0], error)
+        self.assertEqual((raised[1].error_code, raised[1].error_string),
+                         (200, 'No security definition'))
+
+    def test_changing_result_leaves_cache_alone(self):
+        self.cache.put_contract_details(make_contract('AMZN'), self.details)
+        self.details.loc[0, 'symbol'] = 'WMT'
+        details = self.cache.get_contract_details(make_contract('AMZN'))
+        details['symbol'] = 'TSLA'
+        self.assertListEqual(
+            list(self.cache.get_contract_details(make_contract('AMZN'))
+                 ['symbol']),
+            ['AMZN', 'AMZN']
+        )
+
+    def test_other_errors_are_not_cached(self):
+        error = ibkr_request_error(1, 504, 'Not connected')
+        self.assertFalse(
+            self.cache.put_contract_details_error(make_contract('AMZN'), error)
+        )
+        self.assertIsNone(self.cache.get_contract_details(make_contract('AMZN')))
+
+    def test_cache_survives_restart(self):
+        self.cache.put_contract_details(make_contract('AMZN'), self.details)
+        self.cache.put_matching_symbols('amzn', self.details)
+        self.cache.save()
+        reloaded = contract_cache(self.path)
+        self.assertIsNotNone(reloaded.get_contract_details(make_contract('AMZN')))
+        self.assertIsNotNone(reloaded.get_matching_symbols('AMZN'))
+
+if __name__ == '__main__':
+    unittest.main()
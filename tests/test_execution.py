@@ -0,0 +1,170 @@
+import unittest
+import numpy as np
+import pandas as pd
+from final_project import backtest_trades, run_backtest
+from final_project.analytics import tear_sheet
+from final_project.execution import ib_fixed_commission, \
+    ib_tiered_commission, naive_execution, realistic_execution, \
+    spread_slippage
+from tests.helpers import make_data
+
+
+def no_commission(dates, shares, values):
+    return np.zeros(len(shares))
+
+
+class commission_test_case(unittest.TestCase):
+
+    def test_tiers_follow_month_to_date_volume(self):
+        dates = np.array(['2020-01-02', '2020-01-03', '2020-01-06',
+                          '2020-02-03'], dtype='datetime64[ns]')
+        shares = np.array([200000.0, 200000.0, 1000.0, 1000.0])
+        commissions = ib_tiered_commission()(dates, shares, shares * 100)
+        np.testing.assert_allclose(commissions,
+                                   [700.0, 700.0, 2.0, 3.5])
+
+    def test_minimum_and_maximum(self):
+        dates = np.array(['2020-01-02'] * 2, dtype='datetime64[ns]')
+        shares = np.array([10.0, 1000.0])
+        values = np.array([1000.0, 100.0])
+        np.testing.assert_allclose(
+            ib_tiered_commission()(dates, shares, values), [0.35, 1.0]
+        )
+        np.testing.assert_allclose(
+            ib_fixed_commission()(dates, shares, values), [1.0, 1.0]
+        )
+
+
+class realistic_execution_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.hist = make_data(399)
+        self.trades = backtest_trades(self.hist)
+
+    def test_naive_execution_changes_nothing(self):
+        pd.testing.assert_frame_equal(
+            run_backtest(self.hist, execution=naive_execution()),
+            run_backtest(self.hist)
+        )
+
+    def test_without_costs_only_gaps_change_prices(self):
+        execution = realistic_execution(
+            commission=no_commission, slippage=spread_slippage(0, 0),
+            participation_cap=np.inf
+        )
+        filled = execution.apply(self.trades, self.hist).to_frame()
+        blotter = self.trades.to_frame()
+        self.assertEqual(filled['Size'].tolist(), blotter['Size'].tolist())
+        self.assertEqual(filled['Commission'].sum(), 0)
+        hist = self.hist
+        gaps = 0
+        for i, row in blotter.iterrows():
+            price = filled.at[i, 'Price']
+            if row['Trip'] == 'EXIT' and row['Status'] == 'FILLED':
+                # The first day from the entry on that reaches the limit;
+                # opening past it fills at the open.
+                entry_date = blotter[(blotter.index < i) &
+                                     (blotter['Symbol'] == row['Symbol']) &
+                                     (blotter['Trip'] == 'ENTRY')] \
+                    .iloc[-1]['Date']
+                prefix = row['Symbol'].lower()
+                window = hist.loc[entry_date:row['Date']]
+                if row['Action'] == 'SELL':
+                    day = window[window[f'{prefix}_High'] >= row['Price']] \
+                        .index[0]
+                    expected = max(row['Price'],
+                                   hist.at[day, f'{prefix}_Open'])
+                else:
+                    day = window[window[f'{prefix}_Low'] <= row['Price']] \
+                        .index[0]
+                    expected = min(row['Price'],
+                                   hist.at[day, f'{prefix}_Open'])
+                self.assertAlmostEqual(price, expected)
+                gaps += expected != row['Price']
+            else:
+                self.assertAlmostEqual(price, row['Price'])
+        self.assertGreater(gaps, 0)
+
+    def test_fill_dates_kept(self):
+        naive = self.trades.to_frame(fill_dates=True)
+        filled = realistic_execution().apply(self.trades, self.hist) \
+            .to_frame(fill_dates=True)
+        pd.testing.assert_series_equal(filled['Fill_Date'],
+                                       naive['Fill_Date'])
+        self.assertTrue((naive['Fill_Date'] < naive['Date']).any())
+
+    def test_costs_lower_the_gain(self):
+        naive = tear_sheet(self.trades, self.hist)
+        realistic = tear_sheet(
+            backtest_trades(self.hist, execution=realistic_execution(
+                commission=ib_fixed_commission(), participation_cap=np.inf,
+                slippage=spread_slippage(10, 0)
+            )), self.hist
+        )
+        trades = realistic['trades']
+        self.assertTrue((trades['commission'] >= 2.0).all())
+        entries = self.trades.to_frame()
+        entries = entries[entries['Trip'] == 'ENTRY']
+        np.testing.assert_allclose(
+            trades['entry_price'],
+            entries['Price'].astype(float) * np.where(entries['Action'] == 'BUY',
+                                        1.0005, 0.9995)
+        )
+        self.assertLess(realistic['summary']['total_gain_loss'],
+                        naive['summary']['total_gain_loss'])
+
+    def test_partial_fills(self):
+        hist = self.hist.copy()
+        hist['amzn_Volume'] = 1000.0
+        hist['wmt_Volume'] = 1e9
+        blotter = realistic_execution(participation_cap=0.1) \
+            .apply(self.trades, hist).to_frame()
+        amzn = blotter[blotter['Symbol'] == 'AMZN']
+        self.assertTrue((amzn['Size'] == 100.0).all())
+        wmt = blotter[blotter['Symbol'] == 'WMT']
+        self.assertEqual(wmt['Size'].tolist(),
+                         self.trades.to_frame()
+                         .query("Symbol == 'WMT'")['Size'].tolist())
+
+    def test_intraday_bars_decide_the_fill(self):
+        blotter = self.trades.to_frame()
+        hist = self.hist
+        # A sell exit that filled after its entry day, and that day.
+        for exit_row in blotter[(blotter['Trip'] == 'EXIT') &
+                                (blotter['Status'] == 'FILLED') &
+                                (blotter['Action'] == 'SELL')].index:
+            symbol = blotter.at[exit_row, 'Symbol']
+            limit = blotter.at[exit_row, 'Price']
+            entry_date = blotter.loc[:exit_row].query(
+                "Trip == 'ENTRY' and Symbol == @symbol").iloc[-1]['Date']
+            window = hist.loc[entry_date:blotter.at[exit_row, 'Date']]
+            day = window[window[f'{symbol.lower()}_High'] >= limit].index[0]
+            if day > entry_date:
+                break
+        execution = realistic_execution(
+            commission=no_commission, slippage=spread_slippage(0, 0),
+            participation_cap=np.inf
+        )
+        daily = execution.apply(self.trades, hist).to_frame()
+        # Bars that only reach the limit in the afternoon, opening past it.
+        bars = pd.DataFrame({
+            'date': [day + pd.Timedelta(hours=10),
+                     day + pd.Timedelta(hours=14)],
+            'open': [limit * 0.9, limit * 1.05],
+            'high': [limit * 0.95, limit * 1.06],
+            'low': [limit * 0.85, limit * 1.04],
+            'volume': [1000.0, 1000.0]
+        })
+        intraday = realistic_execution(
+            commission=no_commission, slippage=spread_slippage(0, 0),
+            participation_cap=np.inf, intraday_bars={symbol: bars}
+        ).apply(self.trades, hist).to_frame()
+        self.assertAlmostEqual(intraday.at[exit_row, 'Price'], limit * 1.05)
+        others = intraday.index != exit_row
+        np.testing.assert_allclose(
+            intraday.loc[others, 'Price'].astype(float),
+            daily.loc[others, 'Price'].astype(float)
+        )
+
+if __name__ == '__main__':
+    unittest.main()
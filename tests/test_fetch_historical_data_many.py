@@ -0,0 +1,111 @@
+import threading
+import time
+import unittest
+from unittest import mock
+from ibapi.common import BarData
+from interactive_trader import synchronous_functions
+from interactive_trader.exceptions import ibkr_request_error, \
+    ibkr_timeout_error
+import pandas as pd
+from tests import helpers
+from tests.helpers import make_contract, use_session_pool
+
+# Answers every history request with one bar whose close is the request's
+# position in the batch, interleaving the bars of all requests in flight.
+class fake_app(helpers.fake_app):
+    def __init__(self):
+        helpers.fake_app.__init__(self)
+        self.sent = []
+
+    def reqHistoricalData(self, reqId, contract, *args, **kwargs):
+        self.sent.append((reqId, contract))
+        if contract.symbol == 'UNKNOWN':
+            self.error(reqId, 200, 'No security definition has been found')
+            return
+        bar = BarData()
+        bar.date = '20220103'
+        bar.close = float(len(self.sent))
+        self.historicalData(reqId, bar)
+        if len(self.sent) % 2 == 0:
+            for req_id, _ in self.sent:
+                self.historicalDataEnd(req_id, '', '')
+
+    def cancelHistoricalData(self, reqId):
+        pass
+
+    # Never answered.
+    def reqCurrentTime(self):
+        pass
+
+class fake_session(helpers.fake_session):
+    app_factory = fake_app
+
+class fetch_historical_data_many_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = use_session_pool(self, fake_session, 40000)
+
+    def test_results_are_kept_apart_and_in_order(self):
+        contracts = [make_contract(s) for s in ('AMZN', 'WMT', 'TSLA', 'IBM')]
+        results = synchronous_functions.fetch_historical_data_many(contracts)
+        self.assertEqual(len(results), 4)
+        for position, frame in enumerate(results):
+            self.assertIsInstance(frame, pd.DataFrame)
+            self.assertListEqual(list(frame['close']), [position + 1.0])
+
+    def test_error_is_raised(self):
+        contracts = [make_contract('UNKNOWN'), make_contract('WMT')]
+        with self.assertRaises(ibkr_request_error):
+            synchronous_functions.fetch_historical_data_many(contracts)
+
+    def test_error_is_returned(self):
+        contracts = [make_contract(s) for s in ('UNKNOWN', 'WMT', 'IBM', 'KO')]
+        results = synchronous_functions.fetch_historical_data_many(
+            contracts, return_exceptions=True
+        )
+        self.assertIsInstance(results[0], ibkr_request_error)
+        self.assertIsInstance(results[1], pd.DataFrame)
+
+    def test_session_is_not_held_while_waiting(self):
+        # A lone request is never answered by fake_app.
+        errors = []
+
+        def fetch():
+            try:
+                synchronous_functions.fetch_historical_data(
+                    make_contract('AMZN')
+                )
+            except Exception as exception:
+                errors.append(exception)
+
+        with mock.patch.object(synchronous_functions,
+                               'historical_data_timeout_sec', 0.5):
+            thread = threading.Thread(target=fetch)
+            thread.start()
+            while not self.pool.sessions or \
+                    not self.pool.sessions[0].app.sent:
+                time.sleep(0.01)
+            with self.pool.session():
+                self.assertTrue(thread.is_alive())
+            thread.join()
+        self.assertIsInstance(errors[0], ibkr_timeout_error)
+
+    def test_request_survives_another_callers_timeout(self):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            synchronous_functions.fetch_historical_data(make_contract('AMZN'))
+        ))
+        thread.start()
+        while not self.pool.sessions or not self.pool.sessions[0].app.sent:
+            time.sleep(0.01)
+        with mock.patch.object(synchronous_functions, 'timeout_sec', 0.05):
+            with self.assertRaises(ibkr_timeout_error):
+                synchronous_functions.fetch_current_time()
+        # The second request completes both.
+        synchronous_functions.fetch_historical_data(make_contract('WMT'))
+        thread.join(5)
+        self.assertIsInstance(results[0], pd.DataFrame)
+        self.assertEqual(self.pool.sessions[0].disconnects, 0)
+
+if __name__ == '__main__':
+    unittest.main()
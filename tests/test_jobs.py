@@ -0,0 +1,62 @@
+import time
+import unittest
+from final_project.jobs import backtest_job_manager, _report, DONE, FAILED, CANCELLED
+from final_project.sweep import parameter_grid
+
+# Stands in for run_backtest_job: sleeps for lot milliseconds, and fails for a negative lot.
+def fake_job(job_id, parameters):
+    _report(job_id, 0.5, 'Halfway')
+    if parameters['lot'] < 0:
+        raise ValueError('negative lot')
+    time.sleep(parameters['lot'] / 1000)
+    return {'lot': parameters['lot']}
+
+def wait_for_state(manager, job_id, states, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = manager.status(job_id)
+        if status['state'] in states:
+            return status
+        time.sleep(0.01)
+    return manager.status(job_id)
+
+class backtest_job_manager_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = backtest_job_manager(max_workers=1, job_function=fake_job)
+
+    def tearDown(self):
+        self.manager.shutdown()
+
+    def test_job_runs_to_completion(self):
+        parameters = parameter_grid(lots=(10,))[0]
+        job_id = self.manager.submit(parameters)
+        status = wait_for_state(self.manager, job_id, (DONE,))
+        self.assertEqual(status['state'], DONE)
+        self.assertEqual(status['progress'], 1.0)
+        self.assertEqual(self.manager.result(job_id), {'lot': 10})
+        self.assertEqual(self.manager.result_for(parameters), {'lot': 10})
+
+    def test_identical_parameters_share_a_job(self):
+        parameters = parameter_grid(lots=(50,))[0]
+        first = self.manager.submit(parameters)
+        second = self.manager.submit(dict(parameters))
+        self.assertEqual(first, second)
+        wait_for_state(self.manager, first, (DONE,))
+        self.assertEqual(self.manager.submit(parameters), first)
+
+    def test_queued_job_can_be_cancelled(self):
+        running, queued = [self.manager.submit(parameters) for parameters in parameter_grid(lots=(300, 10))]
+        self.assertTrue(self.manager.cancel(queued))
+        self.assertEqual(wait_for_state(self.manager, queued, (CANCELLED,))['state'], CANCELLED)
+        self.assertEqual(wait_for_state(self.manager, running, (DONE,))['state'], DONE)
+        self.assertIsNone(self.manager.result(queued))
+
+    def test_failed_job_is_reported(self):
+        job_id = self.manager.submit(parameter_grid(lots=(-1,))[0])
+        status = wait_for_state(self.manager, job_id, (FAILED,))
+        self.assertEqual(status['state'], FAILED)
+        self.assertIn('negative lot', status['error'])
+
+if __name__ == '__main__':
+    unittest.main()
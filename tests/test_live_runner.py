@@ -0,0 +1,143 @@
+import unittest
+import pandas as pd
+from final_project.live_runner import bar_aggregator, live_strategy_runner
+from tests import helpers
+from tests.helpers import make_contract
+
+# Keeps the streaming requests too: useRTH of every real-time bars request.
+class fake_app(helpers.fake_app):
+    def __init__(self):
+        helpers.fake_app.__init__(self)
+        self.bar_requests = []
+
+    def reqMktData(self, reqId, contract, *args):
+        pass
+
+    def reqRealTimeBars(self, reqId, contract, barSize, whatToShow, useRTH,
+                        realTimeBarsOptions):
+        self.bar_requests.append(useRTH)
+
+    def cancelMktData(self, reqId):
+        pass
+
+    def cancelRealTimeBars(self, reqId):
+        pass
+
+class live_strategy_runner_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.app = fake_app()
+        self.today = pd.Timestamp('2024-01-02')
+        self.runner = live_strategy_runner(
+            self.app, {'AMZN': make_contract('AMZN'),
+                       'WMT': make_contract('WMT')},
+            today=lambda: self.today
+        )
+
+    def feed(self, date, amzn_close, wmt_close):
+        self.runner.on_bar(pd.Timestamp(date), {
+            'AMZN': (amzn_close, amzn_close, amzn_close, amzn_close, 100),
+            'WMT': (wmt_close, wmt_close, wmt_close, wmt_close, 100)
+        })
+
+    def enter(self):
+        # Closes moving in opposite directions give corr_coef < 0.
+        self.feed('2024-01-01', 100, 50)
+        self.feed('2024-01-02', 101, 49)
+        self.feed('2024-01-03', 102, 48)
+
+    def test_negative_correlation_sends_entries(self):
+        self.enter()
+        self.assertEqual(len(self.app.placed), 2)
+        actions = {symbol: order.action
+                   for symbol, order in self.app.placed.values()}
+        self.assertEqual(sorted(actions.values()), ['BUY', 'SELL'])
+        self.assertEqual(len(self.runner.latencies), 1)
+
+    def test_entries_are_whole_shares(self):
+        self.enter()
+        sizes = {symbol: order.totalQuantity
+                 for symbol, order in self.app.placed.values()}
+        self.assertEqual(sizes, {'AMZN': round(25000 / 102),
+                                 'WMT': round(25000 / 48)})
+
+    def test_entry_is_skipped_below_one_share(self):
+        self.runner.engine.lot = 40
+        with self.assertLogs('final_project.live_runner', 'WARNING'):
+            self.enter()
+        self.assertEqual(self.app.placed, {})
+        self.assertFalse(self.runner.position_open)
+
+    def test_filled_entry_places_lmt_exit(self):
+        self.enter()
+        for order_id in list(self.app.placed):
+            self.app.fill(order_id, 100.0)
+        exits = [order for symbol, order in self.app.placed.values()
+                 if order.orderType == 'LMT']
+        self.assertEqual(len(exits), 2)
+        self.assertEqual(sorted(order.lmtPrice for order in exits),
+                         [90.0, 110.0])
+
+    def test_expired_exit_is_forced(self):
+        self.enter()
+        for order_id in list(self.app.placed):
+            self.app.fill(order_id, 100.0)
+        self.feed('2024-01-10', 103, 47)
+        self.assertEqual(len(self.app.cancelled), 2)
+        for order_id in self.app.cancelled:
+            self.app.orderStatus(order_id, 'Cancelled', 0, 0, 0, 0, 0, 0, 0,
+                                 '', 0)
+        forced = [order_id for order_id, trade in self.runner.orders.items()
+                  if trade['Status'] == 'FORCED']
+        self.assertEqual(len(forced), 2)
+        for order_id in forced:
+            self.app.fill(order_id, 95.0)
+        self.assertFalse(self.runner.position_open)
+        statuses = self.runner.blotter_frame()['Status'].value_counts()
+        self.assertEqual(statuses['CANCELED'], 2)
+        self.assertEqual(statuses['FORCED'], 2)
+
+    def test_no_entry_while_position_is_open(self):
+        self.enter()
+        self.feed('2024-01-04', 103, 47)
+        self.assertEqual(len(self.app.placed), 2)
+
+    def test_start_subscribes_to_regular_hours(self):
+        self.runner.start()
+        self.addCleanup(self.runner.stop)
+        self.assertListEqual(self.app.bar_requests, [True, True])
+
+class bar_aggregator_test_case(unittest.TestCase):
+
+    def test_bars_are_built_from_realtime_bars(self):
+        bars = []
+        aggregator = bar_aggregator(['A', 'B'], 60,
+                                    lambda date, bar: bars.append((date, bar)))
+        for symbol in ('A', 'B'):
+            aggregator.add(symbol, (0, 1.0, 2.0, 0.5, 1.5, 10, 0, 0))
+            aggregator.add(symbol, (5, 1.5, 3.0, 1.0, 2.5, 20, 0, 0))
+        self.assertListEqual(bars, [])
+        aggregator.add('A', (60, 2.5, 2.5, 2.5, 2.5, 5, 0, 0))
+        self.assertListEqual(bars, [])
+        aggregator.add('B', (60, 2.5, 2.5, 2.5, 2.5, 5, 0, 0))
+        self.assertEqual(len(bars), 1)
+        self.assertEqual(bars[0][1]['A'], (1.0, 3.0, 0.5, 2.5, 30))
+        aggregator.flush()
+        self.assertEqual(len(bars), 2)
+
+    def test_daily_bars_follow_the_exchange_date(self):
+        bars = []
+        aggregator = bar_aggregator(['A'], 86400,
+                                    lambda date, bar: bars.append((date, bar)),
+                                    'America/New_York')
+        # 2024-01-02 15:00 and 19:30 EST (00:30 UTC on the 3rd), then
+        # 2024-01-03 10:00 EST.
+        aggregator.add('A', (1704225600, 1.0, 1.0, 1.0, 1.0, 10, 0, 0))
+        aggregator.add('A', (1704241800, 2.0, 2.0, 2.0, 2.0, 5, 0, 0))
+        aggregator.add('A', (1704294000, 3.0, 3.0, 3.0, 3.0, 1, 0, 0))
+        self.assertEqual(len(bars), 1)
+        self.assertEqual(bars[0][0], pd.Timestamp('2024-01-02'))
+        self.assertEqual(bars[0][1]['A'], (1.0, 2.0, 1.0, 2.0, 15))
+
+if __name__ == '__main__':
+    unittest.main()
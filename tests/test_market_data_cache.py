@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+from final_project import load_data, market_data_cache, prepare_data
+from tests.helpers import make_data
+
+# Writes data.csv and risk_free.csv laid out like the real ones: newest first,
+# rates in percent.
+def write_market_data(directory, days=120, seed=0):
+    hist = make_data(days, seed)
+    prices = hist[[column for column in hist.columns
+                   if column.startswith(('amzn_', 'wmt_'))]]
+    prices.iloc[::-1].to_csv(os.path.join(directory, 'data.csv'))
+    risk_free_hist = hist[['interest_rate']] * 100
+    risk_free_hist.to_csv(os.path.join(directory, 'risk_free.csv'))
+
+def read_market_data(directory, period):
+    return prepare_data(
+        pd.read_csv(os.path.join(directory, 'data.csv'), parse_dates=True,
+                    index_col='Date'),
+        pd.read_csv(os.path.join(directory, 'risk_free.csv'),
+                    parse_dates=True, index_col='Date'),
+        period
+    )
+
+class market_data_cache_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.data_path = self.directory.name
+        self.snapshot_directory = os.path.join(self.data_path, 'snapshots')
+        write_market_data(self.data_path)
+        self.cache = market_data_cache(max_periods=2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_same_frame_as_reading_the_files(self):
+        for period in (3, 5):
+            pd.testing.assert_frame_equal(
+                self.cache.load(self.data_path, period),
+                read_market_data(self.data_path, period)
+            )
+
+    def test_files_are_parsed_once(self):
+        with mock.patch('pandas.read_csv', wraps=pd.read_csv) as read_csv:
+            for period in (3, 4, 5, 3):
+                self.cache.load(self.data_path, period)
+        self.assertEqual(read_csv.call_count, 2)
+
+    def test_changed_file_is_read_again(self):
+        self.cache.load(self.data_path, 3)
+        write_market_data(self.data_path, seed=1)
+        stat = os.stat(os.path.join(self.data_path, 'data.csv'))
+        os.utime(os.path.join(self.data_path, 'data.csv'),
+                 ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        pd.testing.assert_frame_equal(self.cache.load(self.data_path, 3),
+                                      read_market_data(self.data_path, 3))
+
+    def test_periods_are_evicted(self):
+        for period in (3, 4, 5):
+            self.cache.load(self.data_path, period)
+        self.assertListEqual(list(self.cache._by_period), [4, 5])
+
+    def test_returned_frame_is_a_copy(self):
+        hist = self.cache.load(self.data_path, 3)
+        hist['corr_coef'] = 0
+        self.assertFalse((self.cache.load(self.data_path, 3)['corr_coef']
+                          == 0).all())
+
+    def test_snapshot_skips_parsing(self):
+        market_data_cache(snapshot_directory=self.snapshot_directory) \
+            .load(self.data_path, 3)
+        cold_cache = market_data_cache(
+            snapshot_directory=self.snapshot_directory
+        )
+        with mock.patch('pandas.read_csv', wraps=pd.read_csv) as read_csv:
+            hist = cold_cache.load(self.data_path, 3)
+        self.assertEqual(read_csv.call_count, 0)
+        pd.testing.assert_frame_equal(hist,
+                                      read_market_data(self.data_path, 3))
+
+    def test_load_data_uses_ita_data_path(self):
+        with mock.patch.dict(os.environ, {'ITA_DATA_PATH': self.data_path}):
+            pd.testing.assert_frame_equal(
+                load_data(3), load_data(3, use_cache=False)
+            )
+
+if __name__ == '__main__':
+    unittest.main()
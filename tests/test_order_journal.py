@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+from ibapi.contract import Contract
+from ibapi.execution import Execution
+from ibapi.order import Order
+from ibapi.order_state import OrderState
+from interactive_trader import ibkr_app, order_journal
+
+class order_journal_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'journal.sqlite')
+        self.journal = order_journal(self.path)
+        self.app = ibkr_app(journal=self.journal)
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.directory)
+
+    def order_status(self, order_id, status):
+        self.app.orderStatus(order_id, status, 0, 10, 0, order_id + 100, 0,
+                             0, 0, '', 0)
+
+    def test_order_history_has_every_event(self):
+        contract = Contract()
+        contract.symbol = 'AMZN'
+        order = Order()
+        order.permId = 101
+        order.action = 'BUY'
+        order.orderType = 'MKT'
+        order.totalQuantity = 10
+        order_state = OrderState()
+        order_state.status = 'Submitted'
+        execution = Execution()
+        execution.orderId = 1
+        execution.permId = 101
+        execution.execId = 'e1'
+        execution.shares = 10
+        execution.price = 100.0
+        self.app.openOrder(1, contract, order, order_state)
+        self.order_status(1, 'Submitted')
+        self.order_status(1, 'Filled')
+        self.order_status(2, 'Submitted')
+        self.app.execDetails(-1, contract, execution)
+        self.journal.flush()
+
+        history = self.journal.order_history(order_id=1)
+        self.assertListEqual(list(history['order_status']['status']),
+                             ['Submitted', 'Filled'])
+        self.assertListEqual(list(history['open_orders']['symbol']),
+                             ['AMZN'])
+        self.assertListEqual(list(history['executions']['exec_id']), ['e1'])
+        self.assertEqual(len(self.journal.executions('AMZN')), 1)
+
+    def test_replay_restores_a_new_app(self):
+        self.order_status(1, 'Submitted')
+        self.order_status(1, 'Filled')
+        self.app.error(-1, 2104, 'Market data farm connection is OK')
+        self.journal.close()
+
+        self.journal = order_journal(self.path)
+        app = ibkr_app(journal=self.journal)
+        self.assertEqual(self.journal.replay(app), (2, 1))
+        self.assertListEqual(list(app.latest_order_status['status']),
+                             ['Filled'])
+        self.assertEqual(len(app.error_messages), 1)
+        self.journal.flush()
+        self.assertEqual(len(self.journal.query('order_status')), 2)
+
+if __name__ == '__main__':
+    unittest.main()
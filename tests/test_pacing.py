@@ -0,0 +1,114 @@
+import unittest
+from concurrent.futures import Future
+from interactive_trader.pacing import historical_data_scheduler
+from interactive_trader.exceptions import ibkr_request_error, \
+    ibkr_timeout_error
+from tests.helpers import fake_clock, make_contract
+
+class historical_data_scheduler_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = fake_clock()
+        self.sent = []
+        self.scheduler = historical_data_scheduler(
+            send=self.send, clock=self.clock, request_timeout=30
+        )
+
+    def send(self, contract, endDateTime, durationStr, *args):
+        future = Future()
+        self.sent.append((len(self.sent), future))
+        return len(self.sent) - 1, future
+
+    def test_same_contract_limit(self):
+        for days in range(1, 9):
+            self.scheduler.submit(make_contract('AMZN'),
+                                  durationStr=f'{days} D')
+        self.assertEqual(self.scheduler.dispatch(), 2)
+        self.assertEqual(len(self.sent), 6)
+        self.clock.now += 2
+        self.scheduler.dispatch()
+        self.assertEqual(len(self.sent), 8)
+
+    def test_request_limit(self):
+        for i in range(61):
+            self.scheduler.submit(make_contract(f'S{i}'))
+        self.scheduler.dispatch()
+        for _, future in self.sent:
+            future.set_result(None)
+        self.assertEqual(self.scheduler.dispatch(), 600)
+        self.assertEqual(len(self.sent), 60)
+        self.clock.now += 600
+        self.scheduler.dispatch()
+        self.assertEqual(len(self.sent), 61)
+
+    def test_identical_requests_are_coalesced(self):
+        first = self.scheduler.submit(make_contract('AMZN'))
+        second = self.scheduler.submit(make_contract('AMZN'))
+        self.scheduler.dispatch()
+        self.assertIs(first, second)
+        self.assertEqual(len(self.sent), 1)
+
+    def test_identical_request_waits_15_seconds(self):
+        self.scheduler.submit(make_contract('AMZN'))
+        self.scheduler.dispatch()
+        self.sent[0][1].set_result('bars')
+        self.clock.now += 5
+        self.scheduler.submit(make_contract('AMZN'))
+        self.assertEqual(self.scheduler.dispatch(), 10)
+        self.assertEqual(len(self.sent), 1)
+
+    def test_higher_priority_goes_first(self):
+        for days in range(1, 7):
+            self.scheduler.submit(make_contract('AMZN'),
+                                  durationStr=f'{days} D')
+        urgent = self.scheduler.submit(make_contract('AMZN'),
+                                       durationStr='1 W', priority=1)
+        self.scheduler.dispatch()
+        self.sent[0][1].set_result('bars')
+        self.assertEqual(urgent.result(timeout=0), 'bars')
+
+    def test_pacing_violation_is_retried_with_backoff(self):
+        future = self.scheduler.submit(make_contract('AMZN'))
+        self.scheduler.dispatch()
+        self.sent[0][1].set_exception(
+            ibkr_request_error(0, 162, 'Historical data pacing violation')
+        )
+        self.assertFalse(future.done())
+        self.clock.now += 14
+        self.scheduler.dispatch()
+        self.assertEqual(len(self.sent), 1)
+        self.clock.now += 1
+        self.scheduler.dispatch()
+        self.sent[1][1].set_result('bars')
+        self.assertEqual(future.result(timeout=0), 'bars')
+
+    def test_other_errors_are_not_retried(self):
+        future = self.scheduler.submit(make_contract('AMZN'))
+        self.scheduler.dispatch()
+        self.sent[0][1].set_exception(ibkr_request_error(0, 200, 'Unknown'))
+        with self.assertRaises(ibkr_request_error):
+            future.result(timeout=0)
+
+    def test_162_without_pacing_violation_is_not_retried(self):
+        future = self.scheduler.submit(make_contract('AMZN'))
+        self.scheduler.dispatch()
+        self.sent[0][1].set_exception(ibkr_request_error(
+            0, 162, 'Historical Market Data Service error message:'
+                    'HMDS query returned no data: AMZN@SMART Trades'
+        ))
+        with self.assertRaises(ibkr_request_error):
+            future.result(timeout=0)
+        self.clock.now += 60
+        self.scheduler.dispatch()
+        self.assertEqual(len(self.sent), 1)
+
+    def test_unanswered_request_times_out(self):
+        future = self.scheduler.submit(make_contract('AMZN'))
+        self.scheduler.dispatch()
+        self.clock.now += 31
+        self.scheduler.dispatch()
+        with self.assertRaises(ibkr_timeout_error):
+            future.result(timeout=0)
+
+if __name__ == '__main__':
+    unittest.main()
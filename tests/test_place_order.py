@@ -0,0 +1,57 @@
+import unittest
+from unittest import mock
+from ibapi.order import Order
+from interactive_trader import synchronous_functions
+from interactive_trader.exceptions import ibkr_timeout_error
+from tests import helpers
+from tests.helpers import make_contract, use_session_pool
+
+# Answers placeOrder with the order statuses it is given, as TWS would.
+class fake_app(helpers.fake_app):
+    def __init__(self):
+        helpers.fake_app.__init__(self)
+        self.statuses = []
+
+    def placeOrder(self, orderId, contract, order):
+        helpers.fake_app.placeOrder(self, orderId, contract, order)
+        for status in self.statuses:
+            self.orderStatus(orderId, status, 0, order.totalQuantity, 0,
+                             orderId * 10, 0, 0, 1, '', 0)
+
+class fake_session(helpers.fake_session):
+    app_factory = fake_app
+
+def make_order():
+    order = Order()
+    order.action = 'BUY'
+    order.orderType = 'MKT'
+    order.totalQuantity = 10
+    return order
+
+class place_order_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = use_session_pool(self, fake_session, 50000)
+        with self.pool.session() as session:
+            self.session = session
+
+    def test_only_this_orders_rows_are_returned(self):
+        contract = make_contract('AMZN')
+        self.session.app.statuses = ['PreSubmitted']
+        synchronous_functions.place_order(contract, make_order())
+        self.session.app.statuses = ['PreSubmitted', 'Submitted']
+        order_status = synchronous_functions.place_order(contract,
+                                                         make_order())
+        self.assertListEqual(list(order_status['status']),
+                             ['PreSubmitted', 'Submitted'])
+        self.assertEqual(order_status['order_id'].nunique(), 1)
+
+    def test_timeout_keeps_the_connection(self):
+        with mock.patch.object(synchronous_functions, 'timeout_sec', 0.05):
+            with self.assertRaises(ibkr_timeout_error):
+                synchronous_functions.place_order(make_contract('AMZN'),
+                                                  make_order())
+        self.assertEqual(self.session.disconnects, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from interactive_trader import ibkr_app
+from interactive_trader.exceptions import ibkr_connection_error, \
+    ibkr_request_error
+
+# The registry is driven by the EWrapper callbacks, so these tests call them
+# directly instead of going through TWS.
+class request_registry_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.app = ibkr_app()
+        self.app.nextValidId(1)
+
+    def test_historical_data_end_completes_request(self):
+        req_id = self.app.next_request_id()
+        future = self.app.register_request(req_id)
+        self.app.historicalDataEnd(req_id, '', '')
+        self.assertTrue(future.done())
+
+    def test_error_for_request_raises_typed_exception(self):
+        req_id = self.app.next_request_id()
+        future = self.app.register_request(req_id)
+        self.app.error(req_id, 200, 'No security definition')
+        with self.assertRaises(ibkr_request_error) as context:
+            future.result(timeout=0)
+        self.assertEqual(context.exception.error_code, 200)
+
+    def test_informational_error_is_ignored(self):
+        req_id = self.app.next_request_id()
+        future = self.app.register_request(req_id)
+        self.app.error(req_id, 2104, 'Market data farm connection is OK')
+        self.assertFalse(future.done())
+
+    def test_order_status_completes_order(self):
+        order_id = self.app.next_request_id()
+        future = self.app.register_request(order_id)
+        self.app.orderStatus(order_id, 'Submitted', 0, 100, 0, 1, 0, 0, 1,
+                             '', 0)
+        self.assertEqual(future.result(timeout=0), 'Submitted')
+
+    def test_pre_submitted_order_is_acknowledged(self):
+        order_id = self.app.next_request_id()
+        future = self.app.register_request(order_id)
+        self.app.orderStatus(order_id, 'PreSubmitted', 0, 100, 0, 1, 0, 0, 1,
+                             '', 0)
+        self.assertEqual(future.result(timeout=0), 'PreSubmitted')
+
+    def test_connection_closed_fails_pending_requests(self):
+        future = self.app.register_request(self.app.next_request_id())
+        self.app.connectionClosed()
+        with self.assertRaises(ibkr_connection_error):
+            future.result(timeout=0)
+
+if __name__ == '__main__':
+    unittest.main()
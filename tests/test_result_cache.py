@@ -0,0 +1,77 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+from final_project.jobs import backtest_job_manager, DONE
+from final_project.result_cache import backtest_result_cache
+from final_project.sweep import parameter_grid
+from tests.test_market_data_cache import write_market_data
+
+
+# Fails the test if the job manager sends a cached job to the pool.
+def unexpected_job(job_id, parameters):
+    raise AssertionError('the job should have come from the cache')
+
+class backtest_result_cache_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.data_path = self.directory.name
+        self.cache_path = os.path.join(self.directory.name, 'results')
+        write_market_data(self.data_path)
+        self.cache = backtest_result_cache(max_entries=2, directory=self.cache_path)
+        self.parameters = parameter_grid()[0]
+        self.computed = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def compute(self, parameters):
+        self.computed.append(parameters)
+        return {'lot': parameters['lot']}
+
+    def test_identical_request_is_not_computed_again(self):
+        for _ in range(2):
+            result = self.cache.get_or_compute(self.parameters, self.compute, self.data_path)
+        self.assertEqual(result, {'lot': self.parameters['lot']})
+        self.assertEqual(len(self.computed), 1)
+
+    def test_other_parameters_have_another_key(self):
+        other = parameter_grid(lots=(10000,))[0]
+        self.assertNotEqual(self.cache.key(self.parameters, self.data_path), self.cache.key(other, self.data_path))
+
+    def test_changed_data_invalidates_results(self):
+        self.cache.get_or_compute(self.parameters, self.compute, self.data_path)
+        key = self.cache.key(self.parameters, self.data_path)
+        time.sleep(0.01)
+        write_market_data(self.data_path, seed=1)
+        self.assertNotEqual(self.cache.key(self.parameters, self.data_path), key)
+        self.cache.get_or_compute(self.parameters, self.compute, self.data_path)
+        self.assertEqual(len(self.computed), 2)
+
+    def test_results_on_disk_are_shared(self):
+        self.cache.get_or_compute(self.parameters, self.compute, self.data_path)
+        other_cache = backtest_result_cache(directory=self.cache_path)
+        other_cache.get_or_compute(self.parameters, self.compute, self.data_path)
+        self.assertEqual(len(self.computed), 1)
+
+    def test_without_data_nothing_is_cached(self):
+        missing = os.path.join(self.directory.name, 'missing')
+        self.assertIsNone(self.cache.key(self.parameters, missing))
+        self.cache.get_or_compute(self.parameters, self.compute, missing)
+        self.cache.get_or_compute(self.parameters, self.compute, missing)
+        self.assertEqual(len(self.computed), 2)
+
+    def test_job_manager_answers_from_cache(self):
+        key = self.cache.key(self.parameters, self.data_path)
+        self.cache.put(key, {'lot': 1})
+        manager = backtest_job_manager(max_workers=1, job_function=unexpected_job, result_cache=self.cache)
+        with mock.patch.dict(os.environ, {'ITA_DATA_PATH': self.data_path}):
+            job_id = manager.submit(self.parameters)
+        self.assertEqual(manager.status(job_id)['state'], DONE)
+        self.assertEqual(manager.result(job_id), {'lot': 1})
+        manager.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
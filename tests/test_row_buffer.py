@@ -0,0 +1,155 @@
+import unittest
+from interactive_trader.row_buffer import row_buffer, keyed_row_buffer
+from interactive_trader import ibkr_app
+import pandas as pd
+
+class row_buffer_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = row_buffer(['order_id', 'status'], unique=True)
+        self.buffer.append(1, 'PreSubmitted')
+        self.buffer.append(1, 'Submitted')
+        self.buffer.append(1, 'Submitted')
+
+    def test_to_frame_is_dataframe(self):
+        self.assertIsInstance(self.buffer.to_frame(), pd.DataFrame)
+
+    def test_to_frame_has_correct_columns(self):
+        self.assertListEqual(list(self.buffer.to_frame().columns),
+                             ['order_id', 'status'])
+
+    def test_duplicate_rows_are_dropped(self):
+        self.assertEqual(len(self.buffer), 2)
+
+    def test_frame_follows_new_rows(self):
+        self.assertEqual(self.buffer.to_frame().shape[0], 2)
+        self.buffer.append(1, 'Filled')
+        self.assertEqual(list(self.buffer.to_frame()['status']),
+                         ['PreSubmitted', 'Submitted', 'Filled'])
+
+    def test_changing_frame_leaves_buffer_alone(self):
+        frame = self.buffer.to_frame()
+        frame.loc[0, 'status'] = 'Cancelled'
+        frame['filled'] = 0
+        self.assertListEqual(list(self.buffer.to_frame()['status']),
+                             ['PreSubmitted', 'Submitted'])
+        self.assertListEqual(list(self.buffer.to_frame().columns),
+                             ['order_id', 'status'])
+
+    def test_rows_since_gives_only_new_rows(self):
+        count, records = self.buffer.rows_since(0)
+        self.assertEqual(count, 2)
+        self.buffer.append(1, 'Filled')
+        count, records = self.buffer.rows_since(count)
+        self.assertEqual(count, 3)
+        self.assertListEqual(records, [{'order_id': 1, 'status': 'Filled'}])
+        self.assertListEqual(self.buffer.rows_since(count)[1], [])
+
+class keyed_row_buffer_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = keyed_row_buffer(['order_id', 'perm_id', 'status'],
+                                       ['order_id', 'perm_id'])
+        self.buffer.upsert(1, 100, 'PreSubmitted')
+        self.buffer.upsert(2, 200, 'PreSubmitted')
+        self.buffer.upsert(1, 100, 'Submitted')
+
+    def test_keeps_latest_row_per_key(self):
+        self.assertEqual(len(self.buffer), 2)
+        self.assertEqual(list(self.buffer.to_frame()['status']),
+                         ['Submitted', 'PreSubmitted'])
+
+    def test_unchanged_row_is_not_a_change(self):
+        self.assertFalse(self.buffer.upsert(1, 100, 'Submitted'))
+        self.assertEqual(self.buffer.sequence, 3)
+
+    def test_changes_since_start_gives_every_row(self):
+        sequence, changes = self.buffer.changes_since(0)
+        self.assertEqual(sequence, 3)
+        self.assertListEqual(
+            [(position, record['status']) for position, record in changes],
+            [(0, 'Submitted'), (1, 'PreSubmitted')]
+        )
+
+    def test_changes_since_gives_only_changed_rows(self):
+        sequence, _ = self.buffer.changes_since(0)
+        self.buffer.upsert(2, 200, 'Filled')
+        self.buffer.upsert(3, 300, 'PreSubmitted')
+        sequence, changes = self.buffer.changes_since(sequence)
+        self.assertEqual(sequence, 5)
+        self.assertListEqual(
+            [(position, record['order_id'], record['status'])
+             for position, record in changes],
+            [(1, 2, 'Filled'), (2, 3, 'PreSubmitted')]
+        )
+        self.assertListEqual(self.buffer.changes_since(sequence)[1], [])
+    def test_oldest_keys_are_evicted(self):
+        evicted = []
+        buffer = keyed_row_buffer(['order_id', 'status'], ['order_id'],
+                                  max_rows=2, on_evict=evicted.append)
+        buffer.upsert(1, 'Submitted')
+        buffer.upsert(2, 'Submitted')
+        buffer.upsert(1, 'Filled')
+        buffer.upsert(3, 'Submitted')
+        self.assertListEqual(list(buffer.to_frame()['order_id']), [1, 3])
+        self.assertListEqual(list(evicted[0]['order_id']), [2])
+
+class row_buffer_retention_test_case(unittest.TestCase):
+
+    def test_max_rows_evicts_oldest_rows(self):
+        evicted = []
+        buffer = row_buffer(['n'], max_rows=10, evict_batch=5,
+                            on_evict=evicted.append)
+        for n in range(100):
+            buffer.append(n)
+        self.assertLessEqual(len(buffer), 15)
+        self.assertEqual(buffer.total, 100)
+        self.assertEqual(list(buffer.to_frame()['n'])[-1], 99)
+        self.assertEqual(sum(len(frame) for frame in evicted) + len(buffer),
+                         100)
+
+    def test_rows_since_skips_evicted_rows(self):
+        buffer = row_buffer(['n'], max_rows=4, evict_batch=2)
+        for n in range(3):
+            buffer.append(n)
+        count, _ = buffer.rows_since(0)
+        for n in range(3, 10):
+            buffer.append(n)
+        count, records = buffer.rows_since(count)
+        self.assertEqual(count, 10)
+        self.assertListEqual([record['n'] for record in records],
+                             list(range(10 - len(buffer), 10)))
+
+    def test_max_age_evicts_old_rows(self):
+        now = [0.0]
+        buffer = row_buffer(['n'], max_age_sec=60, evict_batch=1,
+                            clock=lambda: now[0])
+        buffer.append(1)
+        now[0] = 30.0
+        buffer.append(2)
+        now[0] = 70.0
+        buffer.append(3)
+        self.assertListEqual(list(buffer.to_frame()['n']), [2, 3])
+
+class ibkr_app_retention_test_case(unittest.TestCase):
+
+    def test_repeated_informational_errors_are_counted(self):
+        app = ibkr_app()
+        for _ in range(3):
+            app.error(-1, 2104, 'Market data farm connection is OK:usfarm')
+        app.error(5, 200, 'No security definition has been found')
+        app.error(5, 200, 'No security definition has been found')
+        self.assertEqual(len(app.error_messages), 3)
+        self.assertListEqual(list(app.error_counts['count']), [3])
+
+    def test_memory_usage_counts_rows(self):
+        app = ibkr_app(max_rows=10)
+        for order_id in range(100):
+            app.orderStatus(order_id, 'Submitted', 0, 1, 0, order_id, 0, 0,
+                            0, '', 0)
+        usage = app.memory_usage()
+        self.assertEqual(usage['latest_order_status']['rows'], 10)
+        self.assertLessEqual(usage['order_status']['rows'], 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from interactive_trader import ibkr_session_pool
+from interactive_trader.session_pool import allocate_client_id, \
+    release_client_id
+
+# Stands in for ibkr_session so the pool can be tested without TWS running.
+class fake_session:
+    def __init__(self, hostname, port, client_id, timeout_sec):
+        self.client_id = client_id
+        self.healthy = False
+        self.connects = 0
+
+    def is_healthy(self):
+        return self.healthy
+
+    def ensure_connected(self):
+        if not self.healthy:
+            self.reconnect()
+
+    def reconnect(self):
+        self.connects += 1
+        self.healthy = True
+
+    def ping(self):
+        return self.healthy
+
+    def disconnect(self):
+        self.healthy = False
+
+    def close(self):
+        self.disconnect()
+
+class session_pool_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ibkr_session_pool('127.0.0.1', 7497, 20000, pool_size=2,
+                                      session_factory=fake_session)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_session_is_reused(self):
+        with self.pool.session() as first:
+            pass
+        with self.pool.session() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(first.connects, 1)
+
+    def test_pool_size_is_respected(self):
+        with self.pool.session() as first:
+            with self.pool.session() as second:
+                self.assertIsNot(first, second)
+        self.assertEqual(len(self.pool.sessions), 2)
+
+    def test_sessions_get_distinct_client_ids(self):
+        with self.pool.session() as first:
+            with self.pool.session() as second:
+                self.assertNotEqual(first.client_id, second.client_id)
+
+    def test_broken_session_is_reconnected(self):
+        with self.pool.session() as session:
+            pass
+        session.disconnect()
+        with self.pool.session() as session:
+            self.assertTrue(session.is_healthy())
+        self.assertEqual(session.connects, 2)
+
+    def test_health_check_reconnects_idle_sessions(self):
+        with self.pool.session() as session:
+            pass
+        session.disconnect()
+        self.pool.check_health()
+        self.assertTrue(session.is_healthy())
+
+class allocate_client_id_test_case(unittest.TestCase):
+
+    def test_client_ids_are_not_reused(self):
+        first = allocate_client_id(30000)
+        second = allocate_client_id(30000)
+        self.assertNotEqual(first, second)
+        release_client_id(first)
+        release_client_id(second)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import numpy as np
+import pandas as pd
+from final_project import run_backtest
+from final_project.signal_engine import pairs_signal_engine, \
+    rolling_correlation
+from tests.helpers import make_data
+
+def feed(engine, hist):
+    for date, row in zip(hist.index, hist.to_dict(orient='records')):
+        engine.on_bar(date, {
+            symbol: tuple(row[f'{symbol.lower()}_{field}'] for field in
+                          ('Open', 'High', 'Low', 'Close', 'Volume'))
+            for symbol in engine.symbols
+        }, row['interest_rate'])
+    return engine
+
+class rolling_correlation_test_case(unittest.TestCase):
+
+    def test_same_as_correlation_of_each_window(self):
+        random = np.random.default_rng(0)
+        x = 100 * np.exp(np.cumsum(random.normal(0, 0.02, 500)))
+        y = 50 * np.exp(np.cumsum(random.normal(0, 0.02, 500)))
+        for period in (3, 7):
+            correlation = rolling_correlation(period)
+            values = [correlation.update(a, b) for a, b in zip(x, y)]
+            expected = [np.nan] * (period - 1) + [
+                np.corrcoef(x[end - period:end], y[end - period:end])[0, 1]
+                for end in range(period, len(x) + 1)
+            ]
+            np.testing.assert_allclose(values, expected, rtol=1e-12,
+                                       atol=1e-12)
+
+class pairs_signal_engine_test_case(unittest.TestCase):
+
+    def test_same_blotter_as_run_backtest(self):
+        hist = make_data(399)
+        for parameters in ({}, {'include_risk_free': True, 'gain_cap': 0.01},
+                           {'holding_period_cap': 2}):
+            engine = feed(pairs_signal_engine(**parameters), hist)
+            pd.testing.assert_frame_equal(engine.blotter(),
+                                          run_backtest(hist, **parameters))
+
+    def test_corr_coef_matches_load_data(self):
+        hist = make_data(100)
+        engine = pairs_signal_engine()
+        corr_coefs = []
+        for date, row in zip(hist.index, hist.to_dict(orient='records')):
+            engine.on_bar(date, {
+                symbol: tuple(row[f'{symbol.lower()}_{field}'] for field in
+                              ('Open', 'High', 'Low', 'Close', 'Volume'))
+                for symbol in engine.symbols
+            })
+            corr_coefs.append(engine.corr_coef)
+        # rolling().corr works from uncentered sums, so it is only
+        # accurate to about 1e-8 on prices.
+        np.testing.assert_allclose(corr_coefs, hist['corr_coef'],
+                                   rtol=1e-7, atol=1e-7)
+
+    def test_on_bar_returns_new_trades(self):
+        hist = make_data(60)
+        engine = pairs_signal_engine()
+        produced = []
+        for date, row in zip(hist.index, hist.to_dict(orient='records')):
+            produced.extend(engine.on_bar(date, {
+                symbol: tuple(row[f'{symbol.lower()}_{field}'] for field in
+                              ('Open', 'High', 'Low', 'Close', 'Volume'))
+                for symbol in engine.symbols
+            }))
+        entries = [trade for trade in produced if trade['Trip'] == 'ENTRY']
+        self.assertEqual(len(entries),
+                         (engine.blotter()['Trip'] == 'ENTRY').sum())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+from interactive_trader.streaming import market_data_stream, ring_buffer, \
+    TICK_DTYPE
+from tests import helpers
+from tests.helpers import make_contract
+
+# Records the streaming requests instead of sending them to TWS.
+class fake_app(helpers.fake_app):
+    def __init__(self):
+        helpers.fake_app.__init__(self)
+        self.requests = []
+        self.arguments = []
+
+    def reqMktData(self, reqId, contract, genericTickList, *args):
+        self.requests.append(('ticks', reqId, contract.symbol))
+        self.arguments.append(('ticks', contract.symbol, genericTickList))
+
+    def reqRealTimeBars(self, reqId, contract, barSize, whatToShow, useRTH,
+                        *args):
+        self.requests.append(('bars', reqId, contract.symbol))
+        self.arguments.append(('bars', contract.symbol, whatToShow, useRTH))
+
+    def cancelMktData(self, reqId):
+        self.requests.append(('cancel', reqId, None))
+
+class ring_buffer_test_case(unittest.TestCase):
+
+    def test_oldest_records_are_overwritten(self):
+        ticks = ring_buffer(TICK_DTYPE, 3)
+        for i in range(5):
+            ticks.append((i, 4, float(i), 0))
+        self.assertEqual(len(ticks), 3)
+        self.assertListEqual(list(ticks.last()['price']), [2.0, 3.0, 4.0])
+        self.assertListEqual(list(ticks.last(2)['price']), [3.0, 4.0])
+        self.assertEqual(ticks.latest()['price'], 4.0)
+
+class market_data_stream_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.app = fake_app()
+        self.stream = market_data_stream(self.app, tick_capacity=10)
+        self.amzn = self.stream.subscribe(make_contract('AMZN', 3691937),
+                                          realtime_bars=True)
+        self.wmt = self.stream.subscribe(make_contract('WMT', 13824))
+
+    def test_one_request_per_subscription(self):
+        self.stream.subscribe(make_contract('AMZN', 3691937))
+        self.assertEqual(len(self.app.requests), 3)
+
+    def test_ticks_go_to_their_contract(self):
+        self.app.tickPrice(self.amzn.market_data_req_id, 4, 101.5, None)
+        self.app.tickSize(self.amzn.market_data_req_id, 5, 200)
+        self.app.tickPrice(self.wmt.market_data_req_id, 1, 140.0, None)
+        self.assertEqual(self.stream.latest(3691937),
+                         {'LAST': 101.5, 'LAST_SIZE': 200.0})
+        self.assertEqual(len(self.stream.last_ticks(3691937)), 2)
+        self.assertEqual(self.stream.latest(13824), {'BID': 140.0})
+
+    def test_realtime_bars_are_buffered(self):
+        self.app.realtimeBar(self.amzn.realtime_bars_req_id, 1650000000,
+                             1.0, 2.0, 0.5, 1.5, 100, 1.2, 10)
+        self.assertListEqual(list(self.stream.last_bars(3691937)['close']),
+                             [1.5])
+
+    def test_callbacks_are_pushed(self):
+        received = []
+        self.stream.add_callback(
+            lambda key, kind, record: received.append((key, kind))
+        )
+        self.app.tickPrice(self.wmt.market_data_req_id, 2, 140.1, None)
+        self.assertListEqual(received, [(13824, 'tick')])
+
+    def test_unsubscribe_cancels_request(self):
+        self.stream.unsubscribe(make_contract('WMT', 13824))
+        self.assertIn(('cancel', self.wmt.market_data_req_id, None),
+                      self.app.requests)
+        self.app.tickPrice(self.wmt.market_data_req_id, 2, 140.1, None)
+        self.assertNotIn(13824, self.stream.subscriptions)
+
+    def test_reconnect_keeps_arguments(self):
+        self.stream.subscribe(make_contract('IBM', 8314), generic_ticks='233',
+                              realtime_bars=True, bar_what_to_show='MIDPOINT',
+                              useRTH=True)
+        before = sorted(self.app.arguments)
+        self.app.arguments.clear()
+        self.stream.resubscribe()
+        self.assertListEqual(sorted(self.app.arguments), before)
+        self.assertIn(('bars', 'IBM', 'MIDPOINT', True), before)
+
+    def test_errors_are_recorded(self):
+        self.app.error(self.wmt.market_data_req_id, 354,
+                       'Requested market data is not subscribed')
+        self.assertEqual(self.wmt.error.error_code, 354)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from final_project import run_backtest
+from final_project.execution import realistic_execution
+from final_project.sweep import backtest_summary, parameter_grid, run_sweep
+from tests.helpers import make_data
+
+class run_sweep_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.hists = {period: make_data(300, seed=period + 1, period=period)
+                      for period in (2, 3)}
+        self.parameters_list = parameter_grid(
+            periods=(2, 3), gain_caps=(0.02, 0.1),
+            include_risk_free=(False, True), holding_period_caps=(3, 5)
+        )
+        self.directory = tempfile.TemporaryDirectory()
+        self.results_path = os.path.join(self.directory.name, 'sweep.csv')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_results_match_single_backtests(self):
+        results = run_sweep(self.parameters_list, max_workers=2,
+                            hists=self.hists)
+        self.assertEqual(len(results), len(self.parameters_list))
+        self.assertTrue(results['total_gain_loss'].is_monotonic_decreasing)
+        best = results.iloc[0].to_dict()
+        parameters = {name: best[name] for name in self.parameters_list[0]}
+        hist = self.hists[parameters['period']]
+        blotter = run_backtest(hist, **parameters)
+        expected = backtest_summary(hist, blotter, parameters)
+        self.assertAlmostEqual(best['total_gain_loss'],
+                               expected['total_gain_loss'])
+
+    def test_sweep_with_execution_model(self):
+        execution = realistic_execution()
+        results = run_sweep(self.parameters_list[:4], max_workers=2,
+                            hists=self.hists, execution=execution)
+        for _, result in results.iterrows():
+            parameters = {name: result[name]
+                          for name in self.parameters_list[0]}
+            hist = self.hists[parameters['period']]
+            blotter = run_backtest(hist, execution=execution, **parameters)
+            expected = backtest_summary(hist, blotter, parameters)
+            self.assertAlmostEqual(result['total_gain_loss'],
+                                   expected['total_gain_loss'])
+
+    def test_sweep_is_resumed(self):
+        run_sweep(self.parameters_list[:5], self.results_path,
+                  max_workers=1, hists=self.hists)
+        finished = []
+        results = run_sweep(self.parameters_list, self.results_path,
+                            max_workers=2, hists=self.hists,
+                            on_result=finished.append)
+        self.assertEqual(len(finished), len(self.parameters_list) - 5)
+        self.assertEqual(len(results), len(self.parameters_list))
+        self.assertEqual(len(pd.read_csv(self.results_path)),
+                         len(self.parameters_list))
+
+    def test_resume_with_other_execution_model(self):
+        run_sweep(self.parameters_list[:4], self.results_path,
+                  max_workers=1, hists=self.hists)
+        finished = []
+        execution = realistic_execution()
+        results = run_sweep(self.parameters_list[:4], self.results_path,
+                            max_workers=1, hists=self.hists,
+                            execution=execution, on_result=finished.append)
+        self.assertEqual(len(finished), 4)
+        self.assertEqual(set(results['execution']), {repr(execution)})
+        saved = pd.read_csv(self.results_path)
+        self.assertEqual(len(saved), 8)
+        finished = []
+        run_sweep(self.parameters_list[:4], self.results_path,
+                  max_workers=1, hists=self.hists,
+                  execution=realistic_execution(), on_result=finished.append)
+        self.assertEqual(finished, [])
+
+    def test_resume_file_without_execution_column(self):
+        results = run_sweep(self.parameters_list[:3], max_workers=1,
+                            hists=self.hists)
+        results.drop(columns='execution').to_csv(self.results_path,
+                                                 index=False)
+        finished = []
+        results = run_sweep(self.parameters_list[:5], self.results_path,
+                            max_workers=1, hists=self.hists,
+                            on_result=finished.append)
+        self.assertEqual(len(finished), 2)
+        self.assertEqual(len(results), 5)
+        saved = pd.read_csv(self.results_path)
+        self.assertEqual(list(saved['execution']), ['naive'] * 5)
+
+if __name__ == '__main__':
+    unittest.main()
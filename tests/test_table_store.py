@@ -0,0 +1,92 @@
+import unittest
+from interactive_trader import ibkr_app, ibkr_tables, table_store
+from interactive_trader.table_store import filter_to_sql
+
+class table_store_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.store = table_store()
+        self.store.create_table('trades', ['id', 'symbol', 'price'],
+                                key_columns=['id'], indexes=[['symbol']])
+        self.store.insert('trades', [
+            {'id': i, 'symbol': 'AMZN' if i % 2 else 'WMT', 'price': i * 1.5}
+            for i in range(120)
+        ])
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_page_has_only_page_rows(self):
+        data, page_count = self.store.page('trades', 1, 50)
+        self.assertEqual(page_count, 3)
+        self.assertListEqual([row['id'] for row in data], list(range(50, 100)))
+
+    def test_page_is_sorted(self):
+        data, _ = self.store.page(
+            'trades', 0, 3, sort_by=[{'column_id': 'price',
+                                      'direction': 'desc'}]
+        )
+        self.assertListEqual([row['id'] for row in data], [119, 118, 117])
+
+    def test_page_is_filtered(self):
+        data, page_count = self.store.page(
+            'trades', 0, 50,
+            filter_query='{symbol} contains "AM" && {price} >= 150'
+        )
+        self.assertEqual(page_count, 1)
+        self.assertListEqual([row['id'] for row in data],
+                             list(range(101, 120, 2)))
+
+    def test_rows_has_every_page(self):
+        sort_by = [{'column_id': 'price', 'direction': 'desc'}]
+        rows = self.store.rows('trades', sort_by=sort_by,
+                               filter_query='{symbol} = WMT',
+                               columns=['id'])
+        self.assertListEqual(rows, [{'id': i} for i in range(118, -1, -2)])
+
+    def test_rows_with_same_key_are_replaced_in_place(self):
+        self.store.insert('trades', [{'id': 0, 'symbol': 'WMT',
+                                      'price': -1.0}])
+        data, _ = self.store.page('trades', 0, 1)
+        self.assertEqual(data[0]['price'], -1.0)
+        self.assertEqual(self.store.count('trades'), 120)
+
+    def test_trim_keeps_newest_rows(self):
+        self.store.trim('trades', 10)
+        data, _ = self.store.page('trades', 0, 50)
+        self.assertListEqual([row['id'] for row in data],
+                             list(range(110, 120)))
+
+    def test_unknown_columns_are_not_queried(self):
+        clause, params = filter_to_sql('{id"; DROP TABLE trades; --} = 1',
+                                       ['id'])
+        self.assertEqual(clause, '')
+        data, _ = self.store.page('trades', 0, 10,
+                                  sort_by=[{'column_id': 'nope'}])
+        self.assertEqual(len(data), 10)
+
+class ibkr_tables_test_case(unittest.TestCase):
+
+    def setUp(self):
+        self.app = ibkr_app()
+        self.tables = ibkr_tables(self.app)
+
+    def order_status(self, order_id, status):
+        self.app.orderStatus(order_id, status, 0, 10, 0, order_id + 100, 0,
+                             0, 0, '', 0)
+
+    def test_refresh_copies_only_changes(self):
+        self.order_status(1, 'PreSubmitted')
+        self.app.error(-1, 2104, 'Market data farm connection is OK')
+        self.assertEqual(self.tables.refresh(), (1, 1))
+        self.order_status(1, 'Submitted')
+        self.order_status(2, 'PreSubmitted')
+        self.assertEqual(self.tables.refresh(), (3, 1))
+        data, _ = self.tables.store.page('order_status')
+        self.assertListEqual([(row['order_id'], row['status'])
+                              for row in data],
+                             [(1, 'Submitted'), (2, 'PreSubmitted')])
+        self.assertEqual(self.tables.store.count('error_messages'), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import numpy as np
+import pandas as pd
+from final_project import calculate_gain_loss, run_backtest
+from final_project.universe import all_pairs, negative_correlation_signals, \
+    panel_from_hist, panel_from_long, rolling_correlations, \
+    run_pair_backtest, run_universe_backtest
+from tests.helpers import make_data
+
+# Random-walk prices for a few symbols as a long frame.
+def make_long_data(symbols, days, seed=0):
+    random = np.random.default_rng(seed)
+    dates = pd.bdate_range('2010-01-04', periods=days)
+    frames = []
+    for symbol in symbols:
+        close = 50 * np.exp(np.cumsum(random.normal(0, 0.03, days)))
+        open_ = close * np.exp(random.normal(0, 0.01, days))
+        spread = np.abs(random.normal(0, 0.05, days))
+        frames.append(pd.DataFrame({
+            'Date': dates, 'Symbol': symbol, 'Open': open_,
+            'High': np.maximum(open_, close) * (1 + spread),
+            'Low': np.minimum(open_, close) * (1 - spread), 'Close': close,
+            'Volume': random.integers(1000, 100000, days)
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+class rolling_correlations_test_case(unittest.TestCase):
+
+    def test_same_as_pandas_rolling_corr(self):
+        panel = panel_from_long(make_long_data(list('ABCDE'), 200))
+        closes = panel['Close']
+        pairs = all_pairs(5)
+        for period in (3, 10):
+            correlations = rolling_correlations(closes.to_numpy(), period,
+                                                pairs)
+            for position, (i, j) in enumerate(pairs):
+                expected = closes.iloc[:, i].rolling(period) \
+                    .corr(closes.iloc[:, j]).to_numpy()
+                np.testing.assert_allclose(correlations[:, position],
+                                           expected, rtol=1e-9, atol=1e-9)
+
+    def test_blocks_cover_every_row(self):
+        closes = panel_from_long(make_long_data(list('ABC'), 50))['Close']
+        signals = negative_correlation_signals(closes.to_numpy(), 3,
+                                               all_pairs(3))
+        self.assertEqual(signals.shape, (3, 50))
+        self.assertFalse(signals[:, :2].any())
+
+class universe_backtest_test_case(unittest.TestCase):
+
+    def test_pair_backtest_matches_run_backtest(self):
+        hist = make_data(399)
+        panel = panel_from_hist(hist)
+        for parameters in ({}, {'include_risk_free': True, 'gain_cap': 0.01},
+                           {'period': 3, 'holding_period_cap': 2}):
+            pd.testing.assert_frame_equal(
+                run_pair_backtest(panel, 'AMZN', 'WMT',
+                                  interest_rate=hist['interest_rate'],
+                                  **parameters),
+                run_backtest(hist, **parameters)
+            )
+
+    def test_every_pair_is_backtested(self):
+        panel = panel_from_long(make_long_data(list('ABCD'), 300, seed=1))
+        finished = []
+        results = run_universe_backtest(panel, on_pair=finished.append)
+        self.assertEqual(len(results), 6)
+        self.assertEqual(len(finished), 6)
+        self.assertTrue(results['total_gain_loss'].is_monotonic_decreasing)
+
+        best = results.iloc[0]
+        blotter = run_pair_backtest(panel, best['symbol_a'],
+                                    best['symbol_b'])
+        self.assertEqual(best['entry_orders'],
+                         (blotter['Trip'] == 'ENTRY').sum())
+        self.assertAlmostEqual(
+            best['gain_loss_a'],
+            calculate_gain_loss(best['symbol_a'], blotter, []), places=6
+        )
+        self.assertAlmostEqual(
+            best['gain_loss_b'],
+            calculate_gain_loss(best['symbol_b'], blotter, []), places=6
+        )
+
+if __name__ == '__main__':
+    unittest.main()